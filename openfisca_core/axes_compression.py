@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+
+"""Calculate once, on the test case without axes, the variables which don't vary along the axes.
+
+A simulation with axes replicates its test case once per step. Only the variables depending on the inputs set by the
+axes vary from one step to another: the others are calculated on a traced simulation of the test case without axes,
+and their value is replicated for every step.
+
+Enable it with ``scenario.new_simulation(compress_axes = True)``. The dependencies of a variable are discovered by
+tracing its calculation, so formulas must only access other variables through the simulation or entity API (and not
+by reading holders directly).
+"""
+
+
+import threading
+
+import numpy as np
+
+
+class AxesCompression(object):
+    base_simulation = None  # Traced simulation of the test case without axes
+    steps_count = None
+    varying_variables_name = None  # Variables known to vary along the axes
+
+    def __init__(self, base_simulation, varying_variables_name, steps_count):
+        assert base_simulation.trace
+        self.base_simulation = base_simulation
+        self.steps_count = steps_count
+        self.varying_variables_name = set(varying_variables_name)
+        self._input_variables_name_by_variable_name = {}
+        self._invariant_variables_name = set()  # Variables known not to vary, given the dependencies traced so far
+        self._lock = threading.Lock()
+        # Input variables infos of the steps of the base simulation traceback already added to the map
+        self._input_variables_infos_by_traced_step = {}
+
+    def depends_on_varying_variables(self, variable_name):
+        """Tell whether a variable calculated in the base simulation depends on a varying variable.
+
+        Dependencies are collected by variable name, regardless of periods, so the answer errs on the side of varying.
+        """
+        self._update_dependencies()
+        if variable_name in self.varying_variables_name:
+            return True
+        if variable_name in self._invariant_variables_name:
+            return False
+        visited = set()
+        variables_name = [variable_name]
+        while variables_name:
+            dependency_name = variables_name.pop()
+            if dependency_name in self.varying_variables_name:
+                self.varying_variables_name.add(variable_name)
+                return True
+            if dependency_name in visited or dependency_name in self._invariant_variables_name:
+                continue
+            visited.add(dependency_name)
+            variables_name.extend(self._input_variables_name_by_variable_name.get(dependency_name, ()))
+        # No variable reachable from `variable_name` varies.
+        self._invariant_variables_name.update(visited)
+        return False
+
+    def get_invariant_array(self, variable_name, period):
+        """Return the value of a variable replicated for all the steps, or None when it varies along the axes."""
+        if variable_name in self.varying_variables_name:
+            return None
+        with self._lock:
+            # When the variable has already been traced, e.g. for another period, its known dependencies may be enough
+            # to tell that it varies, without calculating it on the base simulation.
+            self._update_dependencies()
+            if variable_name in self._input_variables_name_by_variable_name \
+                    and self.depends_on_varying_variables(variable_name):
+                return None
+            base_array = self.base_simulation.compute(variable_name, period).array
+            if self.depends_on_varying_variables(variable_name):
+                return None
+        return np.tile(base_array, self.steps_count)
+
+    def _update_dependencies(self):
+        """Add the steps traced in the base simulation since the last update to the dependency map.
+
+        New steps, and steps calculated again with other input variables, are at the end of the traceback (see
+        Formula.compute). So the traceback is read from its end, until a step which has already been read unchanged.
+        """
+        traceback = self.base_simulation.traceback
+        input_variables_infos_by_traced_step = self._input_variables_infos_by_traced_step
+        has_new_dependencies = False
+        for variable_infos in reversed(traceback):
+            input_variables_infos = traceback[variable_infos].get('input_variables_infos')
+            # The list of the input variables of a step is replaced when the step is calculated again.
+            if variable_infos in input_variables_infos_by_traced_step \
+                    and input_variables_infos_by_traced_step[variable_infos] is input_variables_infos:
+                break
+            input_variables_infos_by_traced_step[variable_infos] = input_variables_infos
+            step_variable_name = variable_infos[0]
+            input_variables_name = self._input_variables_name_by_variable_name.get(step_variable_name)
+            if input_variables_name is None:
+                input_variables_name = self._input_variables_name_by_variable_name[step_variable_name] = set()
+            for input_variable_name, _ in input_variables_infos or ():
+                if input_variable_name not in input_variables_name:
+                    input_variables_name.add(input_variable_name)
+                    has_new_dependencies = True
+        if has_new_dependencies:
+            # A variable known not to vary may now depend on a varying one, e.g. through a formula of another period.
+            self._invariant_variables_name.clear()
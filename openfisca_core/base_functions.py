@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import bisect
+
 import numpy as np
 
-from . import periods
 from periods import YEAR
 
 
@@ -63,26 +64,22 @@ def requested_period_default_value(formula, simulation, period, *extra_params):
 def requested_period_last_value(formula, simulation, period, *extra_params, **kwargs):
     # This formula is used for variables that are constants between events and period size independent.
     # It returns the latest known value for the requested period.
-
-    def compare_start_instant(x, y):
-        a = x[0]  # x = (period, array)
-        b = y[0]
-
-        return periods.compare_period_start(a, b)
-
     accept_future_value = kwargs.pop('accept_future_value', False)
     holder = formula.holder
-    if holder._array_by_period is not None:
-        known_values = sorted(holder._array_by_period.iteritems(), cmp = compare_start_instant, reverse = True)
-        for last_period, last_result in known_values:
-            if last_period.start <= period.start and (formula.function is None or last_period.stop >= period.stop):
-                if type(last_result) == np.ndarray and not extra_params:
+    array_by_period = holder._array_by_period
+    if array_by_period is not None:
+        known_periods_start, known_periods = holder._get_known_periods_index()
+        # Look backward from the last known period starting before the requested period.
+        for position in xrange(bisect.bisect_right(known_periods_start, period.start) - 1, -1, -1):
+            last_period = known_periods[position]
+            if formula.function is None or last_period.stop >= period.stop:
+                last_result = array_by_period[last_period]
+                if isinstance(last_result, np.ndarray) and not extra_params:
                     return last_result
                 elif last_result.get(extra_params):
                         return last_result.get(extra_params)
-        if accept_future_value:
-            next_period, next_array = known_values[-1]
-            return last_result
+        if accept_future_value and known_periods:
+            return array_by_period[known_periods[0]]
     if formula.function is not None:
         return formula.exec_function(simulation, period, *extra_params)
     array = holder.default_array()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+
+"""Instrumentation of the cache of a simulation, by variable.
+
+Enable it with ``Simulation(..., cache_statistics = True)``. When disabled (the default), the only overhead is a test
+of ``simulation.cache_statistics`` against None.
+"""
+
+
+import threading
+import time
+
+import numpy as np
+
+from .periods import ETERNITY
+
+
+EVENTS = ('hits', 'misses', 'computations', 'default_fallbacks')
+
+
+class CacheStatistics(object):
+    """Counters of the cache usage of a simulation, by variable.
+
+    - hits: the requested value was already known.
+    - misses: the requested value had to be calculated.
+    - computations: the formula of the variable has been called.
+    - default_fallbacks: the default value of the variable has been used, because it is neutralized or because the
+      requested period is outside of the date range of its formulas.
+
+    The time spent in the formulas of each variable is measured too, excluding the time spent calculating the variables
+    they depend on.
+    """
+    simulation = None
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self._lock = threading.Lock()
+        self._counters_by_variable_name = {}
+        self._last_access_by_variable_name = {}
+        self._computation_time_by_variable_name = {}
+        self._computations_stack = threading.local()  # Formulas being computed, for each thread
+
+    def record(self, variable_name, event):
+        with self._lock:
+            counters = self._counters_by_variable_name.get(variable_name)
+            if counters is None:
+                counters = self._counters_by_variable_name[variable_name] = dict.fromkeys(EVENTS, 0)
+            counters[event] += 1
+            self._last_access_by_variable_name[variable_name] = time.time()
+
+    def start_computation(self):
+        stack = getattr(self._computations_stack, 'frames', None)
+        if stack is None:
+            stack = self._computations_stack.frames = []
+        stack.append([time.time(), 0.])  # Start time, and time spent in the formulas called
+
+    def stop_computation(self, variable_name):
+        stack = self._computations_stack.frames
+        start_time, nested_time = stack.pop()
+        elapsed_time = time.time() - start_time
+        if stack:
+            stack[-1][1] += elapsed_time
+        with self._lock:
+            self._computation_time_by_variable_name[variable_name] = \
+                self._computation_time_by_variable_name.get(variable_name, 0.) + elapsed_time - nested_time
+
+    def get_nbytes_by_period(self, holder):
+        """Return the number of bytes held in memory by a holder, by period. Spilled arrays are not counted."""
+        if holder.column.definition_period == ETERNITY:
+            array = holder._array
+            return {ETERNITY: array.nbytes} if is_in_memory(array) else {}
+        nbytes_by_period = {}
+        for period, value in (holder._array_by_period or {}).iteritems():
+            arrays = value.values() if isinstance(value, dict) else [value]
+            nbytes = sum(array.nbytes for array in arrays if is_in_memory(array))
+            if nbytes:
+                nbytes_by_period[str(period)] = nbytes
+        return nbytes_by_period
+
+    def to_dict(self):
+        """Return the statistics as a dict {variable_name: statistics}, for every variable requested or in cache."""
+        with self._lock:
+            counters_by_variable_name = dict(
+                (variable_name, counters.copy())
+                for variable_name, counters in self._counters_by_variable_name.iteritems()
+                )
+            last_access_by_variable_name = self._last_access_by_variable_name.copy()
+            computation_time_by_variable_name = self._computation_time_by_variable_name.copy()
+        holder_by_name = self.simulation.holder_by_name
+        statistics_by_variable_name = {}
+        for variable_name in set(counters_by_variable_name).union(holder_by_name):
+            statistics = counters_by_variable_name.get(variable_name) or dict.fromkeys(EVENTS, 0)
+            holder = holder_by_name.get(variable_name)
+            statistics['nbytes_by_period'] = self.get_nbytes_by_period(holder) if holder is not None else {}
+            statistics['nbytes'] = sum(statistics['nbytes_by_period'].itervalues())
+            statistics['last_access'] = last_access_by_variable_name.get(variable_name)
+            statistics['computation_time'] = computation_time_by_variable_name.get(variable_name, 0.)
+            statistics_by_variable_name[variable_name] = statistics
+        return statistics_by_variable_name
+
+    def to_table(self):
+        """Return the statistics as a text table, variables holding the most memory first."""
+        statistics_by_variable_name = self.to_dict()
+        header = (u'Variable', u'Hits', u'Misses', u'Computations', u'Defaults', u'Bytes', u'Last access')
+        rows = [
+            (
+                variable_name,
+                unicode(statistics['hits']),
+                unicode(statistics['misses']),
+                unicode(statistics['computations']),
+                unicode(statistics['default_fallbacks']),
+                unicode(statistics['nbytes']),
+                time.strftime('%H:%M:%S', time.localtime(statistics['last_access']))
+                if statistics['last_access'] is not None else u'-',
+                )
+            for variable_name, statistics in sorted(
+                statistics_by_variable_name.iteritems(),
+                key = lambda (variable_name, statistics): (-statistics['nbytes'], variable_name),
+                )
+            ]
+        widths = [
+            max(len(row[column_index]) for row in [header] + rows)
+            for column_index in range(len(header))
+            ]
+        return u'\n'.join(
+            u'  '.join(
+                cell.ljust(width) if column_index == 0 else cell.rjust(width)
+                for column_index, (cell, width) in enumerate(zip(row, widths))
+                )
+            for row in [header] + rows
+            )
+
+
+def is_in_memory(array):
+    return isinstance(array, np.ndarray) and not isinstance(array, np.memmap)
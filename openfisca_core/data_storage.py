@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+
+
+"""Store the arrays of simulations outside of the memory of the Python process.
+
+Publishing the inputs of a simulation into a directory allows several processes (for instance `multiprocessing`
+workers) to attach to the same arrays without copying them: each array is saved as a ``.npy`` file and memory-mapped
+by the attached simulations. Use a directory located on a memory-backed file system (such as ``/dev/shm`` on Linux)
+to avoid any disk I/O.
+
+The values calculated by a simulation can also be saved with :any:`save_simulation_cache`, and reloaded by a later run
+of the same tax and benefit system on the same population with :any:`load_simulation_cache`.
+
+A :any:`MemoryConfig` given to a simulation spills the arrays of old periods to memory-mapped files, to keep long
+projections within a memory budget.
+"""
+
+
+import atexit
+import bisect
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from . import periods
+from .periods import ETERNITY
+
+
+MANIFEST_FILE_NAME = 'manifest.json'
+CACHE_INDEX_KEY = 'index'
+
+
+def publish_simulation(simulation, directory):
+    """Write the values known by a simulation and the composition of its entities into `directory`.
+
+    Only the values already in the simulation cache are published: call this function right after the simulation has
+    been filled with its inputs to share them.
+
+    :returns: A :any:`SharedSimulationData` attached to `directory`.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    def save_array(file_name, array):
+        np.save(os.path.join(directory, file_name), np.asarray(array))
+        return file_name
+
+    entities_json = {}
+    for entity in simulation.entities.itervalues():
+        entity_json = entities_json[entity.key] = dict(
+            arrays = {},
+            count = entity.count,
+            step_size = entity.step_size,
+            )
+        if entity.is_person:
+            continue
+        entity_json['roles_count'] = getattr(entity, 'roles_count', None)
+        if entity.members_entity_id is not None:
+            entity_json['arrays']['members_entity_id'] = save_array(
+                u'{}.members_entity_id.npy'.format(entity.key), entity.members_entity_id)
+        if entity.members_legacy_role is not None:
+            entity_json['arrays']['members_legacy_role'] = save_array(
+                u'{}.members_legacy_role.npy'.format(entity.key), entity.members_legacy_role)
+        if entity._members_role is not None:
+            # Roles are Python objects: they are shared as their index in the flattened roles of the entity.
+            role_index_by_key = dict(
+                (role.key, role_index)
+                for role_index, role in enumerate(entity.flattened_roles)
+                )
+            members_role_index = np.fromiter(
+                (role_index_by_key[role.key] for role in entity._members_role),
+                dtype = np.int16,
+                count = len(entity._members_role),
+                )
+            entity_json['arrays']['members_role_index'] = save_array(
+                u'{}.members_role_index.npy'.format(entity.key), members_role_index)
+
+    variables_json = {}
+    for variable_name, holder in sorted(simulation.holder_by_name.iteritems()):
+        if holder.column.definition_period == ETERNITY:
+            if holder._array is not None:
+                variables_json[variable_name] = {
+                    ETERNITY: save_array(u'{}.npy'.format(variable_name), holder._array),
+                    }
+            continue
+        if not holder._array_by_period:
+            continue
+        file_name_by_period = {}
+        for period_index, (period, array) in enumerate(sorted(holder._array_by_period.iteritems())):
+            if not isinstance(array, np.ndarray):
+                continue  # Values calculated with extra parameters are not shared.
+            file_name_by_period[str(period)] = save_array(u'{}.{}.npy'.format(variable_name, period_index), array)
+        if file_name_by_period:
+            variables_json[variable_name] = file_name_by_period
+
+    manifest = dict(
+        entities = entities_json,
+        period = str(simulation.period),
+        steps_count = simulation.steps_count,
+        variables = variables_json,
+        )
+    # The manifest is written last, so that a directory containing a manifest is always complete.
+    with open(os.path.join(directory, MANIFEST_FILE_NAME), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent = 2, sort_keys = True)
+
+    return SharedSimulationData(directory)
+
+
+class SharedSimulationData(object):
+    """The arrays published by :any:`publish_simulation`, to which new simulations can be attached.
+
+    Attached simulations read the arrays through read-only memory maps: they are not copied in the memory of each
+    process, and formulas cannot modify them. Arrays of Python objects can't be memory-mapped, and are loaded in
+    memory.
+    """
+    directory = None
+    manifest = None
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE_NAME)) as manifest_file:
+            self.manifest = json.load(manifest_file)
+
+    @property
+    def period(self):
+        return periods.period(self.manifest['period'])
+
+    @property
+    def variables_name(self):
+        return set(self.manifest['variables'])
+
+    def load_array(self, file_name):
+        path = os.path.join(self.directory, file_name)
+        try:
+            return np.load(path, mmap_mode = 'r')
+        except ValueError:
+            # Arrays of objects, e.g. of StrCol variables, can't be memory-mapped. They are pickled, which NumPy
+            # refuses to load by default since version 1.16.3. These files have been written by publish_simulation.
+            return np.load(path, allow_pickle = True)
+
+    def attach_entity(self, entity):
+        entity_json = self.manifest['entities'].get(entity.key)
+        if entity_json is None:
+            return
+        entity.count = entity_json['count']
+        entity.step_size = entity_json['step_size']
+        if entity.is_person:
+            return
+        if entity_json.get('roles_count') is not None:
+            entity.roles_count = entity_json['roles_count']
+        arrays = entity_json['arrays']
+        if 'members_entity_id' in arrays:
+            entity.members_entity_id = self.load_array(arrays['members_entity_id'])
+        if 'members_legacy_role' in arrays:
+            entity.members_legacy_role = self.load_array(arrays['members_legacy_role'])
+        if 'members_role_index' in arrays:
+            flattened_roles = np.empty(len(entity.flattened_roles), dtype = object)
+            flattened_roles[:] = entity.flattened_roles
+            entity.members_role = flattened_roles[self.load_array(arrays['members_role_index'])]
+
+    def attach_holder(self, holder):
+        file_name_by_period = self.manifest['variables'].get(holder.column.name)
+        if file_name_by_period is None:
+            return
+        if holder.column.definition_period == ETERNITY:
+            holder._array = self.load_array(file_name_by_period[ETERNITY])
+            return
+        holder._array_by_period = dict(
+            (periods.period(period_str), self.load_array(file_name))
+            for period_str, file_name in file_name_by_period.iteritems()
+            )
+
+    def new_simulation(self, tax_benefit_system, **kwargs):
+        """Create a simulation attached to the shared arrays.
+
+        Keyword arguments are forwarded to the :any:`Simulation` constructor.
+        """
+        from .simulations import Simulation
+        simulation = Simulation(
+            period = self.period,
+            tax_benefit_system = tax_benefit_system,
+            shared_data = self,
+            **kwargs
+            )
+        simulation.steps_count = self.manifest['steps_count']
+        return simulation
+
+
+def save_simulation_cache(simulation, path):
+    """Save all the values known by a simulation into the ``.npz`` file `path`.
+
+    The file is keyed by the fingerprint of the tax and benefit system of the simulation, see
+    :any:`load_simulation_cache`.
+    """
+    arrays = {}
+    values_json = []
+
+    def add_value(variable_name, period, extra_params, array):
+        key = u'value_{}'.format(len(values_json))
+        arrays[key] = array
+        values_json.append(dict(
+            calculated = simulation.get_holder(variable_name).is_calculated(period),
+            extra_params = extra_params,
+            key = key,
+            period = str(period) if period is not None else None,
+            variable = variable_name,
+            ))
+
+    for variable_name, holder in sorted(simulation.holder_by_name.iteritems()):
+        if holder.column.definition_period == ETERNITY:
+            if holder._array is not None:
+                add_value(variable_name, None, None, holder._array)
+            continue
+        for period, value in sorted((holder._array_by_period or {}).iteritems()):
+            if not isinstance(value, dict):
+                add_value(variable_name, period, None, value)
+                continue
+            for extra_params, array in sorted(value.iteritems()):
+                try:
+                    json.dumps(extra_params)
+                except TypeError:
+                    continue  # Values calculated with extra parameters that can't be serialized are not saved.
+                add_value(variable_name, period, list(extra_params), array)
+
+    index = dict(
+        entities_count = dict(
+            (entity.key, entity.count)
+            for entity in simulation.entities.itervalues()
+            ),
+        fingerprint = simulation.tax_benefit_system.get_fingerprint(),
+        values = values_json,
+        )
+    arrays[CACHE_INDEX_KEY] = np.array(json.dumps(index, sort_keys = True))
+    with open(path, 'wb') as cache_file:
+        np.savez(cache_file, **arrays)
+
+
+def load_simulation_cache(simulation, path):
+    """Put the values saved by :any:`save_simulation_cache` into the cache of a simulation.
+
+    Raise a ``ValueError`` when the values have been saved for another tax and benefit system (e.g. with other
+    formulas or other legislation parameters) or for a population of another size. See
+    :any:`TaxBenefitSystem.get_fingerprint` for the changes of formulas which are detected.
+
+    Arrays of objects, e.g. of StrCol variables, are stored as pickles, which can execute arbitrary code when they are
+    loaded: only load cache files you trust, such as those saved by your own runs.
+    """
+    with np.load(path, allow_pickle = True) as cache_file:
+        index = json.loads(cache_file[CACHE_INDEX_KEY].item())
+        if index['fingerprint'] != simulation.tax_benefit_system.get_fingerprint():
+            raise ValueError(u'The cache {} has been saved for another tax and benefit system.'.format(path)
+                .encode('utf-8'))
+        for entity in simulation.entities.itervalues():
+            if index['entities_count'].get(entity.key) != entity.count:
+                raise ValueError(u'The cache {} has been saved for another population: {} count differs.'.format(
+                    path, entity.key).encode('utf-8'))
+        for value_json in index['values']:
+            holder = simulation.get_or_new_holder(value_json['variable'])
+            period = periods.period(value_json['period']) if value_json['period'] is not None else None
+            holder.put_in_cache(cache_file[value_json['key']], period, value_json['extra_params'],
+                calculated = value_json.get('calculated', False))
+
+
+class MemoryConfig(object):
+    """Policy deciding which arrays of a simulation are kept in memory, and which are spilled to disk.
+
+    Spilled arrays are written in a scratch directory, and replaced in the holders cache by read-only memory maps of
+    these files. This is transparent for formulas and holders, as memory maps are NumPy arrays.
+
+    :param int max_periods_in_memory: For each variable, number of most recent periods (by start instant) kept in
+        memory.
+    :param int max_memory_occupation: Maximum number of bytes of the arrays kept in memory for the whole simulation.
+        When exceeded, the arrays of the oldest periods are spilled first.
+    :param pinned_variables: Names of the variables which are always kept in memory.
+    :param str scratch_directory: Directory where arrays are spilled. By default, a temporary directory is created
+        when the first array is spilled, and removed when the Python process exits.
+
+    Arrays of variables defined for ETERNITY are never spilled.
+
+    A clone of a simulation gets its own accounting (see :any:`clone`): its budget is not shared with the original
+    simulation, and doesn't include the arrays it inherits from it.
+    """
+    max_memory_occupation = None
+    max_periods_in_memory = None
+    memory_occupation = 0  # Number of bytes of the arrays registered and kept in memory
+    pinned_variables = None
+    scratch_directory = None
+
+    def __init__(self, max_periods_in_memory = None, max_memory_occupation = None, pinned_variables = None,
+            scratch_directory = None):
+        assert max_periods_in_memory is None or max_periods_in_memory >= 1, max_periods_in_memory
+        self.max_periods_in_memory = max_periods_in_memory
+        self.max_memory_occupation = max_memory_occupation
+        self.pinned_variables = set(pinned_variables or [])
+        self.scratch_directory = scratch_directory
+        self._lock = threading.Lock()
+        self._nbytes_by_key = {}  # {(holder, period, extra_params): nbytes} for the arrays kept in memory
+        self._keys_by_holder = {}
+        # Couple (starts, keys) of the keys of _nbytes_by_key, sorted by period start, to spill the oldest ones first
+        self._keys_index = ([], [])
+        # Couple (starts, periods) of the periods kept in memory of each holder, sorted by start
+        self._periods_index_by_holder = {}
+        self._keys_count_by_holder_period = {}
+
+    def clone(self):
+        """Return a policy with the same settings, and an empty accounting, for a clone of the simulation.
+
+        The clone spills its arrays in the same scratch directory.
+        """
+        return MemoryConfig(
+            max_periods_in_memory = self.max_periods_in_memory,
+            max_memory_occupation = self.max_memory_occupation,
+            pinned_variables = self.pinned_variables,
+            scratch_directory = self.scratch_directory,
+            )
+
+    def pin(self, variable_name):
+        """Always keep the arrays of a variable in memory, from now on."""
+        self.pinned_variables.add(variable_name)
+
+    def delete_scratch_directory(self):
+        """Remove the files of the spilled arrays. The simulation and its clones can't be used anymore afterwards."""
+        if self.scratch_directory is not None and os.path.isdir(self.scratch_directory):
+            shutil.rmtree(self.scratch_directory)
+
+    def forget(self, holder):
+        """Stop tracking the arrays of a holder, for instance because they have been deleted."""
+        with self._lock:
+            for key in list(self._keys_by_holder.get(holder, ())):
+                self._remove(key)
+            self._keys_by_holder.pop(holder, None)
+
+    def register(self, holder, period, extra_params = None):
+        """Track an array that has just been put in the cache of a holder, and spill cold arrays if needed."""
+        if holder.column.definition_period == ETERNITY:
+            return
+        value = get_cached_value(holder, period, extra_params)
+        if not isinstance(value, np.ndarray):
+            return
+        key = (holder, period, extra_params)
+        with self._lock:
+            self._remove(key)
+            if isinstance(value, np.memmap) or value.dtype == object:
+                # Value is already on disk, or can't be memory-mapped.
+                return
+            self._add(key, value.nbytes)
+
+            if holder.column.name in self.pinned_variables:
+                return
+            if self.max_periods_in_memory is not None:
+                holder_periods = self._periods_index_by_holder[holder][1]
+                if len(holder_periods) > self.max_periods_in_memory:
+                    cold_periods = set(holder_periods[:-self.max_periods_in_memory])
+                    for cold_key in [holder_key for holder_key in self._keys_by_holder[holder]
+                            if holder_key[1] in cold_periods]:
+                        self._spill(cold_key)
+            if self.max_memory_occupation is not None and self.memory_occupation > self.max_memory_occupation:
+                for candidate_key in list(self._keys_index[1]):
+                    if self.memory_occupation <= self.max_memory_occupation:
+                        break
+                    if candidate_key != key and candidate_key[0].column.name not in self.pinned_variables:
+                        self._spill(candidate_key)
+
+    def _add(self, key, nbytes):
+        holder, period, _ = key
+        self._nbytes_by_key[key] = nbytes
+        self._keys_by_holder.setdefault(holder, set()).add(key)
+        self.memory_occupation += nbytes
+        starts, keys = self._keys_index
+        position = bisect.bisect_right(starts, period.start)
+        starts.insert(position, period.start)
+        keys.insert(position, key)
+        holder_period = (holder, period)
+        keys_count = self._keys_count_by_holder_period.get(holder_period, 0)
+        self._keys_count_by_holder_period[holder_period] = keys_count + 1
+        if keys_count == 0:
+            starts, holder_periods = self._periods_index_by_holder.setdefault(holder, ([], []))
+            position = bisect.bisect_right(starts, period.start)
+            starts.insert(position, period.start)
+            holder_periods.insert(position, period)
+
+    def _remove(self, key):
+        nbytes = self._nbytes_by_key.pop(key, None)
+        if nbytes is None:
+            return
+        holder, period, _ = key
+        self._keys_by_holder[holder].discard(key)
+        self.memory_occupation -= nbytes
+        starts, keys = self._keys_index
+        position = bisect.bisect_left(starts, period.start)
+        while keys[position] != key:
+            position += 1
+        del starts[position]
+        del keys[position]
+        holder_period = (holder, period)
+        keys_count = self._keys_count_by_holder_period.pop(holder_period) - 1
+        if keys_count > 0:
+            self._keys_count_by_holder_period[holder_period] = keys_count
+        else:
+            starts, holder_periods = self._periods_index_by_holder[holder]
+            position = bisect.bisect_left(starts, period.start)
+            while holder_periods[position] != period:
+                position += 1
+            del starts[position]
+            del holder_periods[position]
+
+    def _spill(self, key):
+        holder, period, extra_params = key
+        value = get_cached_value(holder, period, extra_params)
+        if self.scratch_directory is None:
+            self.scratch_directory = tempfile.mkdtemp(prefix = 'openfisca-')
+            atexit.register(shutil.rmtree, self.scratch_directory, True)
+        elif not os.path.isdir(self.scratch_directory):
+            os.makedirs(self.scratch_directory)
+        # The file name is unique, as the scratch directory may be shared by the clones of the simulation.
+        file_descriptor, path = tempfile.mkstemp(prefix = u'{}.'.format(holder.column.name), suffix = '.npy',
+            dir = self.scratch_directory)
+        with os.fdopen(file_descriptor, 'wb') as array_file:
+            np.save(array_file, value)
+        memory_map = np.load(path, mmap_mode = 'r')
+        if extra_params is None:
+            holder._array_by_period[period] = memory_map
+        else:
+            holder._array_by_period[period][extra_params] = memory_map
+        self._remove(key)
+
+
+def get_cached_value(holder, period, extra_params = None):
+    value = holder._array_by_period.get(period) if holder._array_by_period is not None else None
+    if extra_params is not None and isinstance(value, dict):
+        return value.get(extra_params)
+    return value
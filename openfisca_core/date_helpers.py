@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+
+"""Helpers to write formulas handling arrays of dates, e.g. birth dates.
+
+They are the vectorial counterpart of :mod:`openfisca_core.periods`: they work on ``datetime64`` arrays, so that the
+arithmetic stays in NumPy instead of iterating over ``datetime.date`` objects.
+"""
+
+
+import datetime
+
+import numpy as np
+
+from . import periods
+from .periods import MONTH, YEAR
+
+
+def to_datetime64(value):
+    """Convert a date, an instant, a period (its start), or an array of dates to ``datetime64[D]``.
+
+    >>> to_datetime64(periods.period(u'2015-03'))
+    numpy.datetime64('2015-03-01')
+    >>> to_datetime64(np.array(['2015-03-14'], dtype = 'datetime64[D]'))
+    array(['2015-03-14'], dtype='datetime64[D]')
+    """
+    if isinstance(value, periods.Period):
+        value = value.start
+    if isinstance(value, periods.Instant):
+        value = value.date
+    if isinstance(value, datetime.date):
+        return np.datetime64(value, 'D')
+    return np.asarray(value, dtype = 'datetime64[D]')
+
+
+def period_start(dates, unit):
+    """Return the first day of the month or year containing each date.
+
+    >>> period_start(np.array(['2015-03-14'], dtype = 'datetime64[D]'), MONTH)
+    array(['2015-03-01'], dtype='datetime64[D]')
+    >>> period_start(np.array(['2015-03-14'], dtype = 'datetime64[D]'), YEAR)
+    array(['2015-01-01'], dtype='datetime64[D]')
+    """
+    return to_datetime64(dates).astype(get_datetime64_unit(unit)).astype('datetime64[D]')
+
+
+def period_stop(dates, unit):
+    """Return the last day of the month or year containing each date.
+
+    >>> period_stop(np.array(['2016-02-14'], dtype = 'datetime64[D]'), MONTH)
+    array(['2016-02-29'], dtype='datetime64[D]')
+    >>> period_stop(np.array(['2015-03-14'], dtype = 'datetime64[D]'), YEAR)
+    array(['2015-12-31'], dtype='datetime64[D]')
+    """
+    return (to_datetime64(dates).astype(get_datetime64_unit(unit)) + 1).astype('datetime64[D]') - 1
+
+
+def months_between(start, stop):
+    """Return the number of whole months elapsed from the start dates to the stop dates.
+
+    >>> months_between(np.array(['2015-01-31', '2015-01-31'], dtype = 'datetime64[D]'), np.datetime64('2015-03-30'))
+    array([1, 1])
+    >>> months_between(np.array(['2014-03-14', '2014-03-15'], dtype = 'datetime64[D]'), np.datetime64('2015-03-14'))
+    array([12, 11])
+    """
+    start = to_datetime64(start)
+    stop = to_datetime64(stop)
+    start_month = start.astype('datetime64[M]')
+    stop_month = stop.astype('datetime64[M]')
+    months = (stop_month - start_month).astype(int)
+    # The last month is not complete when its day is before the day of the start date.
+    return months - ((stop - stop_month.astype('datetime64[D]')) < (start - start_month.astype('datetime64[D]')))
+
+
+def years_between(start, stop):
+    """Return the number of whole years elapsed from the start dates to the stop dates.
+
+    >>> years_between(np.array(['2000-03-14', '2000-03-15'], dtype = 'datetime64[D]'), np.datetime64('2015-03-14'))
+    array([15, 14])
+    """
+    return months_between(start, stop) // 12
+
+
+def age_in_months(birth, instant):
+    """Return the age in whole months at an instant, e.g. the start of a period, from an array of birth dates.
+
+    >>> age_in_months(np.array(['2014-03-15'], dtype = 'datetime64[D]'), periods.period(u'2015-03'))
+    array([11])
+    """
+    return months_between(birth, instant)
+
+
+def age_in_years(birth, instant):
+    """Return the age in whole years at an instant, e.g. the start of a period, from an array of birth dates.
+
+    >>> age_in_years(np.array(['1980-03-01', '1980-03-02'], dtype = 'datetime64[D]'), periods.period(u'2015-03'))
+    array([35, 34])
+    """
+    return years_between(birth, instant)
+
+
+def get_datetime64_unit(unit):
+    assert unit in (MONTH, YEAR), 'Invalid unit: {} of type {}'.format(unit, type(unit))
+    return 'datetime64[M]' if unit == MONTH else 'datetime64[Y]'
@@ -5,6 +5,7 @@ import warnings
 
 import numpy as np
 
+from commons import empty_clone
 from formulas import ADD, DIVIDE
 
 
@@ -25,6 +26,13 @@ class Entity(object):
             raise Exception("Entity {} has no attribute {}".format(self.key, attribute))
         return projector
 
+    def clone(self, new_simulation):
+        """Copy the entity for a clone of its simulation. The composition arrays are shared, as they are not modified."""
+        new = empty_clone(self)
+        new.__dict__.update(self.__dict__)
+        new.simulation = new_simulation
+        return new
+
     @classmethod
     def to_json(cls):
         return {
@@ -130,9 +138,29 @@ class GroupEntity(Entity):
         self.members_entity_id = None
         self._members_role = None
         self._members_position = None
+        self._members_by_legacy_roles_cache = None
         self.members_legacy_role = None
         self.members = self.simulation.persons
 
+    def clone(self, new_simulation):
+        new = Entity.clone(self, new_simulation)
+        new.members = new_simulation.persons
+        return new
+
+    def get_members_by_legacy_roles(self, roles):
+        """Return the indices of the persons having one of the given legacy roles, in increasing order.
+
+        The indices are cached by roles, until members_legacy_role is replaced.
+        """
+        cache = self._members_by_legacy_roles_cache
+        if cache is None or cache[0] is not self.members_legacy_role:
+            self._members_by_legacy_roles_cache = cache = (self.members_legacy_role, {})
+        roles = tuple(roles)
+        members = cache[1].get(roles)
+        if members is None:
+            members = cache[1][roles] = np.flatnonzero(np.in1d(self.members_legacy_role, roles))
+        return members
+
     @property
     def members_role(self):
         if self._members_role is None and self.members_legacy_role is not None:
@@ -7,6 +7,10 @@
 import numpy as np
 
 
+# Above this span of keys, switch looks the conditions up by bisection in the sorted keys instead of a dense table.
+SWITCH_DENSE_TABLE_MAX_SIZE = 2 ** 16
+
+
 def apply_thresholds(input, thresholds, choices):
     """
     Return one of the choices depending on the input position compared to thresholds, for each input.
@@ -22,12 +26,18 @@ def apply_thresholds(input, thresholds, choices):
     >>> apply_thresholds(np.array([10]), [5, 7, 9], [10, 15, 20])
     array([0])
     """
+    condlist_length = len(thresholds) + 1 if len(thresholds) == len(choices) - 1 else len(thresholds)
+    assert condlist_length == len(choices), \
+        "apply_thresholds must be called with the same number of thresholds than choices, or one more choice"
+    if is_sorted_scalars(thresholds) and all(np.ndim(choice) == 0 for choice in choices):
+        # Find the position of each input among the thresholds by bisection, and look up the choice in a table whose
+        # last item is the default value of np.select.
+        table = get_choices_table(choices)
+        return table[np.searchsorted(thresholds, input, side = 'left')]
     condlist = [input <= threshold for threshold in thresholds]
     if len(condlist) == len(choices) - 1:
         # If a choice is provided for input > highest threshold, last condition must be true to return it.
         condlist += [True]
-    assert len(condlist) == len(choices), \
-        "apply_thresholds must be called with the same number of thresholds than choices, or one more choice"
     return np.select(condlist, choices)
 
 
@@ -40,8 +50,41 @@ def switch(conditions, value_by_condition):
         >>> switch(np.array([1, 1, 1, 2]), {1: 80, 2: 90})
         array([80, 80, 80, 90])
     '''
+    conditions = np.asarray(conditions)
+    keys = value_by_condition.keys()
+    values = value_by_condition.values()
+    if keys and (conditions.dtype.kind in 'biu') and all(
+            isinstance(key, (int, long, np.integer)) and np.ndim(value) == 0
+            for key, value in value_by_condition.iteritems()
+            ):
+        table = get_choices_table(values)  # Its last item is the default value, for unknown conditions.
+        min_key = min(keys)
+        span = max(keys) - min_key
+        if span < SWITCH_DENSE_TABLE_MAX_SIZE:
+            # Dense lookup table indexed by condition, with the default value on both sides for out of range conditions.
+            dense_table = np.full(span + 3, table[-1], dtype = table.dtype)
+            dense_table[np.asarray(keys, dtype = np.int64) - min_key + 1] = table[:-1]
+            return dense_table.take(conditions.astype(np.int64) - (min_key - 1), mode = 'clip')
+        keys_order = np.argsort(keys)
+        sorted_keys = np.asarray(keys, dtype = np.int64)[keys_order]
+        indices = np.searchsorted(sorted_keys, conditions).clip(0, len(keys) - 1)
+        indices = np.where(sorted_keys[indices] == conditions, keys_order[indices], len(keys))
+        return table[indices]
     condlist = [
         conditions == condition
-        for condition in value_by_condition.keys()
+        for condition in keys
         ]
-    return np.select(condlist, value_by_condition.values())
+    return np.select(condlist, values)
+
+
+def get_choices_table(choices):
+    """Return the choices of np.select, followed by its default value, in an array of the dtype returned by np.select."""
+    choices = [np.asarray(choice) for choice in choices] + [np.asarray(0)]
+    return np.array(choices, dtype = np.result_type(*choices))
+
+
+def is_sorted_scalars(values):
+    if not all(np.ndim(value) == 0 for value in values):
+        return False
+    values = np.asarray(values)
+    return values.dtype.kind in 'biuf' and bool(np.all(values[1:] >= values[:-1]))
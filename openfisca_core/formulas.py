@@ -3,6 +3,7 @@
 
 from __future__ import division
 
+import bisect
 import collections
 import datetime
 import inspect
@@ -108,6 +109,7 @@ class DatedFormula(AbstractGroupedFormula):
     base_function = None  # Class attribute. Overridden by subclasses
     dated_formulas = None  # A list of dictionaries containing a formula jointly with start and stop instants
     dated_formulas_class = None  # Class attribute
+    dated_formula_index_by_start_instant = None  # Memoized results of find_dated_formula_index
 
     def __init__(self, holder = None):
         super(DatedFormula, self).__init__(holder = holder)
@@ -121,16 +123,34 @@ class DatedFormula(AbstractGroupedFormula):
             for dated_formula_class in self.dated_formulas_class
             ]
         assert self.dated_formulas
+        self.dated_formula_index_by_start_instant = {}
+
+    @classmethod
+    def find_dated_formula_index(cls, instant):
+        """Return the index in dated_formulas_class of the formula defined at `instant`, or None."""
+        # Dated formulas are sorted by start instant and don't overlap: the only candidate is the last formula starting
+        # before instant.
+        starts_and_stops = cls.__dict__.get('_starts_and_stops')
+        if starts_and_stops is None:
+            cls._starts_and_stops = starts_and_stops = (
+                [dated_formula_class['start_instant'] for dated_formula_class in cls.dated_formulas_class],
+                [dated_formula_class['stop_instant'] for dated_formula_class in cls.dated_formulas_class],
+                )
+        starts, stops = starts_and_stops
+        index = bisect.bisect_right(starts, instant) - 1
+        if index < 0:
+            return None
+        stop_instant = stops[index]
+        if stop_instant is not None and stop_instant < instant:
+            return None
+        return index
 
     @classmethod
     def at_instant(cls, instant, default = UnboundLocalError):
         assert isinstance(instant, periods.Instant)
-        for dated_formula_class in cls.dated_formulas_class:
-            start_instant = dated_formula_class['start_instant']
-            stop_instant = dated_formula_class['stop_instant']
-            if (start_instant is None or start_instant <= instant) and (
-                    stop_instant is None or instant <= stop_instant):
-                return dated_formula_class['formula_class']
+        index = cls.find_dated_formula_index(instant)
+        if index is not None:
+            return cls.dated_formulas_class[index]['formula_class']
         if default is UnboundLocalError:
             raise KeyError(instant)
         return default
@@ -140,6 +160,7 @@ class DatedFormula(AbstractGroupedFormula):
         if keys_to_skip is None:
             keys_to_skip = set()
         keys_to_skip.add('dated_formulas')
+        keys_to_skip.add('dated_formula_index_by_start_instant')
         new = super(DatedFormula, self).clone(holder, keys_to_skip = keys_to_skip)
 
         new.dated_formulas = [
@@ -149,21 +170,27 @@ class DatedFormula(AbstractGroupedFormula):
                 }
             for dated_formula in self.dated_formulas
             ]
+        new.dated_formula_index_by_start_instant = self.dated_formula_index_by_start_instant.copy()
 
         return new
 
     def compute(self, period, **parameters):
         # We compute using the formula matching the first day of the requested period, if there is one
-        for dated_formula in self.dated_formulas:
-            if period.start < dated_formula['start_instant']:
-                # The requested period is before the definition span of the first dated formula.
-                # As these are sorted, no dated formula will match. We can thus break the loop.
-                return self.holder.put_in_cache(self.holder.default_array(), period, parameters.get('extra_params'))
-            if dated_formula['stop_instant'] is None or period.start <= dated_formula['stop_instant']:
-                self.used_formula = dated_formula['formula']
-                return dated_formula['formula'].compute(period, **parameters)
+        start_instant = period.start
+        try:
+            index = self.dated_formula_index_by_start_instant[start_instant]
+        except KeyError:
+            index = self.dated_formula_index_by_start_instant[start_instant] = self.find_dated_formula_index(
+                start_instant)
+        if index is not None:
+            dated_formula = self.dated_formulas[index]
+            self.used_formula = dated_formula['formula']
+            return dated_formula['formula'].compute(period, **parameters)
 
-        return self.holder.put_in_cache(self.holder.default_array(), period, parameters.get('extra_params'))
+        holder = self.holder
+        if holder.simulation.cache_statistics is not None:
+            holder.simulation.cache_statistics.record(holder.column.name, 'default_fallbacks')
+        return holder.put_in_cache(holder.default_array(), period, parameters.get('extra_params'), calculated = True)
 
     def graph_parameters(self, edges, get_input_variables_and_parameters, nodes, visited):
         """Recursively build a graph of formulas."""
@@ -213,15 +240,13 @@ class SimpleFormula(AbstractFormula):
             persons_count = persons.count
             assert array.size == persons_count, u"Expected an array of size {}. Got: {}".format(persons_count,
                 array.size)
-        entity_index_array = simulation.get_entity(entity).members_entity_id
+        group_entity = simulation.get_entity(entity)
 
         if roles is None:
             roles = range(entity.roles_count)
+        members = group_entity.get_members_by_legacy_roles(roles)
         target_array = self.zeros(dtype = np.bool)
-        for role in roles:
-            # TODO Mettre les filtres en cache dans la simulation
-            boolean_filter = simulation.get_entity(entity).members_legacy_role == role
-            target_array[entity_index_array[boolean_filter]] += array[boolean_filter]
+        target_array[group_entity.members_entity_id[members[array[members] != 0]]] = True
         return target_array
 
     def cast_from_entity_to_role(self, array_or_dated_holder, default = None, entity = None, role = None):
@@ -264,18 +289,17 @@ class SimpleFormula(AbstractFormula):
         persons_count = persons.count
         target_array = np.empty(persons_count, dtype = array.dtype)
         target_array.fill(default)
-        entity_index_array = simulation.get_entity(entity).members_entity_id
+        group_entity = simulation.get_entity(entity)
 
         if roles is None:
             roles = range(entity.roles_count)
-        for role in roles:
-            boolean_filter = simulation.get_entity(entity).members_legacy_role == role
-            try:
-                target_array[boolean_filter] = array[entity_index_array[boolean_filter]]
-            except:
-                log.error(u'An error occurred while transforming array for role {}[{}] in function {}'.format(
-                    entity.key, role, holder.column.name))
-                raise
+        members = group_entity.get_members_by_legacy_roles(roles)
+        try:
+            target_array[members] = array[group_entity.members_entity_id[members]]
+        except:
+            log.error(u'An error occurred while transforming array for roles {}{} in function {}'.format(
+                entity.key, list(roles), holder.column.name))
+            raise
         return target_array
 
     def check_for_cycle(self, period):
@@ -343,6 +367,7 @@ class SimpleFormula(AbstractFormula):
         debug = simulation.debug
         debug_all = simulation.debug_all
         trace = simulation.trace
+        cache_statistics = simulation.cache_statistics
 
         assert (period is not None) or (column.definition_period == ETERNITY)
 
@@ -364,17 +389,23 @@ class SimpleFormula(AbstractFormula):
                     input_variables_infos = [],
                     variable_name = column.name,
                     ))
-            if extra_params:
-                array = self.base_function(simulation, period, *extra_params)
-            else:
-                array = self.base_function(simulation, period)
+            if cache_statistics is not None:
+                cache_statistics.start_computation()
+            try:
+                if extra_params:
+                    array = self.base_function(simulation, period, *extra_params)
+                else:
+                    array = self.base_function(simulation, period)
+            finally:
+                if cache_statistics is not None:
+                    cache_statistics.stop_computation(column.name)
         except CycleError:
             self.clean_cycle_detection_data()
             if max_nb_cycles is None:
                 # Re-raise until reaching the first variable called with max_nb_cycles != None in the stack.
                 raise
             simulation.max_nb_cycles = None
-            return holder.put_in_cache(self.default_values(), period, extra_params)
+            return holder.put_in_cache(self.default_values(), period, extra_params, calculated = True)
         except legislations.ParameterNotFound as exc:
             if exc.variable_name is None:
                 raise legislations.ParameterNotFound(
@@ -390,6 +421,8 @@ class SimpleFormula(AbstractFormula):
                 ))
             raise
 
+        if cache_statistics is not None:
+            cache_statistics.record(column.name, 'computations')
         assert isinstance(array, np.ndarray), u"Function {}@{}<{}>() --> <{}>{} doesn't return a numpy array".format(
             column.name, entity.key, str(period), str(period), array).encode('utf-8')
         entity_count = entity.count
@@ -412,11 +445,13 @@ class SimpleFormula(AbstractFormula):
 
         if debug or trace:
             variable_infos = (column.name, period)
-            step = simulation.traceback.get(variable_infos)
+            step = simulation.traceback.pop(variable_infos, None)
             if step is None:
-                simulation.traceback[variable_infos] = step = dict(
+                step = dict(
                     holder = holder,
                     )
+            # A step calculated again is moved to the end of the traceback, after the steps of its input variables.
+            simulation.traceback[variable_infos] = step
             step.update(simulation.stack_trace.pop())
             input_variables_infos = step['input_variables_infos']
             if not debug_all or trace:
@@ -433,7 +468,7 @@ class SimpleFormula(AbstractFormula):
                     simulation.stringify_input_variables_infos(input_variables_infos), str(period),
                     stringify_array(array)))
 
-        dated_holder = holder.put_in_cache(array, period, extra_params)
+        dated_holder = holder.put_in_cache(array, period, extra_params, calculated = True)
 
         self.clean_cycle_detection_data()
         if max_nb_cycles is not None:
@@ -480,15 +515,15 @@ class SimpleFormula(AbstractFormula):
                 array.size)
             if default is None:
                 default = 0
-        entity_index_array = simulation.get_entity(entity).members_entity_id
+        group_entity = simulation.get_entity(entity)
 
         assert isinstance(role, int)
         entity_count = entity.count
         target_array = np.empty(entity_count, dtype = array.dtype)
         target_array.fill(default)
-        boolean_filter = simulation.get_entity(entity).members_legacy_role == role
+        members = group_entity.get_members_by_legacy_roles((role,))
         try:
-            target_array[entity_index_array[boolean_filter]] = array[boolean_filter]
+            target_array[group_entity.members_entity_id[members]] = array[members]
         except:
             log.error(u'An error occurred while filtering array for role {}[{}] in function {}'.format(
                 entity.key, role, holder.column.name))
@@ -535,25 +570,29 @@ class SimpleFormula(AbstractFormula):
                 array.size)
             if default is None:
                 default = 0
-        entity_index_array = simulation.get_entity(entity).members_entity_id
+        group_entity = simulation.get_entity(entity)
         if roles is None:
             # To ensure that existing formulas don't fail, ensure there is always at least 11 roles.
             # roles = range(entity.roles_count)
             roles = range(max(entity.roles_count, 11))
-        target_array_by_role = {}
-        entity_count = entity.count
-        for role in roles:
-            target_array_by_role[role] = target_array = np.empty(entity_count, dtype = array.dtype)
-            target_array.fill(default)
-
-            boolean_filter = simulation.get_entity(entity).members_legacy_role == role
-            try:
-                target_array[entity_index_array[boolean_filter]] = array[boolean_filter]
-            except:
-                log.error(u'An error occurred while filtering array for role {}[{}] in function {}'.format(
-                    entity.key, role, holder.column.name))
-                raise
-        return target_array_by_role
+        roles = list(roles)
+        if not roles:
+            return {}
+        # The arrays of all the roles are rows of a single array, filled in a single pass.
+        target_arrays = np.empty((len(roles), entity.count), dtype = array.dtype)
+        target_arrays.fill(default)
+        members = group_entity.get_members_by_legacy_roles(roles)
+        members_legacy_role = group_entity.members_legacy_role[members]
+        row_by_legacy_role = np.zeros(max(roles) + 1, dtype = np.int32)
+        row_by_legacy_role[roles] = np.arange(len(roles))
+        try:
+            target_arrays[row_by_legacy_role[members_legacy_role], group_entity.members_entity_id[members]] = \
+                array[members]
+        except:
+            log.error(u'An error occurred while filtering array for roles {}{} in function {}'.format(
+                entity.key, roles, holder.column.name))
+            raise
+        return dict(zip(roles, target_arrays))
 
     def sum_by_entity(self, array_or_dated_holder, entity = None, roles = None):
         holder = self.holder
@@ -576,16 +615,23 @@ class SimpleFormula(AbstractFormula):
             assert array.size == persons_count, u"Expected an array of size {}. Got: {}".format(persons_count,
                 array.size)
 
-        entity_index_array = simulation.get_entity(entity).members_entity_id
+        group_entity = simulation.get_entity(entity)
 
         if roles is None:  # Here we assume we have only one person per role. Not true with new role.
             roles = range(entity.roles_count)
-        target_array = np.zeros(entity.count, dtype = array.dtype if array.dtype != np.bool else np.int16)
-        for role in roles:
-            # TODO: Mettre les filtres en cache dans la simulation
-            boolean_filter = simulation.get_entity(entity).members_legacy_role == role
-            target_array[entity_index_array[boolean_filter]] += array[boolean_filter]
-        return target_array
+        members = group_entity.get_members_by_legacy_roles(roles)
+        dtype = array.dtype if array.dtype != np.bool else np.dtype(np.int16)
+        if dtype.itemsize == 8 and dtype.kind in 'iu':
+            # bincount sums in float64, which is exact only for integers up to 2 ** 53.
+            target_array = np.zeros(entity.count, dtype = dtype)
+            np.add.at(target_array, group_entity.members_entity_id[members], array[members])
+            return target_array
+        target_array = np.bincount(
+            group_entity.members_entity_id[members],
+            weights = array[members],
+            minlength = entity.count,
+            )
+        return target_array.astype(dtype)
 
     def to_json(self, get_input_variables_and_parameters = None, with_input_variables_details = False):
         function = self.function
@@ -3,6 +3,9 @@
 
 from __future__ import division
 
+import bisect
+import threading
+
 import numpy as np
 
 from . import periods
@@ -10,6 +13,10 @@ from .commons import empty_clone
 from .periods import MONTH, YEAR, ETERNITY
 
 
+# Holders may be filled concurrently by several threads (see Simulation.calculate_many).
+_cache_lock = threading.Lock()
+
+
 class DatedHolder(object):
     """A wrapper of the value of a variable for a given period (and possibly a given set of extra parameters).
     """
@@ -50,6 +57,8 @@ class DatedHolder(object):
 class Holder(object):
     _array = None  # Only used when column.definition_period == ETERNITY
     _array_by_period = None  # Only used when column.definition_period != ETERNITY
+    _calculated_periods = None  # Periods of the values calculated by formulas, as opposed to those set as inputs
+    _known_periods_index = None  # Couple (starts, periods) of the periods of _array_by_period, sorted by start instant
     column = None
     entity = None
     formula = None
@@ -88,20 +97,30 @@ class Holder(object):
     def calculate_output(self, period):
         return self.formula.calculate_output(period)
 
-    def clone(self):
-        """Copy the holder just enough to be able to run a new simulation without modifying the original simulation."""
+    def clone(self, simulation = None):
+        """Copy the holder just enough to be able to run a new simulation without modifying the original simulation.
+
+        When given, `simulation` is the simulation the copy belongs to.
+        """
         new = empty_clone(self)
         new_dict = new.__dict__
 
         for key, value in self.__dict__.iteritems():
-            if key in ('_array_by_period',):
+            if key in ('_array_by_period', '_calculated_periods'):
                 if value is not None:
                     # There is no need to copy the arrays, because the formulas don't modify them.
                     new_dict[key] = value.copy()
+            elif key == '_known_periods_index':
+                if value is not None:
+                    new_dict[key] = tuple(list(known_periods_item) for known_periods_item in value)
             elif key not in ('entity', 'formula'):
                 new_dict[key] = value
 
-        new_dict['entity'] = self.entity
+        if simulation is None:
+            new_dict['entity'] = self.entity
+        else:
+            new_dict['simulation'] = simulation
+            new_dict['entity'] = simulation.entities[self.column.entity.key]
         # Caution: formula must be cloned after the entity has been set into new.
         formula = self.formula
         if formula is not None:
@@ -136,11 +155,35 @@ class Holder(object):
 
         # First look for a value already cached
         holder_or_dated_holder = self.get_from_cache(period, parameters.get('extra_params'))
+        cache_statistics = self.simulation.cache_statistics
         if holder_or_dated_holder.array is not None:
+            if cache_statistics is not None:
+                cache_statistics.record(column.name, 'default_fallbacks' if column.is_neutralized else 'hits')
             return holder_or_dated_holder
+        if cache_statistics is not None:
+            cache_statistics.record(column.name, 'misses')
+
+        axes_compression = self.simulation.axes_compression
+        if axes_compression is not None and not parameters.get('extra_params'):
+            array = axes_compression.get_invariant_array(column.name, period)
+            if array is not None:
+                return self.put_in_cache(array, period, calculated = True)
         assert self._array is None  # self._array should always be None when dated_holder.array is None.
 
         # Request a computation
+        concurrent_computations = self.simulation.concurrent_computations
+        if concurrent_computations is not None:
+            extra_params = parameters.get('extra_params')
+            computation_key = (self, period, tuple(extra_params) if extra_params else None)
+            if concurrent_computations.acquire(computation_key):
+                try:
+                    # The value may have been calculated by another thread in the meantime.
+                    holder_or_dated_holder = self.get_from_cache(period, extra_params)
+                    if holder_or_dated_holder.array is not None:
+                        return holder_or_dated_holder
+                    return self.formula.compute(period = period, **parameters)
+                finally:
+                    concurrent_computations.release(computation_key)
         formula_dated_holder = self.formula.compute(period = period, **parameters)
         assert formula_dated_holder is not None
         return formula_dated_holder
@@ -198,10 +241,16 @@ class Holder(object):
             period).encode('utf-8'))
 
     def delete_arrays(self):
+        if self.simulation.memory_config is not None:
+            self.simulation.memory_config.forget(self)
         if self._array is not None:
             del self._array
         if self._array_by_period is not None:
             del self._array_by_period
+        if self._known_periods_index is not None:
+            del self._known_periods_index
+        if self._calculated_periods is not None:
+            del self._calculated_periods
 
     def get_array(self, period, extra_params = None):
         if self.column.definition_period == ETERNITY:
@@ -245,7 +294,12 @@ class Holder(object):
     def set_input(self, period, array):
         self.formula.set_input(period, array)
 
-    def put_in_cache(self, value, period, extra_params = None):
+    def is_calculated(self, period):
+        """Tell whether the value of a period has been calculated by a formula, rather than set as an input."""
+        return self._calculated_periods is not None and period in self._calculated_periods
+
+    def put_in_cache(self, value, period, extra_params = None, calculated = False):
+        """Put a value in the cache. `calculated` tells whether it has been calculated by a formula."""
         simulation = self.simulation
 
         if self.column.definition_period != ETERNITY:
@@ -277,15 +331,56 @@ class Holder(object):
                     )
         array_by_period = self._array_by_period
         if array_by_period is None:
-            self._array_by_period = array_by_period = {}
+            with _cache_lock:
+                array_by_period = self._array_by_period
+                if array_by_period is None:
+                    self._array_by_period = array_by_period = {}
+        is_new_period = period not in array_by_period
         if extra_params is None:
             array_by_period[period] = value
         else:
-            if array_by_period.get(period) is None:
-                array_by_period[period] = {}
-            array_by_period[period][tuple(extra_params)] = value
+            array_by_period.setdefault(period, {})[tuple(extra_params)] = value
+        if is_new_period and self._known_periods_index is not None and self.column.definition_period != ETERNITY:
+            with _cache_lock:
+                known_periods_start, known_periods = self._known_periods_index
+                position = bisect.bisect_right(known_periods_start, period.start)
+                # Replaced as a whole, so that threads reading the index concurrently don't see half of an update.
+                self._known_periods_index = (
+                    known_periods_start[:position] + [period.start] + known_periods_start[position:],
+                    known_periods[:position] + [period] + known_periods[position:],
+                    )
+        if calculated:
+            if self._calculated_periods is None:
+                with _cache_lock:
+                    if self._calculated_periods is None:
+                        self._calculated_periods = set()
+            self._calculated_periods.add(period)
+        elif self._calculated_periods is not None:
+            self._calculated_periods.discard(period)
+        if simulation.memory_config is not None:
+            simulation.memory_config.register(self, period, tuple(extra_params) if extra_params is not None else None)
         return self.get_from_cache(period, extra_params)
 
+    def get_known_periods(self):
+        """Return the periods for which a value is known, sorted by start instant."""
+        return list(self._get_known_periods_index()[1])
+
+    def _get_known_periods_index(self):
+        """Return the couple (starts, periods) of the known periods, sorted by start instant, to be bisected."""
+        array_by_period = self._array_by_period
+        if array_by_period is None or self.column.definition_period == ETERNITY:
+            return [], []
+        known_periods_index = self._known_periods_index
+        if known_periods_index is None or len(known_periods_index[1]) != len(array_by_period):
+            # The index is built on first use, and then updated by put_in_cache. It is rebuilt when the cache has
+            # been replaced as a whole (see data_storage).
+            known_periods = sorted(array_by_period, key = lambda period: period.start)
+            self._known_periods_index = known_periods_index = (
+                [period.start for period in known_periods],
+                known_periods,
+                )
+        return known_periods_index
+
     def get_from_cache(self, period, extra_params = None):
         if self.column.is_neutralized:
             return DatedHolder(self, period, value = self.default_array())
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+
+"""Invert a formula chain, e.g. to find the gross wage giving a net wage, entity by entity.
+
+:any:`MarginalRateTaxScale.inverse` only inverts a single tax scale. :func:`invert` inverts any variable which is a
+monotonous function of an input: the input is searched, for all entities at once, by a safeguarded secant method (the
+Illinois variant of the regula falsi), each iteration being a calculation of the whole population.
+"""
+
+
+from __future__ import division
+
+import numpy as np
+
+from . import periods
+from .axes_compression import AxesCompression
+
+
+def invert(simulation, target, varying, target_value, period = None, lower = 0, upper = None, tolerance = 0.01,
+        max_iterations = 100, max_doublings = 30):
+    """Find, for every entity, the value of `varying` for which `target` equals `target_value` over `period`.
+
+    `target` must be a monotonous function of `varying`, and both variables must belong to the same entity. The values
+    of the input variables known by `simulation` are used, and the variables which don't depend on `varying` are
+    calculated only once (see :any:`AxesCompression`). `simulation` itself is not modified.
+
+    When `upper` is None, it is doubled, starting from ``2 * abs(target_value) + 1``, until the solution is bracketed,
+    at most `max_doublings` times. It stops being doubled for the entities whose residual doesn't get closer to zero,
+    e.g. when their target value is out of reach: these entities are not converged.
+
+    :returns: A couple ``(varying_value, converged)``. ``converged`` tells, for every entity, whether ``target`` is
+        within `tolerance` of ``target_value``. For the other entities, ``varying_value`` is the best value found.
+    """
+    period = periods.period(period) if period is not None else simulation.period
+    tax_benefit_system = simulation.tax_benefit_system
+    target_entity = simulation.get_variable_entity(target)
+    if target_entity.key != simulation.get_variable_entity(varying).key:
+        raise ValueError(u'Variables "{}" and "{}" must belong to the same entity to invert one into the other'.format(
+            target, varying).encode('utf-8'))
+    count = target_entity.count
+    target_value = np.broadcast_to(np.asarray(target_value, dtype = np.float64), (count,))
+
+    # Simulations of the iterations start from the inputs of `simulation`, without its calculated values.
+    inputs_simulation = simulation.clone()
+    base_simulation = simulation.clone(trace = True)
+    for variable_name, holder in simulation.holder_by_name.iteritems():
+        if variable_name == varying:
+            del inputs_simulation.holder_by_name[variable_name]
+        elif not holder.column.is_input_variable():
+            del inputs_simulation.holder_by_name[variable_name]
+            del base_simulation.holder_by_name[variable_name]
+    axes_compression = AxesCompression(
+        base_simulation = base_simulation,
+        steps_count = 1,
+        varying_variables_name = [varying],
+        )
+
+    def residual(varying_value):
+        iteration_simulation = inputs_simulation.clone()
+        iteration_simulation.axes_compression = axes_compression
+        iteration_simulation.get_or_new_holder(varying).set_input(period, varying_value)
+        if tax_benefit_system.get_column(target, check_existence = True).definition_period == period.unit:
+            target_array = iteration_simulation.calculate(target, period)
+        else:
+            target_array = iteration_simulation.calculate_add(target, period)
+        return target_array - target_value
+
+    lower = np.array(np.broadcast_to(lower, (count,)), dtype = np.float64)
+    lower_residual = residual(lower)
+    if upper is None:
+        upper = 2 * np.abs(target_value) + 1
+        upper_residual = residual(upper)
+        doubled = np.sign(lower_residual) * np.sign(upper_residual) > 0
+        for _ in range(max_doublings):
+            if not doubled.any():
+                break
+            doubled_upper = np.where(doubled, 2 * upper, upper)
+            doubled_upper_residual = residual(doubled_upper)
+            is_bracketed = np.sign(lower_residual) * np.sign(doubled_upper_residual) <= 0
+            # Entities whose residual doesn't improve can't be bracketed by doubling their upper bound again.
+            improves = doubled & (is_bracketed | (np.abs(doubled_upper_residual) < np.abs(upper_residual)))
+            upper = np.where(improves, doubled_upper, upper)
+            upper_residual = np.where(improves, doubled_upper_residual, upper_residual)
+            doubled = improves & ~is_bracketed
+    else:
+        upper = np.array(np.broadcast_to(upper, (count,)), dtype = np.float64)
+        upper_residual = residual(upper)
+
+    # Start from the best bound, so that entities which are not bracketed still get their closest value.
+    lower_is_best = np.abs(lower_residual) <= np.abs(upper_residual)
+    varying_value = np.where(lower_is_best, lower, upper)
+    best_residual = np.where(lower_is_best, lower_residual, upper_residual)
+    converged = np.abs(best_residual) <= tolerance
+    active = ~converged & (np.sign(lower_residual) * np.sign(upper_residual) <= 0)
+    last_moved_bound = np.zeros(count, dtype = np.int8)  # -1: lower, 1: upper
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+        residual_span = upper_residual - lower_residual
+        secant_value = lower - lower_residual * (upper - lower) / np.where(residual_span != 0, residual_span, 1)
+        middle = (lower + upper) / 2
+        is_secant_valid = (residual_span != 0) & (secant_value > lower) & (secant_value < upper)
+        candidate = np.where(active, np.where(is_secant_valid, secant_value, middle), varying_value)
+        candidate_residual = residual(candidate)
+
+        improved = active & (np.abs(candidate_residual) < np.abs(best_residual))
+        varying_value = np.where(improved, candidate, varying_value)
+        best_residual = np.where(improved, candidate_residual, best_residual)
+        converged |= active & (np.abs(candidate_residual) <= tolerance)
+
+        # Replace the bound on the same side of the root as the candidate.
+        moves_lower = active & (np.sign(candidate_residual) == np.sign(lower_residual))
+        moves_upper = active & ~moves_lower
+        # Illinois: when the same bound is kept twice in a row, halve its residual to speed up the convergence.
+        upper_residual = np.where(moves_lower & (last_moved_bound == -1), upper_residual / 2, upper_residual)
+        lower_residual = np.where(moves_upper & (last_moved_bound == 1), lower_residual / 2, lower_residual)
+        lower = np.where(moves_lower, candidate, lower)
+        lower_residual = np.where(moves_lower, candidate_residual, lower_residual)
+        upper = np.where(moves_upper, candidate, upper)
+        upper_residual = np.where(moves_upper, candidate_residual, upper_residual)
+        last_moved_bound = np.where(moves_lower, -1, np.where(moves_upper, 1, last_moved_bound)).astype(np.int8)
+
+        active &= ~converged & (upper > lower)
+    return varying_value, converged
@@ -7,6 +7,8 @@ import os
 
 from lxml import etree
 
+from . import startup_statistics
+
 
 json_unit_by_xml_json_type = dict(
     age = u'year',
@@ -31,11 +33,12 @@ def load_xml_schema():
 def parse_and_validate_xml(xmlschema, legislation_xml_info_list):
     xml_trees = []
     for filename, path_in_legislation in legislation_xml_info_list:
-        with open(filename, 'r') as f:
-            tree = etree.parse(f)
+        with startup_statistics.loading_file(filename), startup_statistics.measure(u'legislation_parsing'):
+            with open(filename, 'r') as f:
+                tree = etree.parse(f)
 
-        if not xmlschema.validate(tree):
-            raise ValueError(xmlschema.error_log.filter_from_errors())
+            if not xmlschema.validate(tree):
+                raise ValueError(xmlschema.error_log.filter_from_errors())
 
         xml_trees.append(tree)
 
@@ -188,13 +191,15 @@ def merge(name_list, json_list, path_list):
 
 
 def load_legislation(legislation_xml_info_list):
-    xmlschema = load_xml_schema()
+    with startup_statistics.measure(u'legislation_parsing'):
+        xmlschema = load_xml_schema()
 
     xml_trees = parse_and_validate_xml(xmlschema, legislation_xml_info_list)
 
-    name_list, json_list = transform_etree_to_json_root(xml_trees)
+    with startup_statistics.measure(u'legislation_conversion'):
+        name_list, json_list = transform_etree_to_json_root(xml_trees)
 
-    path_list = [path for filename, path in legislation_xml_info_list]
-    merged_json = merge(name_list, json_list, path_list)
+        path_list = [path for filename, path in legislation_xml_info_list]
+        merged_json = merge(name_list, json_list, path_list)
 
     return merged_json
@@ -41,5 +41,13 @@ from .base_functions import (   # noqa analysis:ignore
     )
 from .variables import DatedVariable, Variable  # noqa analysis:ignore
 from .formula_helpers import apply_thresholds, switch  # noqa analysis:ignore
+from .date_helpers import (  # noqa analysis:ignore
+    age_in_months,
+    age_in_years,
+    months_between,
+    period_start,
+    period_stop,
+    years_between,
+    )
 from .periods import MONTH, YEAR, ETERNITY  # noqa analysis:ignore
 from .reforms import Reform  # noqa analysis:ignore
@@ -14,6 +14,7 @@ import calendar
 import collections
 import datetime
 import re
+import threading
 
 from . import conv
 
@@ -27,12 +28,106 @@ def N_(message):
     return message
 
 
+class BoundedCache(object):
+    """A dict-like cache, keeping at most `max_size` items by evicting the oldest ones.
+
+    Lookups don't take any lock, as dict lookups are atomic. Insertions and evictions are serialized by a lock, so
+    that the cache can be filled by several threads.
+
+    When `statistics` is True, hits and misses are counted. Counting slows lookups down, so it is disabled by default.
+    """
+    max_size = None
+
+    def __init__(self, max_size, statistics = False):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._value_by_key = collections.OrderedDict()
+        self.enable_statistics(statistics)
+
+    def __contains__(self, key):
+        return key in self._value_by_key
+
+    def __len__(self):
+        return len(self._value_by_key)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            value_by_key = self._value_by_key
+            if key not in value_by_key:
+                while len(value_by_key) >= self.max_size:
+                    value_by_key.popitem(last = False)
+            value_by_key[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._value_by_key.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def enable_statistics(self, enabled = True):
+        """Start or stop counting the hits and misses of get."""
+        self.statistics_enabled = enabled
+        # The lookup method of the dict itself is used when there is nothing to count.
+        self.get = self._get_and_count if enabled else self._value_by_key.get
+
+    def _get_and_count(self, key, default = None):
+        # The counters are not locked: they may miss a few concurrent requests.
+        value = self._value_by_key.get(key, default)
+        if value is default:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_statistics(self):
+        requests_count = self.hits + self.misses
+        return dict(
+            hit_rate = float(self.hits) / requests_count if requests_count else None,
+            hits = self.hits,
+            max_size = self.max_size,
+            misses = self.misses,
+            size = len(self),
+            statistics_enabled = self.statistics_enabled,
+            )
+
+
+CACHE_MAX_SIZE = 10000
 # Note: weak references are not used, because Python 2.7 can't create weak reference to 'datetime.date' objects.
-date_by_instant_cache = {}
-str_by_instant_cache = {}
+date_by_instant_cache = BoundedCache(CACHE_MAX_SIZE)
+str_by_instant_cache = BoundedCache(CACHE_MAX_SIZE)
+# Parsed strings, offsets and stops are memoized, so that the periods used by the holders are computed once and always
+# are the same objects, whose lookups in dicts are faster.
+instant_by_str_cache = BoundedCache(CACHE_MAX_SIZE)
+period_by_str_cache = BoundedCache(CACHE_MAX_SIZE)
+offset_by_instant_cache = BoundedCache(CACHE_MAX_SIZE)
+offset_by_period_cache = BoundedCache(CACHE_MAX_SIZE)
+stop_by_period_cache = BoundedCache(CACHE_MAX_SIZE)
 year_or_month_or_day_re = re.compile(ur'(18|19|20)\d{2}(-(0?[1-9]|1[0-2])(-([0-2]?\d|3[0-1]))?)?$')
 
 
+def iter_caches():
+    """Iterate over the couples (name, cache) of the caches of this module."""
+    for name, cache in globals().items():
+        if isinstance(cache, BoundedCache):
+            yield name, cache
+
+
+def enable_caches_statistics(enabled = True):
+    """Start or stop counting the hits and misses of the caches of this module."""
+    for _, cache in iter_caches():
+        cache.enable_statistics(enabled)
+
+
+def get_caches_statistics():
+    """Return the statistics of the caches of this module, by cache name. See enable_caches_statistics."""
+    return dict(
+        (name, cache.get_statistics())
+        for name, cache in iter_caches()
+        )
+
+
 class Instant(tuple):
     def __repr__(self):
         """Transform instant to to its Python representation as a string.
@@ -204,6 +299,11 @@ class Instant(tuple):
         >>> instant('2014-2-3').offset('last-of', 'year')
         Instant((2014, 12, 31))
         """
+        cache_key = (self, offset, unit)
+        offset_instant = offset_by_instant_cache.get(cache_key)
+        if offset_instant is not None:
+            return offset_instant
+
         year, month, day = self
         if offset == 'first-of':
             if unit == u'month':
@@ -240,15 +340,8 @@ class Instant(tuple):
                         day -= month_last_day
                         month_last_day = calendar.monthrange(year, month)[1]
             elif unit == u'month':
-                month += offset
-                if offset < 0:
-                    while month < 1:
-                        year -= 1
-                        month += 12
-                elif offset > 0:
-                    while month > 12:
-                        year += 1
-                        month -= 12
+                year, month = divmod(year * 12 + month - 1 + offset, 12)
+                month += 1
                 month_last_day = calendar.monthrange(year, month)[1]
                 if day > month_last_day:
                     day = month_last_day
@@ -259,7 +352,8 @@ class Instant(tuple):
                 month_last_day = calendar.monthrange(year, month)[1]
                 if day > month_last_day:
                     day = month_last_day
-        return self.__class__((year, month, day))
+        offset_instant = offset_by_instant_cache[cache_key] = self.__class__((year, month, day))
+        return offset_instant
 
     @property
     def year(self):
@@ -538,7 +632,12 @@ class Period(tuple):
         >>> period('year', '2014-2-3').offset('last-of', 'year')
         Period((u'year', Instant((2014, 12, 31)), 1))
         """
-        return self.__class__((self[0], self[1].offset(offset, self[0] if unit is None else unit), self[2]))
+        cache_key = (self, offset, unit)
+        offset_period = offset_by_period_cache.get(cache_key)
+        if offset_period is None:
+            offset_period = offset_by_period_cache[cache_key] = self.__class__(
+                (self[0], self[1].offset(offset, self[0] if unit is None else unit), self[2]))
+        return offset_period
 
     @property
     def size(self):
@@ -597,6 +696,10 @@ class Period(tuple):
         >>> period('day', '2012-2-29', 2).stop
         Instant((2012, 3, 1))
         """
+        stop = stop_by_period_cache.get(self)
+        if stop is not None:
+            return stop
+
         unit, start_instant, size = self
         year, month, day = start_instant
         if unit == u'day':
@@ -612,10 +715,8 @@ class Period(tuple):
                     month_last_day = calendar.monthrange(year, month)[1]
         else:
             if unit == u'month':
-                month += size
-                while month > 12:
-                    year += 1
-                    month -= 12
+                year, month = divmod(year * 12 + month - 1 + size, 12)
+                month += 1
             else:
                 assert unit == u'year', 'Invalid unit: {} of type {}'.format(unit, type(unit))
                 year += size
@@ -634,7 +735,8 @@ class Period(tuple):
                         year += 1
                         month = 1
                     day -= month_last_day
-        return Instant((year, month, day))
+        stop = stop_by_period_cache[self] = Instant((year, month, day))
+        return stop
 
     def to_json_dict(self):
         return collections.OrderedDict((
@@ -695,10 +797,16 @@ def instant(instant):
     if instant is None:
         return None
     if isinstance(instant, basestring):
-        instant = Instant(
+        instant_str = instant
+        instant = instant_by_str_cache.get(instant_str)
+        if instant is not None:
+            return instant
+        instant = tuple(
             int(fragment)
-            for fragment in instant.split(u'-', 2)[:3]
+            for fragment in instant_str.split(u'-', 2)[:3]
             )
+        instant_by_str_cache[instant_str] = instant = Instant(instant + (1, 1)[len(instant) - 1:])
+        return instant
     elif isinstance(instant, datetime.date):
         instant = Instant((instant.year, instant.month, instant.day))
     elif isinstance(instant, int):
@@ -727,6 +835,10 @@ def instant_date(instant):
     return instant_date
 
 
+def _raise_invalid_period_error(value):
+    raise ValueError(u"Invalid period {}".format(value).encode('utf-8'))
+
+
 def period(value):
     """Return a new period, aka a triple (unit, start_instant, size).
 
@@ -746,6 +858,23 @@ def period(value):
     Period((YEAR, Instant((2014, 2, 1)), 1))
     """
 
+    # check the type
+    if isinstance(value, int):
+        return Period((YEAR, Instant((value, 1, 1)), 1))
+    if isinstance(value, Period):
+        return value
+    if not isinstance(value, basestring):
+        _raise_invalid_period_error(value)
+
+    period = period_by_str_cache.get(value)
+    if period is None:
+        period = period_by_str_cache[value] = parse_period_str(value)
+    return period
+
+
+def parse_period_str(value):
+    """Parse a period string, such as 2015, 2015-03, year:2015-03 or month:2015-03:3. Use :func:`period` instead."""
+
     def parse_simple_period(value):
         """
         Parses simple periods respecting the ISO format, such as 2012 or 2015-03
@@ -762,17 +891,6 @@ def period(value):
         else:
             return Period((YEAR, Instant((date.year, date.month, 1)), 1))
 
-    def raise_error(value):
-        raise ValueError(u"Invalid period {}".format(value).encode('utf-8'))
-
-    # check the type
-    if isinstance(value, int):
-        return Period((YEAR, Instant((value, 1, 1)), 1))
-    if isinstance(value, Period):
-        return value
-    if not isinstance(value, basestring):
-        raise_error(value)
-
     # try to parse as a simple period
     period = parse_simple_period(value)
     if period is not None:
@@ -780,19 +898,19 @@ def period(value):
 
     # complex period must have a ':' in their strings
     if ":" not in value:
-        raise_error(value)
+        _raise_invalid_period_error(value)
 
     components = value.split(':')
 
     # left-most component must be a valid unit
     unit = components[0]
     if unit not in (MONTH, YEAR):
-        raise_error(value)
+        _raise_invalid_period_error(value)
 
     # middle component must be a valid iso period
     base_period = parse_simple_period(components[1])
     if not base_period:
-        raise_error(value)
+        _raise_invalid_period_error(value)
 
     # period like year:2015-03 have a size of 1
     if len(components) == 2:
@@ -802,14 +920,14 @@ def period(value):
         try:
             size = int(components[2])
         except ValueError:
-            raise_error(value)
+            _raise_invalid_period_error(value)
     # if there is more than 2 ":" in the string, the period is invalid
     else:
-        raise_error(value)
+        _raise_invalid_period_error(value)
 
     # reject ambiguous period such as month:2014
     if base_period.unit == YEAR and unit == MONTH:
-        raise_error(value)
+        _raise_invalid_period_error(value)
 
     return Period((unit, base_period.start, size))
 
@@ -5,6 +5,10 @@ from __future__ import division
 
 import numpy
 
+from . import periods
+from .axes_compression import AxesCompression
+from .simulations import Simulation
+
 
 def average_rate(target = None, varying = None):
     # target: numerator, varying: denominator
@@ -19,3 +23,112 @@ def marginal_rate(target = None, varying = None, trim = None):
         marginal_rate = numpy.where(marginal_rate >= min(trim), marginal_rate, numpy.nan)
 
     return marginal_rate
+
+
+def marginal_effective_rate(simulation, target = None, varying = None, period = None, delta = 100):
+    """Compute the effective marginal rate of each entity of a population, when `varying` increases by `delta`.
+
+    A single simulation is built with the population of `simulation` followed by a perturbed copy, where `varying`
+    is increased by `delta` for every person (or entity) over `period`. The values known by `simulation` are copied,
+    including the values set as inputs of variables which have a formula, except the calculated values which may
+    depend on `varying`. When `simulation` is traced, its trace tells which calculated values depend on `varying`:
+    the others are reused. Otherwise, all the calculated values are calculated again. Variables which don't depend on
+    `varying` are calculated only once, on the original population (see :any:`AxesCompression`). `simulation` itself
+    is not modified.
+
+    `target` and `varying` must belong to the same entity, or one of them to the person entity.
+
+    :returns: An array of the rates ``1 - Δtarget / Δvarying`` for the entities of `target`.
+    """
+    period = periods.period(period) if period is not None else simulation.period
+    tax_benefit_system = simulation.tax_benefit_system
+    target_entity = simulation.get_variable_entity(target)
+    varying_entity = simulation.get_variable_entity(varying)
+    if target_entity.key != varying_entity.key and not target_entity.is_person and not varying_entity.is_person:
+        raise ValueError(u'Unable to compute the marginal effective rate of {} ({}) when {} ({}) varies: the '
+            u'perturbation of the members of an entity can not be related to another group entity.'.format(
+                target, target_entity.key, varying, varying_entity.key).encode('utf-8'))
+
+    perturbed_simulation = Simulation(period = simulation.period, tax_benefit_system = tax_benefit_system)
+    for entity in simulation.entities.itervalues():
+        perturbed_entity = perturbed_simulation.entities[entity.key]
+        perturbed_entity.count = 2 * entity.count
+        perturbed_entity.step_size = entity.count
+        if entity.is_person:
+            continue
+        perturbed_entity.members_entity_id = numpy.concatenate(
+            [entity.members_entity_id, entity.members_entity_id + entity.count])
+        perturbed_entity.members_role = numpy.tile(entity.members_role, 2)
+        perturbed_entity.members_legacy_role = numpy.tile(entity.members_legacy_role, 2)
+        perturbed_entity.roles_count = entity.roles_count
+
+    # Variables whose calculated values depend on `varying`, according to the trace of `simulation`.
+    varying_variables_name = set([varying])
+    if simulation.trace:
+        traced_dependencies = AxesCompression(simulation, varying_variables_name = [varying], steps_count = 1)
+        varying_variables_name.update(
+            variable_name
+            for variable_name in simulation.holder_by_name
+            if traced_dependencies.depends_on_varying_variables(variable_name)
+            )
+
+    base_simulation = simulation.clone(trace = True)
+    for variable_name, holder in simulation.holder_by_name.iteritems():
+        base_holder = base_simulation.holder_by_name[variable_name]
+        perturbed_holder = perturbed_simulation.get_or_new_holder(variable_name)
+        if holder.column.definition_period == periods.ETERNITY:
+            known_arrays = [(None, holder._array)] if holder._array is not None else []
+        else:
+            known_arrays = [
+                (known_period, array)
+                for known_period, array in (holder._array_by_period or {}).iteritems()
+                if isinstance(array, numpy.ndarray)  # Values calculated with extra parameters are not used.
+                ]
+        for known_period, array in known_arrays:
+            if holder.is_calculated(known_period):
+                if not simulation.trace:
+                    # The value may depend on `varying`: it is calculated again, and traced to discover its
+                    # dependencies.
+                    _forget_value(base_holder, known_period)
+                    continue
+                if variable_name in varying_variables_name and variable_name != varying:
+                    continue  # Calculated again in the perturbed simulation.
+            if variable_name == varying and (
+                    known_period is None or known_period.start <= period.stop and period.start <= known_period.stop):
+                continue  # Replaced below by the perturbed value.
+            perturbed_holder.put_in_cache(numpy.tile(array, 2), known_period,
+                calculated = holder.is_calculated(known_period))
+
+    def calculate(calculated_simulation, variable_name):
+        if tax_benefit_system.get_column(variable_name, check_existence = True).definition_period == period.unit:
+            return calculated_simulation.calculate(variable_name, period)
+        return calculated_simulation.calculate_add(variable_name, period)
+
+    varying_array = calculate(base_simulation, varying)
+    perturbed_simulation.get_or_new_holder(varying).set_input(
+        period, numpy.concatenate([varying_array, varying_array + delta]))
+    perturbed_simulation.axes_compression = AxesCompression(
+        base_simulation = base_simulation,
+        steps_count = 2,
+        varying_variables_name = varying_variables_name,
+        )
+
+    target_array = calculate(perturbed_simulation, target)
+    target_count = target_array.size // 2
+    target_delta = target_array[target_count:] - target_array[:target_count]
+    if target_entity.key != varying_entity.key and varying_entity.is_person:
+        # Every member of the target entity has been perturbed.
+        varying_delta = delta * numpy.bincount(
+            simulation.entities[target_entity.key].members_entity_id, minlength = target_count)
+    else:
+        # Same entity, or the entity of each target person has been perturbed.
+        varying_delta = delta
+    return 1 - target_delta / varying_delta
+
+
+def _forget_value(holder, period):
+    if period is None:
+        holder._array = None
+    if holder._array_by_period is not None:
+        holder._array_by_period.pop(period, None)
+    holder._known_periods_index = None
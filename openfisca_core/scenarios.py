@@ -4,11 +4,13 @@
 from __future__ import division
 
 import collections
+import copy
 import itertools
 
 import numpy as np
 
 from . import conv, periods, simulations, json_to_test_case
+from .axes_compression import AxesCompression
 
 
 def N_(message):
@@ -124,28 +126,21 @@ class AbstractScenario(object):
 
                     entity_step_size = entity.step_size
 
-                    entity.members_entity_id = np.empty(
-                        steps_count * persons_step_size,
-                        dtype = np.int32
-                        )
-                    entity.members_role = np.empty(
-                        steps_count * persons_step_size,
-                        dtype = object
-                        )
-                    entity.members_legacy_role = np.empty(
-                        steps_count * persons_step_size,
-                        dtype = np.int32
-                        )
-
+                    # Fill the members of the first step, and replicate them for the other steps.
+                    step_members_entity_id = np.empty(persons_step_size, dtype = np.int32)
+                    step_members_role = np.empty(persons_step_size, dtype = object)
+                    step_members_legacy_role = np.empty(persons_step_size, dtype = np.int32)
                     for scenario_entity_index, scenario_entity in enumerate(test_case[entity.plural]):
                         for person_role, person_legacy_role, person_id in iter_over_entity_members(entity, scenario_entity):
                             person_index = person_index_by_id[person_id]
-                            for step_index in range(steps_count):
-                                individu_index = step_index * persons_step_size + person_index
-
-                                entity.members_entity_id[individu_index] = step_index * entity_step_size + scenario_entity_index
-                                entity.members_role[individu_index] = person_role
-                                entity.members_legacy_role[individu_index] = person_legacy_role
+                            step_members_entity_id[person_index] = scenario_entity_index
+                            step_members_role[person_index] = person_role
+                            step_members_legacy_role[person_index] = person_legacy_role
+
+                    steps_first_entity_id = np.arange(steps_count, dtype = np.int32) * entity_step_size
+                    entity.members_entity_id = (steps_first_entity_id[:, np.newaxis] + step_members_entity_id).ravel()
+                    entity.members_role = np.tile(step_members_role, steps_count)
+                    entity.members_legacy_role = np.tile(step_members_legacy_role, steps_count)
                     entity.roles_count = entity.members_legacy_role.max() + 1
 
                 for variable_name, column in tbs.column_by_name.iteritems():
@@ -174,14 +169,7 @@ class AbstractScenario(object):
                                         )
                                     )
                                 ]
-                            variable_values_iter = (
-                                variable_value
-                                for step_index in range(steps_count)
-                                for variable_value in variable_values
-                                )
-                            array = np.fromiter(variable_values_iter, dtype = column.dtype) \
-                                if column.dtype is not object \
-                                else np.array(list(variable_values_iter), dtype = column.dtype)
+                            array = np.tile(np.array(variable_values, dtype = column.dtype), steps_count)
                             set_input(variable_name, variable_period, array)
 
             if self.axes is not None:
@@ -354,7 +342,13 @@ class AbstractScenario(object):
                 value = value, state = state or conv.default_state)
         return json_to_instance
 
-    def new_simulation(self, debug = False, debug_all = False, reference = False, trace = False, opt_out_cache = False):
+    def new_simulation(self, debug = False, debug_all = False, reference = False, trace = False, opt_out_cache = False,
+            memory_config = None, cache_statistics = False, compress_axes = False):
+        """Create a simulation filled with the scenario.
+
+        When `compress_axes` is True, variables which don't vary along the axes of the scenario are calculated once on
+        the test case without axes, and replicated for each step (see :any:`AxesCompression`).
+        """
         assert isinstance(reference, (bool, int)), \
             'Parameter reference must be a boolean. When True, the reference tax-benefit system is used.'
         tax_benefit_system = self.tax_benefit_system
@@ -371,8 +365,22 @@ class AbstractScenario(object):
             tax_benefit_system = tax_benefit_system,
             trace = trace,
             opt_out_cache = opt_out_cache,
+            memory_config = memory_config,
+            cache_statistics = cache_statistics,
             )
         self.fill_simulation(simulation)
+        if compress_axes and self.axes is not None:
+            base_scenario = copy.copy(self)
+            base_scenario.axes = None
+            simulation.axes_compression = AxesCompression(
+                base_simulation = base_scenario.new_simulation(reference = reference, trace = True),
+                steps_count = simulation.steps_count,
+                varying_variables_name = set(
+                    axis['name']
+                    for parallel_axes in self.axes
+                    for axis in parallel_axes
+                    ),
+                )
         return simulation
 
     def make_json_or_python_to_test_case(self, period, repair = False):
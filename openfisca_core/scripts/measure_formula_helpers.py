@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Measure and compare the implementations of the formula helpers apply_thresholds and switch:
+- using np.select: one boolean array is built for each threshold or each key
+- using formula_helpers: a bisection in the thresholds, or a lookup table indexed by the conditions
+
+The aim of this script is to check that the formula helpers give the same results than np.select, and to compare the
+time taken by both implementations.
+"""
+
+
+from contextlib import contextmanager
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from openfisca_core.formula_helpers import apply_thresholds, switch
+
+
+args = None
+
+
+@contextmanager
+def measure_time(title):
+    t1 = time.time()
+    yield
+    t2 = time.time()
+    print(u'{}\t: {:.8f} seconds elapsed'.format(title, t2 - t1).encode('utf-8'))
+
+
+def apply_thresholds_select(input, thresholds, choices):
+    condlist = [input <= threshold for threshold in thresholds]
+    if len(condlist) == len(choices) - 1:
+        condlist += [True]
+    return np.select(condlist, choices)
+
+
+def switch_select(conditions, value_by_condition):
+    condlist = [
+        conditions == condition
+        for condition in value_by_condition.keys()
+        ]
+    return np.select(condlist, value_by_condition.values())
+
+
+def test_apply_thresholds():
+    input = np.random.uniform(0, args.choices_count, size = args.array_length)
+    thresholds = range(1, args.choices_count)
+    choices = [choice * 10 for choice in range(args.choices_count)]
+
+    for _ in range(args.repeat):
+        with measure_time('apply_thresholds_select'):
+            expected = apply_thresholds_select(input, thresholds, choices)
+
+        with measure_time('apply_thresholds'):
+            result = apply_thresholds(input, thresholds, choices)
+
+    assert result.dtype == expected.dtype and (result == expected).all()
+
+
+def test_switch():
+    conditions = np.random.randint(args.choices_count + 1, size = args.array_length)  # Some conditions are unknown.
+    value_by_condition = {
+        condition: condition * 10
+        for condition in range(args.choices_count)
+        }
+
+    for _ in range(args.repeat):
+        with measure_time('switch_select'):
+            expected = switch_select(conditions, value_by_condition)
+
+        with measure_time('switch'):
+            result = switch(conditions, value_by_condition)
+
+    assert result.dtype == expected.dtype and (result == expected).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('--array-length', default = 1000000, type = int, help = "length of the array")
+    parser.add_argument('--choices-count', default = 10, type = int, help = "number of choices")
+    parser.add_argument('--repeat', default = 3, type = int, help = "number of measures of each implementation")
+    global args
+    args = parser.parse_args()
+
+    print(unicode(args).format('utf-8'))
+    test_apply_thresholds()
+    test_switch()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
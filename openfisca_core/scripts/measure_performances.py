@@ -16,7 +16,8 @@ from numpy.core.defchararray import startswith
 
 from openfisca_core import periods, simulations
 from openfisca_core.columns import BoolCol, DateCol, FixedStrCol, FloatCol, IntCol
-from openfisca_core.periods import ETERNITY
+from openfisca_core.date_helpers import age_in_years
+from openfisca_core.periods import ETERNITY, MONTH, YEAR
 from openfisca_core.entities import build_entity
 from openfisca_core.formulas import dated_function
 from openfisca_core.variables import DatedVariable, Variable
@@ -78,25 +79,28 @@ class age_en_mois(Variable):
     column = IntCol
     entity = Individu
     label = u"Âge (en nombre de mois)"
+    definition_period = MONTH
 
 
 class birth(Variable):
     column = DateCol
     entity = Individu
     label = u"Date de naissance"
+    definition_period = ETERNITY
 
 
 class city_code(Variable):
     column = FixedStrCol(max_length = 5)
     entity = Famille
-    column.definition_period = ETERNITY
     label = u"""Code INSEE "city_code" de la commune de résidence de la famille"""
+    definition_period = ETERNITY
 
 
 class salaire_brut(Variable):
     column = FloatCol
     entity = Individu
     label = "Salaire brut"
+    definition_period = YEAR
 
 
 # Calculated variables
@@ -105,6 +109,7 @@ class age(Variable):
     column = IntCol
     entity = Individu
     label = u"Âge (en nombre d'années)"
+    definition_period = MONTH
 
     def function(self, simulation, period):
         birth = simulation.get_array('birth', period)
@@ -113,16 +118,16 @@ class age(Variable):
             if age_en_mois is not None:
                 return age_en_mois // 12
             birth = simulation.calculate('birth', period)
-        return (np.datetime64(period.date) - birth).astype('timedelta64[Y]')
+        return age_in_years(birth, period)
 
 
 class dom_tom(Variable):
     column = BoolCol
     entity = Famille
     label = u"La famille habite-t-elle les DOM-TOM ?"
+    definition_period = YEAR
 
     def function(self, simulation, period):
-        period = period.start.period('year').offset('first-of')
         city_code = simulation.calculate('city_code', period)
         return np.logical_or(startswith(city_code, '97'), startswith(city_code, '98'))
 
@@ -131,10 +136,10 @@ class revenu_disponible(Variable):
     column = FloatCol
     entity = Individu
     label = u"Revenu disponible de l'individu"
+    definition_period = YEAR
 
     def function(self, simulation, period):
-        period = period.start.period(u'year').offset('first-of')
-        rsa = simulation.calculate('rsa', period)
+        rsa = simulation.calculate_add('rsa', period)
         salaire_imposable = simulation.calculate('salaire_imposable', period)
         return rsa + salaire_imposable * 0.7
 
@@ -143,23 +148,21 @@ class rsa(DatedVariable):
     column = FloatCol
     entity = Individu
     label = u"RSA"
+    definition_period = MONTH
 
     @dated_function(datetime.date(2010, 1, 1))
     def function_2010(self, simulation, period):
-        period = period.start.period(u'month').offset('first-of')
-        salaire_imposable = simulation.calculate('salaire_imposable', period)
+        salaire_imposable = simulation.calculate_divide('salaire_imposable', period)
         return (salaire_imposable < 500) * 100.0
 
     @dated_function(datetime.date(2011, 1, 1), datetime.date(2012, 12, 31))
     def function_2011_2012(self, simulation, period):
-        period = period.start.period(u'month').offset('first-of')
-        salaire_imposable = simulation.calculate('salaire_imposable', period)
+        salaire_imposable = simulation.calculate_divide('salaire_imposable', period)
         return (salaire_imposable < 500) * 200.0
 
     @dated_function(datetime.date(2013, 1, 1))
     def function_2013(self, simulation, period):
-        period = period.start.period(u'month').offset('first-of')
-        salaire_imposable = simulation.calculate('salaire_imposable', period)
+        salaire_imposable = simulation.calculate_divide('salaire_imposable', period)
         return (salaire_imposable < 500) * 300
 
 
@@ -167,9 +170,9 @@ class salaire_imposable(Variable):
     column = FloatCol
     entity = Individu
     label = u"Salaire imposable"
+    definition_period = YEAR
 
     def function(individu, period):
-        period = period.start.period(u'year').offset('first-of')
         dom_tom = individu.famille('dom_tom', period)
         salaire_net = individu('salaire_net', period)
         return salaire_net * 0.9 - 100 * dom_tom
@@ -179,9 +182,9 @@ class salaire_net(Variable):
     column = FloatCol
     entity = Individu
     label = u"Salaire net"
+    definition_period = YEAR
 
     def function(self, simulation, period):
-        period = period.start.period(u'year').offset('first-of')
         salaire_brut = simulation.calculate('salaire_brut', period)
         return salaire_brut * 0.8
 
@@ -209,7 +212,7 @@ def check_revenu_disponible(year, city_code, expected_revenu_disponible):
     famille.members_legacy_role = np.array([PARENT1, PARENT2, PARENT1, PARENT2, PARENT1,
         PARENT2])
     simulation.get_or_new_holder("salaire_brut").array = np.array([0.0, 0.0, 50000.0, 0.0, 100000.0, 0.0])
-    revenu_disponible = simulation.calculate('revenu_disponible')
+    revenu_disponible = simulation.calculate('revenu_disponible', periods.period(year))
     assert_near(revenu_disponible, expected_revenu_disponible, absolute_error_margin = 0.005)
 
 
@@ -0,0 +1,319 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Measure how the calculation of a basic tax-benefit system scales with the size of the population.
+
+The tax-benefit system is the one of measure_performances.py, completed with aggregations of persons into families, a
+tax scale and dated formulas. For each population size, a synthetic population is generated, with a realistic
+distribution of the sizes of the families, and the script measures:
+- the time taken to build the simulation and to calculate the disposable income of the families
+- the peak memory of the process, and the memory held by the arrays of the simulation
+- the time spent in the formula of each variable, excluding the time spent calculating its dependencies
+
+The results can be written to a JSON file, and compared to the results of a previous run to detect regressions.
+"""
+
+
+from __future__ import division
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+import pkg_resources
+
+from openfisca_core import periods, simulations
+from openfisca_core.columns import FloatCol, IntCol
+from openfisca_core.formulas import dated_function
+from openfisca_core.periods import YEAR
+from openfisca_core.scripts.measure_performances import (age, age_en_mois, birth, city_code, dom_tom, Famille,
+    Individu, revenu_disponible, rsa, salaire_brut, salaire_imposable, salaire_net)
+from openfisca_core.taxbenefitsystems import TaxBenefitSystem
+from openfisca_core.taxscales import MarginalRateTaxScale
+from openfisca_core.variables import DatedVariable, Variable
+
+
+args = None
+
+# Share of the families of each size, from 1 to 6 persons
+FAMILY_SIZE_PROBABILITIES = [0.36, 0.32, 0.14, 0.12, 0.04, 0.02]
+# Share of the families of at least 2 persons which are couples, the others being single parents
+COUPLE_PROBABILITY = 0.75
+# Share of the adults without wages
+UNEMPLOYMENT_PROBABILITY = 0.2
+# Share of the families living in the DOM-TOM
+DOM_TOM_PROBABILITY = 0.03
+
+
+# Variables completing those of measure_performances.py
+
+
+bareme_impot = MarginalRateTaxScale(name = u'bareme_impot')
+bareme_impot.add_bracket(0, 0)
+bareme_impot.add_bracket(10000, 0.14)
+bareme_impot.add_bracket(26000, 0.30)
+bareme_impot.add_bracket(70000, 0.41)
+bareme_impot.add_bracket(150000, 0.45)
+
+
+class impot_revenu(Variable):
+    column = FloatCol
+    entity = Individu
+    label = u"Impôt sur le revenu"
+    definition_period = YEAR
+
+    def function(individu, period):
+        salaire_imposable = individu('salaire_imposable', period)
+        return bareme_impot.calc(salaire_imposable)
+
+
+class nombre_enfants(Variable):
+    column = IntCol
+    entity = Famille
+    label = u"Nombre d'enfants de moins de 20 ans de la famille"
+    definition_period = YEAR
+
+    def function(famille, period):
+        age = famille.members('age', period.first_month)
+        return famille.sum(age < 20, role = Famille.ENFANT)
+
+
+class allocations_familiales(DatedVariable):
+    column = FloatCol
+    entity = Famille
+    label = u"Allocations familiales"
+    definition_period = YEAR
+
+    @dated_function(datetime.date(2010, 1, 1), datetime.date(2012, 12, 31))
+    def function_2010_2012(famille, period):
+        nombre_enfants = famille('nombre_enfants', period)
+        return 1500. * np.maximum(nombre_enfants - 1, 0)
+
+    @dated_function(datetime.date(2013, 1, 1))
+    def function_2013(famille, period):
+        nombre_enfants = famille('nombre_enfants', period)
+        revenu_disponible = famille.sum(famille.members('revenu_disponible', period))
+        return np.where(revenu_disponible < 60000, 1600., 800.) * np.maximum(nombre_enfants - 1, 0)
+
+
+class revenu_disponible_famille(Variable):
+    column = FloatCol
+    entity = Famille
+    label = u"Revenu disponible de la famille"
+    definition_period = YEAR
+
+    def function(famille, period):
+        revenu_disponible = famille.members('revenu_disponible', period)
+        impot_revenu = famille.members('impot_revenu', period)
+        allocations_familiales = famille('allocations_familiales', period)
+        return famille.sum(revenu_disponible - impot_revenu) + allocations_familiales
+
+
+tax_benefit_system = TaxBenefitSystem([Famille, Individu])
+tax_benefit_system.add_variables(age_en_mois, birth, city_code, salaire_brut, age, dom_tom, revenu_disponible, rsa,
+    salaire_imposable, salaire_net, impot_revenu, nombre_enfants, allocations_familiales, revenu_disponible_famille)
+
+
+# Synthetic populations
+
+
+def build_simulation(persons_count, year, random_state):
+    """Build a simulation of a synthetic population of `persons_count` persons, living in families."""
+    period = periods.period(year)
+    family_sizes = random_state.choice(np.arange(1, len(FAMILY_SIZE_PROBABILITIES) + 1), size = persons_count,
+        p = FAMILY_SIZE_PROBABILITIES)
+    families_count = np.searchsorted(np.cumsum(family_sizes), persons_count) + 1
+    family_sizes = family_sizes[:families_count]
+    family_sizes[-1] -= family_sizes.sum() - persons_count
+    members_entity_id = np.repeat(np.arange(families_count), family_sizes)
+    members_position = np.arange(persons_count) - np.repeat(np.cumsum(family_sizes) - family_sizes, family_sizes)
+    is_couple = (family_sizes >= 2) & (random_state.random_sample(families_count) < COUPLE_PROBABILITY)
+    # Legacy roles: 0 for the first parent, 1 for the second one, and 2 and more for the children.
+    members_legacy_role = np.where(
+        is_couple[members_entity_id] | (members_position == 0),
+        members_position,
+        members_position + 1,
+        )
+    is_child = members_legacy_role >= 2
+
+    simulation = simulations.Simulation(period = period, tax_benefit_system = tax_benefit_system,
+        cache_statistics = True)
+    famille = simulation.entities['famille']
+    famille.count = families_count
+    famille.roles_count = members_legacy_role.max() + 1
+    famille.step_size = 1
+    famille.members_entity_id = members_entity_id
+    famille.members_legacy_role = members_legacy_role
+    flattened_roles = np.empty(len(Famille.flattened_roles), dtype = object)
+    flattened_roles[:] = Famille.flattened_roles
+    famille.members_role = flattened_roles[np.minimum(members_legacy_role, len(flattened_roles) - 1)]
+    individu = simulation.entities['individu']
+    individu.count = persons_count
+    individu.step_size = 1
+
+    age_in_days = np.where(
+        is_child,
+        random_state.randint(0, 25 * 365, size = persons_count),
+        random_state.randint(20 * 365, 80 * 365, size = persons_count),
+        )
+    simulation.get_or_new_holder('birth').array = np.datetime64(period.start.date) - age_in_days
+    has_wages = ~is_child & (random_state.random_sample(persons_count) >= UNEMPLOYMENT_PROBABILITY)
+    simulation.get_or_new_holder('salaire_brut').array = np.where(
+        has_wages,
+        random_state.lognormal(np.log(25000), 0.6, size = persons_count),
+        0.,
+        ).astype(np.float32)
+    simulation.get_or_new_holder('city_code').array = np.where(
+        random_state.random_sample(families_count) < DOM_TOM_PROBABILITY,
+        '97123',
+        '75101',
+        )
+    return simulation
+
+
+# Measures
+
+
+def measure(persons_count):
+    """Build and calculate a simulation of `persons_count` persons, and return its measures."""
+    random_state = np.random.RandomState(args.seed)
+    best_measures = None
+    for _ in range(args.repeat):
+        start_time = time.time()
+        simulation = build_simulation(persons_count, args.year, random_state)
+        build_time = time.time() - start_time
+        start_time = time.time()
+        simulation.calculate('revenu_disponible_famille', periods.period(args.year))
+        calculate_time = time.time() - start_time
+        if best_measures is not None and calculate_time >= best_measures['calculate_time']:
+            continue
+        statistics_by_variable_name = simulation.cache_statistics.to_dict()
+        best_measures = dict(
+            build_time = build_time,
+            calculate_time = calculate_time,
+            families_count = simulation.entities['famille'].count,
+            formulas = dict(
+                (variable_name, dict(
+                    computations = statistics['computations'],
+                    computation_time = statistics['computation_time'],
+                    ))
+                for variable_name, statistics in statistics_by_variable_name.iteritems()
+                if statistics['computations'] > 0
+                ),
+            nbytes = sum(statistics['nbytes'] for statistics in statistics_by_variable_name.itervalues()),
+            persons_count = persons_count,
+            )
+    # ru_maxrss is in kilobytes on Linux.
+    best_measures['peak_memory'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return best_measures
+
+
+def measure_in_new_process(persons_count):
+    # Each size is measured in a new process, so that the peak memory of a size doesn't include the previous ones.
+    pool = multiprocessing.Pool(1, initializer = _initialize_worker, initargs = (args,))
+    try:
+        return pool.apply(measure, (persons_count,))
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _initialize_worker(worker_args):
+    global args
+    args = worker_args
+
+
+def compare(results, reference_results):
+    """Print the measures which are slower or bigger than the reference ones, and return their number."""
+    reference_measures_by_persons_count = dict(
+        (measures['persons_count'], measures)
+        for measures in reference_results['measures']
+        )
+    regressions_count = 0
+    for measures in results['measures']:
+        reference_measures = reference_measures_by_persons_count.get(measures['persons_count'])
+        if reference_measures is None:
+            continue
+        for key in ('build_time', 'calculate_time', 'peak_memory', 'nbytes'):
+            ratio = measures[key] / reference_measures[key] if reference_measures[key] else 1.
+            if ratio > 1 + args.tolerance:
+                regressions_count += 1
+                print(u'Regression for {} persons: {} is {:.2f} times the reference ({} instead of {})'.format(
+                    measures['persons_count'], key, ratio, measures[key], reference_measures[key]).encode('utf-8'))
+    return regressions_count
+
+
+def print_measures(measures):
+    print(u'{persons_count} persons in {families_count} families: build {build_time:.3f} s, calculate '
+        u'{calculate_time:.3f} s, peak memory {peak_memory_mb:.1f} MB, arrays {nbytes_mb:.1f} MB'.format(
+            nbytes_mb = measures['nbytes'] / 1e6,
+            peak_memory_mb = measures['peak_memory'] / 1e6,
+            **measures
+            ).encode('utf-8'))
+    for variable_name, formula_measures in sorted(
+            measures['formulas'].iteritems(),
+            key = lambda (variable_name, formula_measures): -formula_measures['computation_time'],
+            )[:args.formulas_count]:
+        print(u'  {:8.3f} s  {} ({} computations)'.format(formula_measures['computation_time'], variable_name,
+            formula_measures['computations']).encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default = [1000, 10000, 100000, 1000000], nargs = '+', type = int,
+        help = "numbers of persons of the populations to measure, e.g. 1000 up to 10000000")
+    parser.add_argument('--year', default = 2013, type = int, help = "year of the simulations")
+    parser.add_argument('--repeat', default = 3, type = int,
+        help = "number of measures of each size, the fastest being kept")
+    parser.add_argument('--seed', default = 1, type = int, help = "seed of the generation of the populations")
+    parser.add_argument('--formulas-count', default = 5, type = int,
+        help = "number of the slowest formulas to print for each size")
+    parser.add_argument('-o', '--output', default = None, help = "path of the JSON file to write the results into")
+    parser.add_argument('--compare', default = None,
+        help = "path of a JSON file of previous results, to report the measures exceeding them")
+    parser.add_argument('--tolerance', default = 0.2, type = float,
+        help = "relative increase of a measure above which it is reported as a regression")
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    global args
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    results = dict(
+        environment = dict(
+            numpy = np.__version__,
+            openfisca_core = pkg_resources.get_distribution('OpenFisca-Core').version,
+            platform = platform.platform(),
+            python = platform.python_version(),
+            ),
+        measures = [],
+        repeat = args.repeat,
+        seed = args.seed,
+        year = args.year,
+        )
+    for persons_count in args.sizes:
+        measures = measure_in_new_process(persons_count)
+        print_measures(measures)
+        results['measures'].append(measures)
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent = 2, sort_keys = True)
+    if args.compare is not None:
+        with open(args.compare) as reference_file:
+            reference_results = json.load(reference_file)
+        if compare(results, reference_results) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Measure the time taken to build the tax and benefit system of a country package, from a cold start.
+
+Each measure is done in a new process, which imports the country package, builds its tax and benefit system, and loads
+its parameters. The time spent is broken down by phase (import of the modules of variables, introspection of their
+source code, build of their columns, parse and conversion of the parameters), and by file.
+
+The results can be written to a JSON file, and checked against a time budget.
+"""
+
+
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import platform
+import sys
+import time
+
+import numpy as np
+import pkg_resources
+
+from openfisca_core import startup_statistics
+from openfisca_core.scripts import add_tax_benefit_system_arguments, build_tax_benefit_sytem
+
+
+args = None
+
+
+def measure():
+    """Build the tax and benefit system, and return the time spent in total and by phase and file."""
+    statistics = startup_statistics.enable()
+    start_time = time.time()
+    if args.country_package is not None:
+        importlib.import_module(args.country_package)
+    package_import_time = time.time() - start_time
+    tax_benefit_system = build_tax_benefit_sytem(args.country_package, args.extensions, args.reforms)
+    tax_benefit_system.get_legislation()
+    total = time.time() - start_time
+    startup_statistics.disable()
+    measures = statistics.to_dict()
+    measures['table'] = statistics.to_table(count = args.files_count)
+    measures['total'] = total
+    measures['phases']['package_import'] = package_import_time
+    # Time spent outside of the measured phases, e.g. building the entities.
+    measures['phases']['other'] = total - sum(measures['phases'].itervalues())
+    return measures
+
+
+def measure_in_new_process():
+    # Each measure is done in a new process, so that the modules of the country package are not imported yet.
+    pool = multiprocessing.Pool(1, initializer = _initialize_worker, initargs = (args,))
+    try:
+        return pool.apply(measure)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _initialize_worker(worker_args):
+    global args
+    args = worker_args
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser = add_tax_benefit_system_arguments(parser)
+    parser.add_argument('--repeat', default = 3, type = int, help = "number of measures, the fastest being kept")
+    parser.add_argument('--files-count', default = 10, type = int, help = "number of the slowest files to print")
+    parser.add_argument('-o', '--output', default = None, help = "path of the JSON file to write the results into")
+    parser.add_argument('--budget', default = None, type = float,
+        help = "maximal time in seconds to build the tax and benefit system. The script fails when it is exceeded.")
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    global args
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    measures = min(
+        (measure_in_new_process() for _ in range(args.repeat)),
+        key = lambda measures: measures['total'],
+        )
+    print(u'Tax and benefit system built in {:.3f} seconds, including {:.3f} seconds importing the country package '
+        u'and {:.3f} seconds outside of the measured phases'.format(measures['total'],
+            measures['phases']['package_import'], measures['phases']['other']).encode('utf-8'))
+    print(measures.pop('table').encode('utf-8'))
+
+    if args.output is not None:
+        results = dict(
+            environment = dict(
+                numpy = np.__version__,
+                openfisca_core = pkg_resources.get_distribution('OpenFisca-Core').version,
+                platform = platform.platform(),
+                python = platform.python_version(),
+                ),
+            country_package = args.country_package,
+            extensions = args.extensions,
+            reforms = args.reforms,
+            repeat = args.repeat,
+            **measures
+            )
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent = 2, sort_keys = True)
+    if args.budget is not None and measures['total'] > args.budget:
+        print(u'The budget of {} seconds is exceeded'.format(args.budget).encode('utf-8'))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import json
 import logging
 import sys
 import os
 
-from openfisca_core.tools.test_runner import run_tests
+from openfisca_core.tools.test_runner import run_tests, run_tests_in_parallel, TestDependencies, TestTimings
 from openfisca_core.scripts import add_tax_benefit_system_arguments, build_tax_benefit_sytem
 
 
@@ -14,6 +15,14 @@ def build_parser():
     parser.add_argument('path', help = "paths (files or directories) of tests to execute", nargs = '+')
     parser = add_tax_benefit_system_arguments(parser)
     parser.add_argument('-n', '--name_filter', default = None, help = "partial name of tests to execute. Only tests with the given name_filter in their name, file name, or keywords will be run.")
+    parser.add_argument('-b', '--batch', action = 'store_true', default = False, help = "run compatible tests together, in a single simulation. Tests which don't pass are run again individually to report their errors.")
+    parser.add_argument('-j', '--jobs', default = 1, type = int, help = "number of processes running the test files in parallel")
+    parser.add_argument('-t', '--timings', action = 'store_true', default = False, help = "print the slowest tests and files once the tests are run")
+    parser.add_argument('--timings-json', default = None, help = "path of a JSON file to write the time spent by each test and file into")
+    parser.add_argument('--dependencies', default = None, help = "path of a JSON file indexing the variables and parameters used by each test")
+    parser.add_argument('--record-dependencies', action = 'store_true', default = False, help = "record the variables and parameters used by the tests run into the --dependencies file")
+    parser.add_argument('--changed', default = None, nargs = '+', help = "names of changed variables or parameters. Only tests using them according to the --dependencies file, or missing from it, will be run.")
+    parser.add_argument('--cache-dir', default = None, help = "directory to cache the parsed and converted test files into. Unchanged test files are loaded from the cache.")
     parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
 
     return parser
@@ -26,19 +35,56 @@ def main():
 
     tax_benefit_system = build_tax_benefit_sytem(args.country_package, args.extensions, args.reforms)
 
+    if (args.record_dependencies or args.changed) and args.dependencies is None:
+        parser.error(u'--record-dependencies and --changed require --dependencies')
+    # Paths are stored relative to the index file, so that it can be used in another checkout.
+    dependencies = TestDependencies(root_dir = os.path.dirname(os.path.abspath(args.dependencies))) \
+        if args.dependencies is not None else None
+    if dependencies is not None and os.path.exists(args.dependencies):
+        with open(args.dependencies) as dependencies_file:
+            dependencies.update_from_json(json.load(dependencies_file))
+
     options = {
         'verbose': args.verbose,
         'name_filter': args.name_filter,
+        'batch': args.batch,
+        'timings': TestTimings() if args.timings or args.timings_json else None,
+        'dependencies': dependencies,
+        'record_dependencies': args.record_dependencies,
+        'cache_dir': args.cache_dir,
+        'changed': [name.decode('utf-8') for name in args.changed] if args.changed else None,
         }
 
     tests_found = False
 
-    for path in args.path:
-        path = os.path.abspath(path)
-        nb_tests = run_tests(tax_benefit_system, path, options)
-        tests_found = tests_found or nb_tests > 0
+    try:
+        if args.jobs > 1:
+            paths = [os.path.abspath(path) for path in args.path]
+            tests_found = run_tests_in_parallel(tax_benefit_system, paths, options, processes = args.jobs) > 0
+        else:
+            for path in args.path:
+                path = os.path.abspath(path)
+                nb_tests = run_tests(tax_benefit_system, path, options)
+                tests_found = tests_found or nb_tests > 0
+    finally:
+        # Timings are also reported when a test fails.
+        timings = options['timings']
+        if args.timings:
+            print(timings.to_table().encode('utf-8'))
+        if args.timings_json:
+            with open(args.timings_json, 'w') as timings_file:
+                json.dump(timings.to_json(), timings_file, indent = 2)
+        # The dependencies are also written when a test fails, including those of the failing test. The index of an
+        # interrupted run is still safe to use: the existing records have been loaded first, and tests which have not
+        # been recorded are always run.
+        if args.record_dependencies:
+            with open(args.dependencies, 'w') as dependencies_file:
+                json.dump(dependencies.to_json(), dependencies_file, indent = 2)
 
     if not tests_found:
+        if args.changed:
+            print("No tests affected by the changes.")
+            sys.exit(0)
         print("No tests found!")
         sys.exit(1)
 
@@ -2,17 +2,84 @@
 
 
 import collections
+import threading
+from multiprocessing.pool import ThreadPool
 
-from . import periods, holders
+import numpy as np
+
+from . import data_storage, periods, holders
+from .cache_statistics import CacheStatistics
 from .commons import empty_clone, stringify_array
 
 
+class CycleDetectionState(threading.local):
+    """Per-thread state used to detect circular definitions. See use in formulas.py.
+
+    Each thread calculating formulas of a simulation has its own stack of requested periods, so that independent
+    formulas can be calculated concurrently (see Simulation.calculate_many).
+    """
+    def __init__(self):
+        # The data structure of requested_periods_by_variable_name is: {variable_name: [period1, period2]}
+        self.requested_periods_by_variable_name = {}
+        self.max_nb_cycles = None
+
+
+class ConcurrentComputations(object):
+    """Let a single thread calculate a value, while the other threads requesting it wait for it to be cached.
+
+    See Simulation.calculate_many. A thread which would end up waiting for itself, e.g. when circular definitions are
+    allowed by max_nb_cycles, calculates the value without waiting.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._thread_by_key = {}  # Thread calculating each value
+        self._key_by_waiting_thread = {}
+
+    def acquire(self, key):
+        """Wait until no other thread calculates the value `key`, and mark it as calculated by the current thread.
+
+        Return False, without waiting, when the current thread already calculates this value, or when it would wait
+        for itself. Otherwise, return True, and release must be called once the value is calculated.
+        """
+        thread = threading.current_thread()
+        with self._condition:
+            while True:
+                calculating_thread = self._thread_by_key.get(key)
+                if calculating_thread is None:
+                    self._thread_by_key[key] = thread
+                    return True
+                if self._waits_for(calculating_thread, thread):
+                    return False
+                self._key_by_waiting_thread[thread] = key
+                self._condition.wait()
+                del self._key_by_waiting_thread[thread]
+
+    def release(self, key):
+        with self._condition:
+            del self._thread_by_key[key]
+            self._condition.notify_all()
+
+    def _waits_for(self, thread, other_thread):
+        """Tell whether `thread` is `other_thread` or waits, directly or not, for a value calculated by it."""
+        while thread is not None:
+            if thread is other_thread:
+                return True
+            key = self._key_by_waiting_thread.get(thread)
+            thread = self._thread_by_key.get(key) if key is not None else None
+        return False
+
+
 class Simulation(object):
     compact_legislation_by_instant_cache = None
     debug = False
     debug_all = False  # When False, log only formula calls with non-default parameters.
     period = None
     reference_compact_legislation_by_instant_cache = None
+    axes_compression = None
+    cache_statistics = None
+    concurrent_computations = None  # Set while variables are calculated concurrently (see calculate_many)
+    memory_config = None
+    shared_data = None
     stack_trace = None
     steps_count = 1
     tax_benefit_system = None
@@ -20,16 +87,16 @@ class Simulation(object):
     traceback = None
 
     def __init__(self, debug = False, debug_all = False, period = None, tax_benefit_system = None,
-    trace = False, opt_out_cache = False):
+    trace = False, opt_out_cache = False, shared_data = None, memory_config = None,
+    cache_statistics = False):
         assert isinstance(period, periods.Period)
         self.period = period
         self.holder_by_name = {}
+        # Holders may be requested concurrently by several threads (see calculate_many).
+        self._holders_lock = threading.Lock()
 
         # To keep track of the values (formulas and periods) being calculated to detect circular definitions.
-        # See use in formulas.py.
-        # The data structure of requested_periods_by_variable_name is: {variable_name: [period1, period2]}
-        self.requested_periods_by_variable_name = {}
-        self.max_nb_cycles = None
+        self._cycle_detection_state = CycleDetectionState()
 
         if debug:
             self.debug = True
@@ -49,6 +116,12 @@ class Simulation(object):
         self.compact_legislation_by_instant_cache = {}
         self.reference_compact_legislation_by_instant_cache = {}
 
+        # Arrays shared with other processes (see data_storage.publish_simulation), used by entities and holders.
+        self.shared_data = shared_data
+        self.memory_config = memory_config
+        if cache_statistics:
+            self.cache_statistics = CacheStatistics(self)
+
         self.instantiate_entities()
 
     def instantiate_entities(self):
@@ -61,6 +134,119 @@ class Simulation(object):
             self.entities[entity_definition.key] = entity
             setattr(self, entity.key, entity)
 
+        if self.shared_data is not None:
+            for entity in self.entities.itervalues():
+                self.shared_data.attach_entity(entity)
+
+    @classmethod
+    def from_arrays(cls, tax_benefit_system, period, persons_count = None, groups = None, inputs = None, **kwargs):
+        """Create a simulation directly from columnar arrays, e.g. loaded from a survey.
+
+        :param groups: Composition of the group entities, as a dict ``{entity_key: {'members_entity_id': array,
+            'members_role': array}}``. ``members_entity_id`` gives the index of the entity of each person, and
+            ``members_role`` (optional) the index of the role of each person in ``entity.flattened_roles``. When an
+            entity is missing, each person is alone in its own entity, with the first role.
+        :param inputs: Values of input variables, as a dict ``{variable_name: array}`` for `period`, or
+            ``{variable_name: {period: array}}``.
+
+        Arrays whose dtype is the one of their variable are used without being copied. Other keyword arguments are
+        forwarded to the :any:`Simulation` constructor.
+        """
+        if not isinstance(period, periods.Period):
+            period = periods.period(period)
+        groups = groups or {}
+        inputs = inputs or {}
+        simulation = cls(period = period, tax_benefit_system = tax_benefit_system, **kwargs)
+        persons = simulation.persons
+
+        if persons_count is None:
+            persons_count = next(
+                (len(group['members_entity_id']) for group in groups.itervalues()),
+                None,
+                )
+        if persons_count is None:
+            persons_count = next(
+                (
+                    len(value.itervalues().next() if isinstance(value, dict) else value)
+                    for variable_name, value in inputs.iteritems()
+                    if tax_benefit_system.get_column(variable_name, check_existence = True).entity.is_person
+                    if not isinstance(value, dict) or value
+                    ),
+                1,
+                )
+        persons.count = persons.step_size = persons_count
+
+        for entity in simulation.entities.itervalues():
+            if entity.is_person:
+                continue
+            group = groups.get(entity.key, {})
+            members_entity_id = group.get('members_entity_id')
+            if members_entity_id is None:
+                members_entity_id = np.arange(persons_count, dtype = np.int32)
+            members_entity_id = np.asarray(members_entity_id)
+            members_role_index = group.get('members_role')
+            if members_role_index is None:
+                members_role_index = np.zeros(persons_count, dtype = np.int16)
+            members_role_index = np.asarray(members_role_index)
+            for array_name, array in (('members_entity_id', members_entity_id), ('members_role', members_role_index)):
+                if array.shape != (persons_count,) or array.dtype.kind not in 'iu':
+                    raise ValueError(u'{} of entity {} must be an array of {} integers. Got: {!r}'.format(
+                        array_name, entity.key, persons_count, array).encode('utf-8'))
+            entity_count = members_entity_id.max() + 1 if persons_count else 0
+            if persons_count and (members_entity_id.min() < 0 or np.bincount(members_entity_id).min() == 0):
+                raise ValueError(u'Each {} must have at least one member.'.format(entity.key).encode('utf-8'))
+            roles_count = len(entity.flattened_roles)
+            if persons_count and not 0 <= members_role_index.min() <= members_role_index.max() < roles_count:
+                raise ValueError(u'Invalid role index for entity {}: roles are {}.'.format(
+                    entity.key, [role.key for role in entity.flattened_roles]).encode('utf-8'))
+
+            flattened_roles = np.empty(len(entity.flattened_roles), dtype = object)
+            flattened_roles[:] = entity.flattened_roles
+            entity.count = entity.step_size = entity_count
+            entity.members_entity_id = members_entity_id
+            entity.members_role = flattened_roles[members_role_index]
+            entity.members_legacy_role = get_members_legacy_role(entity, members_entity_id, members_role_index)
+            entity.roles_count = entity.members_legacy_role.max() + 1 if persons_count else 0
+
+        # Note: For set_input to work, handle days, before months, before years => use sorted().
+        for variable_name, value in sorted(inputs.iteritems()):
+            holder = simulation.get_or_new_holder(variable_name)
+            column = holder.column
+            array_by_period = value if isinstance(value, dict) else {period: value}
+            array_by_period = dict(
+                (
+                    input_period if isinstance(input_period, periods.Period) else periods.period(input_period),
+                    array,
+                    )
+                for input_period, array in array_by_period.iteritems()
+                )
+            column_dtype = np.dtype(column.dtype)
+            for input_period in sorted(array_by_period, cmp = periods.compare_period_size):
+                array = np.asarray(array_by_period[input_period])
+                if array.dtype != column_dtype:
+                    if not np.can_cast(array.dtype, column_dtype, casting = 'same_kind'):
+                        raise ValueError(u'Unable to use an array of {} for variable {} of type {}.'.format(
+                            array.dtype, variable_name, column_dtype).encode('utf-8'))
+                    array = array.astype(column_dtype)
+                if array.shape != (holder.entity.count,):
+                    raise ValueError(u'Expected an array of size {} for variable {}. Got: {}.'.format(
+                        holder.entity.count, variable_name, array.shape).encode('utf-8'))
+                holder.set_input(input_period, array)
+
+        return simulation
+
+    @property
+    def max_nb_cycles(self):
+        return self._cycle_detection_state.max_nb_cycles
+
+    @max_nb_cycles.setter
+    def max_nb_cycles(self, max_nb_cycles):
+        self._cycle_detection_state.max_nb_cycles = max_nb_cycles
+
+    @property
+    def requested_periods_by_variable_name(self):
+        return self._cycle_detection_state.requested_periods_by_variable_name
+
     def calculate(self, column_name, period, **parameters):
         return self.compute(column_name, period = period, **parameters).array
 
@@ -70,6 +256,56 @@ class Simulation(object):
     def calculate_divide(self, column_name, period, **parameters):
         return self.compute_divide(column_name, period = period, **parameters).array
 
+    def calculate_many(self, requested_variables, period = None, max_workers = 1):
+        """Calculate several variables, and return an OrderedDict {(variable_name, period): array}.
+
+        requested_variables is an iterable of variable names (calculated for `period`) or of
+        (variable_name, period) couples.
+
+        When max_workers > 1, the requested variables are calculated concurrently by a pool of threads. As NumPy
+        releases the GIL during large array operations, this speeds up the calculation of independent branches of
+        the formulas dependency graph. The values calculated by a thread are put in the simulation cache, and are
+        thus reused by the other threads. Holders are created under a lock, so that all threads share them, and a
+        dependency requested at the same time by several threads is calculated by one of them, while the others wait
+        for it (see ConcurrentComputations).
+
+        The other shared states rely on the atomicity of dict and set operations under the GIL: the memo of the dated
+        formulas (DatedFormula.dated_formula_index_by_start_instant) may be filled twice with the same index, and the
+        index of the known periods of the holders is replaced as a whole on every update. The accounting of
+        memory_config has its own lock.
+        """
+        requests = []
+        for requested_variable in requested_variables:
+            if isinstance(requested_variable, basestring):
+                variable_name, variable_period = requested_variable, period
+            else:
+                variable_name, variable_period = requested_variable
+            if variable_period is not None and not isinstance(variable_period, periods.Period):
+                variable_period = periods.period(variable_period)
+            requests.append((variable_name, variable_period))
+
+        def calculate_request(request):
+            variable_name, variable_period = request
+            return self.calculate(variable_name, variable_period)
+
+        if max_workers <= 1 or len(requests) <= 1:
+            arrays = [calculate_request(request) for request in requests]
+        else:
+            if self.debug or self.trace:
+                raise ValueError(
+                    u'Variables can not be calculated concurrently in debug or trace mode, as the trace of a '
+                    u'simulation is a single stack. Use max_workers = 1 to calculate them.'.encode('utf-8'))
+            pool = ThreadPool(min(max_workers, len(requests)))
+            self.concurrent_computations = ConcurrentComputations()
+            try:
+                arrays = pool.map(calculate_request, requests)
+            finally:
+                pool.close()
+                pool.join()
+                del self.concurrent_computations
+
+        return collections.OrderedDict(zip(requests, arrays))
+
     def calculate_output(self, column_name, period):
         """Calculate the value using calculate_output hooks in formula classes."""
         if period is not None and not isinstance(period, periods.Period):
@@ -86,8 +322,13 @@ class Simulation(object):
             if key not in ('debug', 'debug_all', 'trace'):
                 new_dict[key] = value
 
+        new_dict['persons'] = self.persons.clone(new)
+        new_dict['entities'] = {self.persons.key: new.persons}
+        for key, entity in self.entities.iteritems():
+            if key != self.persons.key:
+                new_dict['entities'][key] = entity.clone(new)
         for entity in new.entities.itervalues():
-            entity.simulation = new
+            new_dict[entity.key] = entity
 
         if debug:
             new_dict['debug'] = True
@@ -98,13 +339,35 @@ class Simulation(object):
         if debug or trace:
             new_dict['stack_trace'] = collections.deque()
             new_dict['traceback'] = collections.OrderedDict()
+            # Traced legislations refer to the simulation tracing them, and must not be shared with the original.
+            new_dict['compact_legislation_by_instant_cache'] = {}
+            new_dict['reference_compact_legislation_by_instant_cache'] = {}
+        new_dict['_cycle_detection_state'] = CycleDetectionState()
+        new_dict['_holders_lock'] = threading.Lock()
+        # The inputs of the clone may be modified: its variables can't be assumed to be invariant along axes.
+        new_dict['axes_compression'] = None
+        if self.cache_statistics is not None:
+            new_dict['cache_statistics'] = CacheStatistics(new)
+        if self.memory_config is not None:
+            new_dict['memory_config'] = self.memory_config.clone()
 
         new_dict['holder_by_name'] = {
-            name: holder.clone()
+            name: holder.clone(new)
             for name, holder in self.holder_by_name.iteritems()
             }
         return new
 
+    def save_cache(self, path):
+        """Save the values known by the simulation into the file `path`, to warm-start another simulation."""
+        data_storage.save_simulation_cache(self, path)
+
+    def load_cache(self, path):
+        """Load the values saved by :any:`save_cache` into the simulation cache.
+
+        Raise a ``ValueError`` when the file has been saved for another tax and benefit system or another population.
+        """
+        data_storage.load_simulation_cache(self, path)
+
     def compute(self, column_name, period, **parameters):
         if period is not None and not isinstance(period, periods.Period):
             period = periods.period(period)
@@ -171,13 +434,24 @@ class Simulation(object):
     def get_or_new_holder(self, column_name):
         holder = self.holder_by_name.get(column_name)
         if holder is None:
-            column = self.tax_benefit_system.get_column(column_name, check_existence = True)
-            self.holder_by_name[column_name] = holder = holders.Holder(
-                self,
-                column = column,
-                )
-            if column.formula_class is not None:
-                holder.formula = column.formula_class(holder = holder)
+            with self._holders_lock:
+                holder = self.holder_by_name.get(column_name)
+                if holder is None:
+                    holder = self._new_holder(column_name)
+        return holder
+
+    def _new_holder(self, column_name):
+        column = self.tax_benefit_system.get_column(column_name, check_existence = True)
+        holder = holders.Holder(
+            self,
+            column = column,
+            )
+        if column.formula_class is not None:
+            holder.formula = column.formula_class(holder = holder)
+        if self.shared_data is not None:
+            self.shared_data.attach_holder(holder)
+        # Published once complete, so that other threads don't get a holder without its formula or its shared arrays.
+        self.holder_by_name[column_name] = holder
         return holder
 
     def get_reference_compact_legislation(self, instant):
@@ -238,3 +512,38 @@ class Simulation(object):
 
     def get_entity(self, entity_type):
         return self.entities[entity_type.key]
+
+
+def get_members_legacy_role(entity, members_entity_id, members_role_index):
+    """Compute the legacy roles of the members of a group entity, as scenarios do for test cases.
+
+    The legacy role of a person is the position of its role in the entity, plus its rank among the members of its
+    entity having the same role (for roles without subroles).
+    """
+    first_legacy_role_by_role_index = []
+    is_subrole_by_role_index = []
+    first_legacy_role = 0
+    for role in entity.roles:
+        if role.subroles:
+            first_legacy_role_by_role_index.extend(range(first_legacy_role, first_legacy_role + len(role.subroles)))
+            is_subrole_by_role_index.extend([True] * len(role.subroles))
+        else:
+            first_legacy_role_by_role_index.append(first_legacy_role)
+            is_subrole_by_role_index.append(False)
+        first_legacy_role += role.max or 1
+    members_legacy_role = np.array(first_legacy_role_by_role_index, dtype = np.int32)[members_role_index]
+    if members_entity_id.size == 0:
+        return members_legacy_role
+
+    # Rank of each person among the persons of the same entity with the same role, in persons order.
+    order = np.lexsort((np.arange(members_entity_id.size), members_role_index, members_entity_id))
+    sorted_entity_id = members_entity_id[order]
+    sorted_role_index = members_role_index[order]
+    is_group_start = np.empty(order.size, dtype = np.bool)
+    is_group_start[0] = True
+    is_group_start[1:] = (sorted_entity_id[1:] != sorted_entity_id[:-1]) | (sorted_role_index[1:] != sorted_role_index[:-1])
+    positions = np.arange(order.size)
+    ranks = np.empty(order.size, dtype = np.int32)
+    ranks[order] = positions - np.maximum.accumulate(np.where(is_group_start, positions, 0))
+    members_legacy_role += np.where(np.array(is_subrole_by_role_index)[members_role_index], 0, ranks)
+    return members_legacy_role
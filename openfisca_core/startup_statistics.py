@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+
+"""Instrumentation of the construction of tax and benefit systems: time spent by phase, and by file.
+
+Enable it with :func:`enable` before building a tax and benefit system, e.g. ``CountryTaxBenefitSystem()``. When
+disabled (the default), the only overhead is a function call by measured step.
+"""
+
+
+import collections
+import contextlib
+import threading
+import time
+
+
+PHASES = (
+    u'import',  # Import of the modules of variables
+    u'introspection',  # Read of the source code and comments of variables
+    u'column',  # Build of the columns and formulas of variables
+    u'legislation_parsing',  # Parse and validation of the XML files of parameters
+    u'legislation_conversion',  # Conversion of the XML trees of parameters to JSON, and their merge
+    )
+
+current = None  # StartupStatistics filled when enabled
+
+
+def enable():
+    """Start measuring the construction of tax and benefit systems, and return the new :any:`StartupStatistics`."""
+    global current
+    current = StartupStatistics()
+    return current
+
+
+def disable():
+    global current
+    current = None
+
+
+@contextlib.contextmanager
+def measure(phase):
+    """Measure the time spent in a phase, for the file being loaded if any."""
+    statistics = current
+    if statistics is None:
+        yield
+        return
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        statistics.record(phase, time.time() - start_time)
+
+
+@contextlib.contextmanager
+def loading_file(file_path):
+    """Attribute the phases measured while a file is loaded to this file."""
+    statistics = current
+    if statistics is None:
+        yield
+        return
+    statistics.files_stack.append(file_path)
+    try:
+        yield
+    finally:
+        statistics.files_stack.pop()
+
+
+class StartupStatistics(object):
+    """Time spent in each phase of the construction of tax and benefit systems, by file.
+
+    Phases measured outside of any file, e.g. for variables added by :any:`TaxBenefitSystem.add_variables`, are
+    attributed to the file None.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seconds_by_phase_by_file = collections.OrderedDict()
+        self.files_stack = []
+
+    def record(self, phase, seconds):
+        file_path = self.files_stack[-1] if self.files_stack else None
+        with self._lock:
+            seconds_by_phase = self._seconds_by_phase_by_file.get(file_path)
+            if seconds_by_phase is None:
+                seconds_by_phase = self._seconds_by_phase_by_file[file_path] = dict.fromkeys(PHASES, 0.)
+            seconds_by_phase[phase] += seconds
+
+    def get_files_statistics(self):
+        """Return the time spent in each phase for each file, the slowest file first."""
+        with self._lock:
+            files_statistics = [
+                dict(seconds_by_phase, file = file_path, total = sum(seconds_by_phase.itervalues()))
+                for file_path, seconds_by_phase in self._seconds_by_phase_by_file.iteritems()
+                ]
+        return sorted(files_statistics, key = lambda file_statistics: -file_statistics['total'])
+
+    def get_phases_statistics(self):
+        """Return the time spent in each phase, for all the files."""
+        files_statistics = self.get_files_statistics()
+        return collections.OrderedDict(
+            (phase, sum(file_statistics[phase] for file_statistics in files_statistics))
+            for phase in PHASES
+            )
+
+    def to_dict(self):
+        return dict(
+            files = self.get_files_statistics(),
+            phases = self.get_phases_statistics(),
+            )
+
+    def to_table(self, count = 10):
+        """Return a text summary of the time spent in each phase, and of the `count` slowest files."""
+        lines = [u'Time spent by phase (seconds):']
+        for phase, seconds in self.get_phases_statistics().iteritems():
+            lines.append(u'  {:8.3f}  {}'.format(seconds, phase))
+        lines.append(u'Slowest files (seconds: total = {}):'.format(u' + '.join(PHASES)))
+        for file_statistics in self.get_files_statistics()[:count]:
+            lines.append(u'  {:8.3f} = {}  {}'.format(
+                file_statistics['total'],
+                u' + '.join(u'{:.3f}'.format(file_statistics[phase]) for phase in PHASES),
+                file_statistics['file'] or u'(no file)',
+                ))
+        return u'\n'.join(lines)
@@ -2,18 +2,20 @@
 
 
 import glob
+import hashlib
 from inspect import isclass
 from os import path
 from imp import find_module, load_module
 import importlib
 import logging
 import inspect
+import json
 import pkg_resources
 import warnings
 
 from setuptools import find_packages
 
-from . import conv, legislations, legislationsxml
+from . import conv, legislations, legislationsxml, startup_statistics
 from variables import AbstractVariable
 from scenarios import AbstractScenario
 from formulas import get_neutralized_column
@@ -181,14 +183,16 @@ class TaxBenefitSystem(object):
         try:
             module_name = path.splitext(path.basename(file_path))[0]
             module_directory = path.dirname(file_path)
-            module = load_module(module_name, *find_module(module_name, [module_directory]))
-            potential_variables = [getattr(module, item) for item in dir(module) if not item.startswith('__')]
-            for pot_variable in potential_variables:
-                # We only want to get the module classes defined in this module (not imported)
-                if isclass(pot_variable) and \
-                        issubclass(pot_variable, AbstractVariable) and \
-                        pot_variable.__module__.endswith(module_name):
-                    self.add_variable(pot_variable)
+            with startup_statistics.loading_file(file_path):
+                with startup_statistics.measure(u'import'):
+                    module = load_module(module_name, *find_module(module_name, [module_directory]))
+                potential_variables = [getattr(module, item) for item in dir(module) if not item.startswith('__')]
+                for pot_variable in potential_variables:
+                    # We only want to get the module classes defined in this module (not imported)
+                    if isclass(pot_variable) and \
+                            issubclass(pot_variable, AbstractVariable) and \
+                            pot_variable.__module__.endswith(module_name):
+                        self.add_variable(pot_variable)
         except:
             log.error(u'Unable to load OpenFisca variables from file "{}"'.format(file_path))
             raise
@@ -339,6 +343,50 @@ class TaxBenefitSystem(object):
             self.compute_legislation(with_source_file_infos = with_source_file_infos)
         return self._legislation_json
 
+    def get_fingerprint(self):
+        """
+            Gets a hash of the variables, formulas and legislation of the tax and benefit system.
+
+            The hash covers the code of the formulas and of their ``base_function``, ``set_input`` and
+            ``calculate_output`` hooks, with their default arguments, their closures, and the functions and literal
+            constants (numbers, strings, tuples...) they use from their module, recursively. Other objects used by the
+            formulas (e.g. tax scales or arrays defined at module level) are hashed by type only, and imported modules
+            by name only. Two tax and benefit systems with the same fingerprint thus calculate the same values, unless
+            such an object or module has been modified. It can be used to check that values calculated and stored by a
+            previous run are still valid.
+
+            :rtype: str
+        """
+        fingerprint = hashlib.sha1()
+        digest_by_function = {}
+        for name, column in sorted(self.column_by_name.iteritems()):
+            fingerprint.update(repr((
+                name,
+                column.__class__.__name__,
+                column.entity.key,
+                column.definition_period,
+                column.default,
+                str(column.dtype),
+                )))
+            formula_class = column.formula_class
+            if formula_class is None:
+                continue
+            for hook_name in ('base_function', 'set_input', 'calculate_output'):
+                fingerprint.update(_get_function_digest(getattr(formula_class, hook_name, None), digest_by_function))
+            dated_formulas_class = getattr(formula_class, 'dated_formulas_class', None)
+            if dated_formulas_class is None:
+                formulas_class = [formula_class]
+            else:
+                formulas_class = []
+                for dated_formula_class in dated_formulas_class:
+                    fingerprint.update(repr((dated_formula_class['start_instant'], dated_formula_class['stop_instant'])))
+                    formulas_class.append(dated_formula_class['formula_class'])
+            for simple_formula_class in formulas_class:
+                fingerprint.update(_get_function_digest(getattr(simple_formula_class, 'function', None),
+                    digest_by_function))
+        fingerprint.update(json.dumps(self.get_legislation(), default = unicode, sort_keys = True))
+        return fingerprint.hexdigest()
+
     def get_package_metadata(self):
         """
             Gets metatada relative to the country package the tax and benefit system is built from.
@@ -389,3 +437,65 @@ class TaxBenefitSystem(object):
             'repository_url': repository_url,
             'location': location,
             }
+
+
+_FINGERPRINT_LITERAL_TYPES = (basestring, bool, complex, float, int, long, type(None))
+
+
+def _get_function_digest(function, digest_by_function):
+    """Return a hash of the code of a function, and of the functions and constants it uses, recursively.
+
+    `digest_by_function` memoizes the digests of the functions already hashed, and breaks recursion cycles.
+    """
+    function = getattr(function, 'im_func', function)
+    function_code = getattr(function, 'func_code', None)
+    if function_code is None:
+        # Builtins, NumPy ufuncs, classes...
+        return repr(getattr(function, '__name__', type(function).__name__))
+    digest = digest_by_function.get(function)
+    if digest is not None:
+        return digest
+    digest_by_function[function] = function.__name__  # Placeholder for recursive functions
+    function_hash = hashlib.sha1(_get_code_digest(function_code))
+    for value in function.func_defaults or ():
+        function_hash.update(_get_value_digest(value, digest_by_function))
+    for cell in function.func_closure or ():
+        function_hash.update(_get_value_digest(cell.cell_contents, digest_by_function))
+    for name in _iter_code_names(function_code):
+        if name in function.func_globals:
+            function_hash.update(name)
+            function_hash.update(_get_value_digest(function.func_globals[name], digest_by_function))
+    digest = digest_by_function[function] = function_hash.hexdigest()
+    return digest
+
+
+def _get_code_digest(code):
+    """Return a hash of a code object, which doesn't depend on its file name nor on its line numbers."""
+    code_hash = hashlib.sha1(repr((code.co_argcount, code.co_flags, code.co_names, code.co_varnames,
+        code.co_freevars, code.co_cellvars)))
+    code_hash.update(code.co_code)
+    for const in code.co_consts:
+        code_hash.update(_get_code_digest(const) if inspect.iscode(const) else repr((type(const), const)))
+    return code_hash.hexdigest()
+
+
+def _get_value_digest(value, digest_by_function):
+    if isinstance(value, _FINGERPRINT_LITERAL_TYPES):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return repr([_get_value_digest(item, digest_by_function) for item in value])
+    if inspect.ismodule(value):
+        return value.__name__
+    if inspect.isfunction(value) or inspect.ismethod(value):
+        return _get_function_digest(value, digest_by_function)
+    return type(value).__name__
+
+
+def _iter_code_names(code):
+    """Iterate over the global names used by a code object and by the code objects nested in it."""
+    for name in code.co_names:
+        yield name
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            for name in _iter_code_names(const):
+                yield name
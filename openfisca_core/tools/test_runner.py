@@ -7,13 +7,27 @@ A module to run openfisca yaml tests
 import collections
 import copy
 import glob
+import hashlib
+import itertools
+import logging
+import multiprocessing
 import os
+import pickle
+import StringIO
+import sys
+import time
+import traceback
+import weakref
 import yaml
 import numpy as np
 
 from openfisca_core import conv, periods, scenarios
 from openfisca_core.tools import assert_near
 
+
+log = logging.getLogger(__name__)
+
+
 # Yaml module configuration
 
 
@@ -29,6 +43,7 @@ def _config_yaml(yaml):
         return collections.OrderedDict(loader.construct_pairs(node))
 
     yaml.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, dict_constructor)
+    yaml.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, dict_constructor, Loader = _yaml_loader)
 
     yaml.add_representer(collections.OrderedDict, lambda dumper, data: dumper.represent_dict(
         (copy.deepcopy(key), value)
@@ -51,6 +66,8 @@ def _config_yaml(yaml):
     return yaml
 
 
+# The C loader of libyaml is much faster than the pure Python one, when PyYAML has been built with it.
+_yaml_loader = getattr(yaml, 'CLoader', yaml.Loader)
 _config_yaml(yaml)
 
 
@@ -66,10 +83,21 @@ def generate_tests(tax_benefit_system, path, options = {}):
 
     """
 
+    return _generate_tests(tax_benefit_system, path, options, reformed_tax_benefit_systems = {})
+
+
+def _generate_tests(tax_benefit_system, path, options, reformed_tax_benefit_systems):
+    """Generate the tests of a file or a directory.
+
+    `reformed_tax_benefit_systems` caches the reformed tax and benefit systems of the run, see
+    :any:`_get_reformed_tax_benefit_system`.
+    """
+    if options.get('batch'):
+        return _generate_batched_tests(tax_benefit_system, path, options, reformed_tax_benefit_systems)
     if os.path.isdir(path):
-        return _generate_tests_from_directory(tax_benefit_system, path, options)
+        return _generate_tests_from_directory(tax_benefit_system, path, options, reformed_tax_benefit_systems)
     else:
-        return _generate_tests_from_file(tax_benefit_system, path, options)
+        return _generate_tests_from_file(tax_benefit_system, path, options, reformed_tax_benefit_systems)
 
 
 def run_tests(tax_benefit_system, path, options = {}):
@@ -88,13 +116,26 @@ def run_tests(tax_benefit_system, path, options = {}):
 
     **Testing options**:
 
-    +-------------------------------+-----------+-------------------------------------------+
-    | Key                           | Type      | Role                                      |
-    +===============================+===========+===========================================+
-    | verbose                       | ``bool``  |                                           |
-    +-------------------------------+-----------+                                           +
-    | name_filter                   | ``str``   | See :any:`openfisca-run-test` options doc |
-    +-------------------------------+-----------+-------------------------------------------+
+    +-------------------------------+-------------------------+--------------------------------------------+
+    | Key                           | Type                    | Role                                       |
+    +===============================+=========================+============================================+
+    | verbose                       | ``bool``                |                                            |
+    +-------------------------------+-------------------------+                                            +
+    | name_filter                   | ``str``                 | See :any:`openfisca-run-test` options doc  |
+    +-------------------------------+-------------------------+                                            +
+    | batch                         | ``bool``                |                                            |
+    +-------------------------------+-------------------------+--------------------------------------------+
+    | timings                       | :any:`TestTimings`      | Filled with the time spent by each test    |
+    +-------------------------------+-------------------------+--------------------------------------------+
+    | dependencies                  | :any:`TestDependencies` | Variables and parameters used by each test |
+    +-------------------------------+-------------------------+--------------------------------------------+
+    | record_dependencies           | ``bool``                | Fill ``dependencies`` with the tests run   |
+    +-------------------------------+-------------------------+--------------------------------------------+
+    | changed                       | ``list``                | Only run the tests of ``dependencies``     |
+    |                               |                         | using these variables or parameters        |
+    +-------------------------------+-------------------------+--------------------------------------------+
+    | cache_dir                     | ``str``                 | Directory of the cache of converted tests  |
+    +-------------------------------+-------------------------+--------------------------------------------+
 
     """
 
@@ -106,16 +147,271 @@ def run_tests(tax_benefit_system, path, options = {}):
     return nb_tests  # Nb of sucessful tests
 
 
+def run_tests_in_parallel(tax_benefit_system, paths, options = {}, processes = None):
+    """
+    Runs all the YAML tests contained in files or directories, distributing the files across worker processes.
+
+    The outputs of the tests are printed in the same order as with :meth:`run_tests`. When a test does not pass, the
+    error it raised is raised again, after the outputs of the tests run before it.
+
+    :param TaxBenefitSystem tax_benefit_system: the tax-benefit system to use to run the tests. It is inherited by the
+        worker processes when they are forked.
+    :param list paths: the paths towards the files or directories containing the tests.
+    :param dict options: See :meth:`run_tests`.
+    :param int processes: the number of worker processes. Defaults to the number of CPUs.
+
+    :return: the number of sucessful tests excecuted
+    """
+    yaml_paths = [
+        yaml_path
+        for path in paths
+        for yaml_path in (_list_yaml_files(path) if os.path.isdir(path) else [path])
+        ]
+    if options.get('cache_dir') is not None:
+        _get_fingerprint(tax_benefit_system)  # Computed once, before the worker processes are forked.
+    pool = multiprocessing.Pool(processes, initializer = _initialize_worker, initargs = (tax_benefit_system, options))
+    try:
+        nb_tests = 0
+        for output, file_nb_tests, error, timings_json, dependencies_json in pool.imap(_run_test_file, yaml_paths):
+            sys.stdout.write(output)
+            nb_tests += file_nb_tests
+            if timings_json is not None:
+                options['timings'].update_from_json(timings_json)
+            if dependencies_json is not None:
+                options['dependencies'].update_from_json(dependencies_json)
+            if error is not None:
+                raise error
+    finally:
+        pool.terminate()
+        pool.join()
+    return nb_tests
+
+
+class TestTimings(object):
+    """
+    Time spent by each YAML test: conversion of the test to a scenario, build of the simulation, and calculation of
+    the outputs. The time spent loading each YAML file is also measured.
+
+    Pass an instance as the ``timings`` option of :meth:`run_tests` to fill it.
+    """
+
+    STEPS = (u'conversion', u'build', u'calculation')
+    __test__ = False  # Not a test case, for test collectors such as nose
+
+    def __init__(self):
+        self.parse_time_by_file = collections.OrderedDict()
+        self._record_by_key = collections.OrderedDict()
+
+    def add(self, test, step, seconds):
+        record = self._get_record(test)
+        record[step] += seconds
+
+    def add_file_parse_time(self, yaml_path, seconds):
+        self.parse_time_by_file[yaml_path] = self.parse_time_by_file.get(yaml_path, 0) + seconds
+
+    def get_files_timings(self):
+        """Return the timings of the YAML files, the slowest first."""
+        files_timings = collections.OrderedDict(
+            (yaml_path, dict(file = yaml_path, parse = parse_time, tests = 0., tests_count = 0))
+            for yaml_path, parse_time in self.parse_time_by_file.iteritems()
+            )
+        for test_timings in self.get_tests_timings():
+            file_timings = files_timings.setdefault(test_timings['file'], dict(
+                file = test_timings['file'], parse = 0., tests = 0., tests_count = 0))
+            file_timings['tests'] += test_timings['total']
+            file_timings['tests_count'] += 1
+        for file_timings in files_timings.itervalues():
+            file_timings['total'] = file_timings['parse'] + file_timings['tests']
+        return sorted(files_timings.itervalues(), key = lambda file_timings: -file_timings['total'])
+
+    def get_tests_timings(self):
+        """Return the timings of the tests which have been run or selected, the slowest first."""
+        tests_timings = [
+            dict(
+                (key, value)
+                for key, value in record.iteritems()
+                if key != 'test'
+                )
+            for record in self._record_by_key.itervalues()
+            if record['title'] is not None
+            ]
+        for test_timings in tests_timings:
+            test_timings['total'] = sum(test_timings[step] for step in self.STEPS)
+        return sorted(tests_timings, key = lambda test_timings: -test_timings['total'])
+
+    def set_title(self, test, yaml_path, title):
+        record = self._get_record(test)
+        record['file'] = yaml_path
+        record['title'] = title.decode('utf-8') if isinstance(title, str) else title
+
+    def to_json(self):
+        return collections.OrderedDict((
+            ('tests', self.get_tests_timings()),
+            ('files', self.get_files_timings()),
+            ))
+
+    def to_table(self, count = 10):
+        """Return a text summary of the `count` slowest tests and files."""
+        lines = [u'Slowest tests (seconds: total = conversion + build + calculation):']
+        for test_timings in self.get_tests_timings()[:count]:
+            lines.append(u'  {total:8.3f} = {conversion:.3f} + {build:.3f} + {calculation:.3f}  {title}'.format(
+                **test_timings))
+        lines.append(u'Slowest files (seconds: total = parse + tests):')
+        for file_timings in self.get_files_timings()[:count]:
+            lines.append(u'  {total:8.3f} = {parse:.3f} + {tests:.3f}  {file} ({tests_count} tests)'.format(
+                **file_timings))
+        return u'\n'.join(lines)
+
+    def update_from_json(self, timings_json):
+        """Add the timings exported by another instance, e.g. in a worker process."""
+        for test_timings in timings_json['tests']:
+            record = dict(
+                (key, test_timings[key])
+                for key in ('file', 'title') + self.STEPS
+                )
+            self._record_by_key[len(self._record_by_key), None] = record
+        for file_timings in timings_json['files']:
+            self.add_file_parse_time(file_timings['file'], file_timings['parse'])
+
+    def _get_record(self, test):
+        # The test is kept in the record, so that its id can't be reused by another test.
+        record = self._record_by_key.get(id(test))
+        if record is None:
+            record = self._record_by_key[id(test)] = dict.fromkeys(self.STEPS, 0.)
+            record.update(file = None, test = test, title = None)
+        return record
+
+
+class TestDependencies(object):
+    """
+    Variables and parameters used by each YAML test, recorded from the trace of its simulation.
+
+    Pass an instance as the ``dependencies`` option of :meth:`run_tests`, with the ``record_dependencies`` option to
+    fill it, or with the ``changed`` option to run only the tests affected by a change. Tests which have not been
+    recorded are always considered affected.
+
+    Tests are identified by their file, their index in the file and their title. When `root_dir` is given, e.g. the
+    directory of the index file, the paths of the files are stored relative to it, so that an index can be shared by
+    several checkouts.
+    """
+
+    __test__ = False  # Not a test case, for test collectors such as nose
+
+    def __init__(self, root_dir = None):
+        self.root_dir = root_dir
+        self._record_by_key_by_file = collections.OrderedDict()
+        self._key_by_test_id = {}
+
+    def add(self, test, simulation):
+        """Record the variables and parameters used by the traced simulation of a test."""
+        file_key, test_key = self._key_by_test_id[id(test)][1:]
+        variables_name = set()
+        parameters_name = set()
+        for (variable_name, _), step in simulation.traceback.iteritems():
+            variables_name.add(variable_name)
+            variables_name.update(
+                input_variable_name
+                for input_variable_name, _ in step.get('input_variables_infos') or []
+                )
+            parameters_name.update(
+                parameter_infos['name']
+                for parameter_infos in step.get('parameters_infos') or []
+                )
+        self._record_by_key_by_file.setdefault(file_key, collections.OrderedDict())[test_key] = dict(
+            parameters = sorted(parameters_name),
+            variables = sorted(variables_name),
+            )
+
+    def is_affected(self, yaml_path, index, title, changed_names):
+        """Tell whether a test uses one of the changed variables or parameters, or has not been recorded.
+
+        A changed parameter affects the tests using it, the parameters it contains, or the scale containing it.
+        """
+        record = self._record_by_key_by_file.get(self._get_file_key(yaml_path), {}).get(
+            self._get_test_key(index, title))
+        if record is None:
+            return True
+        variables_name = set(record['variables'])
+        for changed_name in changed_names:
+            if changed_name in variables_name:
+                return True
+            for parameter_name in record['parameters']:
+                if _is_parameter_prefix(changed_name, parameter_name) or _is_parameter_prefix(parameter_name, changed_name):
+                    return True
+        return False
+
+    def set_title(self, test, yaml_path, index, title):
+        # The test is kept, so that its id can't be reused by another test.
+        self._key_by_test_id[id(test)] = (test, self._get_file_key(yaml_path), self._get_test_key(index, title))
+
+    def to_json(self, yaml_paths = None):
+        """Export the dependencies of the tests, optionally only those of the given YAML files."""
+        files_key = None if yaml_paths is None else set(self._get_file_key(yaml_path) for yaml_path in yaml_paths)
+        return dict(tests = [
+            collections.OrderedDict((
+                ('file', file_key),
+                ('index', index),
+                ('title', title),
+                ('variables', record['variables']),
+                ('parameters', record['parameters']),
+                ))
+            for file_key, record_by_key in self._record_by_key_by_file.iteritems()
+            if files_key is None or file_key in files_key
+            for (index, title), record in record_by_key.iteritems()
+            ])
+
+    def update_from_json(self, dependencies_json):
+        """Add the dependencies exported by another instance, e.g. loaded from an index file or sent by a worker."""
+        for test_dependencies in dependencies_json['tests']:
+            self._record_by_key_by_file.setdefault(test_dependencies['file'], collections.OrderedDict())[
+                self._get_test_key(test_dependencies['index'], test_dependencies['title'])] = dict(
+                    parameters = test_dependencies['parameters'],
+                    variables = test_dependencies['variables'],
+                    )
+
+    def _get_file_key(self, yaml_path):
+        if self.root_dir is None:
+            return yaml_path
+        return os.path.relpath(os.path.abspath(yaml_path), self.root_dir)
+
+    def _get_test_key(self, index, title):
+        # Tests without a name have the same title when they have the same period: they differ by their index.
+        return index, title.decode('utf-8') if isinstance(title, str) else title
+
+
 # Internal methods
 
-def _generate_tests_from_file(tax_benefit_system, path_to_file, options):
+def _is_parameter_prefix(prefix, parameter_name):
+    return parameter_name == prefix or parameter_name.startswith(prefix + u'.')
+
+
+def _generate_tests_from_file(tax_benefit_system, path_to_file, options, reformed_tax_benefit_systems = None):
+    verbose = options.get('verbose')
+
+    for title, period_str, test in _iter_selected_tests(tax_benefit_system, path_to_file, options,
+            reformed_tax_benefit_systems):
+
+        def check():
+            print("=" * len(title))
+            print(title)
+            print("=" * len(title))
+            _run_test(period_str, test, verbose, options)
+
+        yield check
+
+
+def _iter_selected_tests(tax_benefit_system, path_to_file, options, reformed_tax_benefit_systems = None):
+    """Yield the title, the period and the content of the tests of a file selected by the name filter."""
     filename = os.path.splitext(os.path.basename(path_to_file))[0]
     name_filter = options.get('name_filter')
     if isinstance(name_filter, str):
         name_filter = name_filter.decode('utf-8')
-    verbose = options.get('verbose')
 
-    tests = _parse_test_file(tax_benefit_system, path_to_file)
+    timings = options.get('timings')
+    dependencies = options.get('dependencies')
+    changed = options.get('changed')
+    tests = _parse_test_file(tax_benefit_system, path_to_file, timings, options.get('cache_dir'),
+        reformed_tax_benefit_systems)
 
     for test_index, (path_to_file, name, period_str, test) in enumerate(tests, 1):
         if name_filter is not None and name_filter not in filename \
@@ -130,33 +426,124 @@ def _generate_tests_from_file(tax_benefit_system, path_to_file, options):
             name.encode('utf-8'),
             period_str,
             )
+        if changed is not None and dependencies is not None \
+                and not dependencies.is_affected(path_to_file, test_index, title, changed):
+            continue
+
+        if timings is not None:
+            timings.set_title(test, path_to_file, title)
+        if dependencies is not None and options.get('record_dependencies'):
+            dependencies.set_title(test, path_to_file, test_index, title)
+        yield title, period_str, test
+
+
+def _generate_batched_tests(tax_benefit_system, path, options, reformed_tax_benefit_systems = None):
+    """Generate the tests of a file or a directory, after having run them in batches.
+
+    The tests which don't pass in their batch, or which can't be batched, are run again individually when they are
+    called, so that their output and errors are the same as without batches.
+    """
+    verbose = options.get('verbose')
+    yaml_paths = _list_yaml_files(path) if os.path.isdir(path) else [path]
+    selected_tests = [
+        selected_test
+        for yaml_path in yaml_paths
+        for selected_test in _iter_selected_tests(tax_benefit_system, yaml_path, options, reformed_tax_benefit_systems)
+        ]
+    if options.get('record_dependencies'):
+        # The dependencies of a test are recorded from the trace of its own simulation.
+        passed_tests_id = set()
+    else:
+        passed_tests_id = _run_batches([test for _, _, test in selected_tests], verbose, options.get('timings'))
+
+    for title, period_str, test in selected_tests:
 
         def check():
             print("=" * len(title))
             print(title)
             print("=" * len(title))
-            _run_test(period_str, test, verbose, options)
+            if id(test) not in passed_tests_id:
+                _run_test(period_str, test, verbose, options)
 
         yield check
 
 
-def _generate_tests_from_directory(tax_benefit_system, path_to_dir, options):
+def _generate_tests_from_directory(tax_benefit_system, path_to_dir, options, reformed_tax_benefit_systems = None):
+    for yaml_path in _list_yaml_files(path_to_dir):
+        for test in _generate_tests_from_file(tax_benefit_system, yaml_path, options, reformed_tax_benefit_systems):
+            yield test
+
+
+def _list_yaml_files(path_to_dir):
+    """List the YAML files of a directory and of its subdirectories, in the order in which their tests are run."""
     yaml_paths = glob.glob(os.path.join(path_to_dir, "*.yaml"))
-    subdirectories = glob.glob(os.path.join(path_to_dir, "*/"))
+    for subdirectory in glob.glob(os.path.join(path_to_dir, "*/")):
+        yaml_paths.extend(_list_yaml_files(subdirectory))
+    return yaml_paths
 
-    for yaml_path in yaml_paths:
-        for test in _generate_tests_from_file(tax_benefit_system, yaml_path, options):
-            yield test
 
-    for subdirectory in subdirectories:
-        for test in _generate_tests_from_directory(tax_benefit_system, subdirectory, options):
-            yield test
+# Worker processes of run_tests_in_parallel
+
+_worker_tax_benefit_system = None
+_worker_options = None
+_worker_reformed_tax_benefit_systems = None  # Shared by the test files run by the worker
 
 
-def _parse_test_file(tax_benefit_system, yaml_path):
+def _initialize_worker(tax_benefit_system, options):
+    global _worker_options, _worker_reformed_tax_benefit_systems, _worker_tax_benefit_system
+    _worker_tax_benefit_system = tax_benefit_system
+    _worker_options = options
+    _worker_reformed_tax_benefit_systems = {}
+
+
+def _run_test_file(yaml_path):
+    """Run the tests of a YAML file, and return their output, the number of sucessful tests, the error raised, the
+    timings and the recorded dependencies of the tests."""
+    stdout = sys.stdout
+    sys.stdout = output = StringIO.StringIO()
+    nb_tests = 0
+    error = None
+    options = _worker_options
+    if options.get('timings') is not None:
+        options = dict(options, timings = TestTimings())
+    try:
+        for test in _generate_tests(_worker_tax_benefit_system, yaml_path, options,
+                _worker_reformed_tax_benefit_systems):
+            test()
+            nb_tests += 1
+    except Exception as error:
+        try:
+            pickle.loads(pickle.dumps(error))
+        except Exception:
+            # The error must be sent back to the main process.
+            error = AssertionError(traceback.format_exc())
+    finally:
+        sys.stdout = stdout
+    timings = options.get('timings')
+    dependencies_json = options['dependencies'].to_json(yaml_paths = [yaml_path]) \
+        if options.get('record_dependencies') else None
+    return output.getvalue(), nb_tests, error, timings.to_json() if timings is not None else None, dependencies_json
+
+
+def _parse_test_file(tax_benefit_system, yaml_path, timings = None, cache_dir = None,
+        reformed_tax_benefit_systems = None):
     filename = os.path.splitext(os.path.basename(yaml_path))[0]
+    start_time = time.time()
     with open(yaml_path) as yaml_file:
-        tests = yaml.load(yaml_file)
+        content = yaml_file.read()
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, '{}.pickle'.format(hashlib.sha1(content).hexdigest()))
+        cached_tests = _load_cached_tests(tax_benefit_system, cache_path, reformed_tax_benefit_systems)
+        if cached_tests is not None:
+            if timings is not None:
+                timings.add_file_parse_time(yaml_path, time.time() - start_time)
+            for test in cached_tests:
+                yield yaml_path, test.get('name') or filename, unicode(test['scenario'].period), test
+            return
+    tests = yaml.load(content, Loader = _yaml_loader)
+    if timings is not None:
+        timings.add_file_parse_time(yaml_path, time.time() - start_time)
 
     tests, error = conv.pipe(
         conv.make_item_to_singleton(),
@@ -172,14 +559,17 @@ def _parse_test_file(tax_benefit_system, yaml_path):
         raise ValueError("Error in test {}:\n{}".format(yaml_path, yaml.dump(tests, allow_unicode = True,
             default_flow_style = False, indent = 2, width = 120)))
 
+    cache_entries = []
     for test in tests:
+        start_time = time.time()
         current_tax_benefit_system = tax_benefit_system
+        reforms = []
         if test.get('reforms'):
             reforms = test.pop('reforms')
             if not isinstance(reforms, list):
                 reforms = [reforms]
-            for reform_path in reforms:
-                current_tax_benefit_system = current_tax_benefit_system.apply_reform(reform_path)
+            current_tax_benefit_system = _get_reformed_tax_benefit_system(tax_benefit_system, reforms,
+                reformed_tax_benefit_systems)
 
         test, error = scenarios.make_json_or_python_to_test(
             tax_benefit_system = current_tax_benefit_system
@@ -191,11 +581,291 @@ def _parse_test_file(tax_benefit_system, yaml_path):
             raise ValueError("Error in test {}:\n{}\nYaml test content: \n{}\n".format(
                 yaml_path, error, yaml.dump(test, allow_unicode = True,
                 default_flow_style = False, indent = 2, width = 120)))
+        if timings is not None:
+            timings.add(test, u'conversion', time.time() - start_time)
+        if cache_path is not None and cache_entries is not None:
+            # The test is stored before it is run, as running it modifies its scenario.
+            cache_entries = _add_cache_entry(cache_entries, current_tax_benefit_system, reforms, test)
 
         yield yaml_path, test.get('name') or filename, unicode(test['scenario'].period), test
 
+    if cache_path is not None and cache_entries is not None:
+        _save_cached_tests(cache_path, cache_entries)
+
+
+# Version of the format of the files of the parsed tests cache, to increment when the converted tests change.
+_PARSED_TESTS_CACHE_VERSION = 1
+# Fingerprints of the tax and benefit systems, shared by all the tests.
+_fingerprints_cache = weakref.WeakKeyDictionary()
+
+
+def _get_fingerprint(tax_benefit_system):
+    fingerprint = _fingerprints_cache.get(tax_benefit_system)
+    if fingerprint is None:
+        fingerprint = _fingerprints_cache[tax_benefit_system] = tax_benefit_system.get_fingerprint()
+    return fingerprint
+
+
+def _add_cache_entry(cache_entries, tax_benefit_system, reforms, test):
+    """Add a converted test to the entries to cache, or return None when it can't be cached."""
+    scenario = copy.copy(test['scenario'])
+    scenario.tax_benefit_system = None  # Restored from the reforms when the test is loaded.
+    try:
+        test_pickle = pickle.dumps(dict(test, scenario = scenario), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+    cache_entries.append((reforms, _get_fingerprint(tax_benefit_system), test_pickle))
+    return cache_entries
+
+
+def _load_cached_tests(tax_benefit_system, cache_path, reformed_tax_benefit_systems = None):
+    """Return the converted tests of a cache file, or None when they are missing or outdated."""
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            version, cache_entries = pickle.load(cache_file)
+    except Exception:
+        return None
+    if version != _PARSED_TESTS_CACHE_VERSION:
+        return None
+    tests = []
+    for reforms, fingerprint, test_pickle in cache_entries:
+        current_tax_benefit_system = _get_reformed_tax_benefit_system(tax_benefit_system, reforms,
+            reformed_tax_benefit_systems)
+        if _get_fingerprint(current_tax_benefit_system) != fingerprint:
+            return None
+        test = pickle.loads(test_pickle)
+        test['scenario'].tax_benefit_system = current_tax_benefit_system
+        tests.append(test)
+    return tests
+
+
+def _save_cached_tests(cache_path, cache_entries):
+    cache_dir = os.path.dirname(cache_path)
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):  # Unless created by a concurrent process
+                raise
+    # Write then rename the file, so that concurrent processes never read a partial file.
+    temporary_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    with open(temporary_path, 'wb') as cache_file:
+        pickle.dump((_PARSED_TESTS_CACHE_VERSION, cache_entries), cache_file, pickle.HIGHEST_PROTOCOL)
+    os.rename(temporary_path, cache_path)
+
+
+def _get_reformed_tax_benefit_system(tax_benefit_system, reform_paths, reformed_tax_benefit_systems = None):
+    """Apply reforms to a tax and benefit system.
+
+    `reformed_tax_benefit_systems` is a dict caching the reformed tax and benefit systems, by reference tax and benefit
+    system and reform paths. It is created for each run of the tests, and dropped with it.
+    """
+    if reformed_tax_benefit_systems is None:
+        reformed_tax_benefit_systems = {}
+    reformed_tax_benefit_system = tax_benefit_system
+    for reforms_count, reform_path in enumerate(reform_paths, 1):
+        # Reforms applied in sequence are cached for each prefix, to be reused by tests applying further reforms.
+        cache_key = (tax_benefit_system, tuple(reform_paths[:reforms_count]))
+        cached_tax_benefit_system = reformed_tax_benefit_systems.get(cache_key)
+        if cached_tax_benefit_system is None:
+            cached_tax_benefit_system = reformed_tax_benefit_systems[cache_key] = \
+                reformed_tax_benefit_system.apply_reform(reform_path)
+        reformed_tax_benefit_system = cached_tax_benefit_system
+    return reformed_tax_benefit_system
+
+
+def _run_batches(tests, verbose = False, timings = None):
+    """Run the tests which can be batched together in a single simulation, and return the ids of those which passed.
+
+    The populations of the tests of a batch are stacked into a single population, and the results are split back for
+    each test. When a calculation raises an error, the error is logged if `verbose`, and the remaining tests of the
+    batch don't pass. A test of each batch is also run on its own population, to detect formulas which depend on the
+    whole population: when its result differs, no test of the batch passes.
+    """
+    tests_by_batch_key = collections.OrderedDict()
+    for test in tests:
+        batch_key = _get_batch_key(test)
+        if batch_key is not None:
+            tests_by_batch_key.setdefault(batch_key, []).append(test)
+
+    passed_tests_id = set()
+    for batch_tests in tests_by_batch_key.itervalues():
+        if len(batch_tests) < 2:
+            continue
+        passed_tests_id.update(_run_batch(batch_tests, verbose, timings))
+    return passed_tests_id
+
+
+def _get_batch_key(test):
+    """Return a key shared by the tests which can be batched together, or None when the test can't be batched.
+
+    Tests can be batched together when they have the same tax and benefit system and period, no axes, and inputs for
+    the same variables and periods: otherwise, the default value given to a missing input could replace a formula.
+    """
+    scenario = test['scenario']
+    if scenario.axes is not None or not test.get(u'output_variables'):
+        return None
+    if scenario.test_case is not None:
+        inputs = frozenset(
+            (entity_plural, variable_name, frozenset(value) if isinstance(value, dict) else None)
+            for entity_plural, members in scenario.test_case.iteritems()
+            for member in members
+            for variable_name, value in member.iteritems()
+            if value is not None and variable_name in scenario.tax_benefit_system.column_by_name
+            )
+        return scenario.tax_benefit_system, scenario.__class__, scenario.period, u'test_case', inputs
+    if scenario.input_variables is not None:
+        if any(
+                len(array) != 1
+                for array_by_period in scenario.input_variables.itervalues()
+                for array in array_by_period.itervalues()
+                ):
+            return None  # The composition of entities can't be inferred when several persons are given.
+        inputs = frozenset(
+            (variable_name, frozenset(array_by_period))
+            for variable_name, array_by_period in scenario.input_variables.iteritems()
+            )
+        return scenario.tax_benefit_system, scenario.__class__, scenario.period, u'input_variables', inputs
+    return None
+
+
+def _run_batch(tests, verbose = False, timings = None):
+    start_time = time.time()
+    first_scenario = tests[0]['scenario']
+    tax_benefit_system = first_scenario.tax_benefit_system
+    batch_scenario = copy.copy(first_scenario)
+    # Index of the first member and number of members of each entity of each test, in the stacked population.
+    slice_by_entity_key_by_test_index = []
+    if first_scenario.test_case is not None:
+        batch_scenario.test_case = test_case = dict(
+            (entity.plural, [])
+            for entity in tax_benefit_system.entities
+            )
+        for test_index, test in enumerate(tests):
+            scenario = test['scenario']
+            scenario.suggest()
+            slice_by_entity_key = {}
+            for entity in tax_benefit_system.entities:
+                members = test_case[entity.plural]
+                test_members = scenario.test_case[entity.plural]
+                slice_by_entity_key[entity.key] = slice(len(members), len(members) + len(test_members))
+                for member in test_members:
+                    # Make ids unique, by prefixing them with the index of the test.
+                    member = member.copy()
+                    member[u'id'] = (test_index, member[u'id'])
+                    if not entity.is_person:
+                        for role in entity.roles:
+                            role_key = role.plural or role.key
+                            persons_id = member.get(role_key)
+                            if persons_id is not None:
+                                member[role_key] = [
+                                    (test_index, person_id)
+                                    for person_id in (persons_id if isinstance(persons_id, list) else [persons_id])
+                                    ]
+                    members.append(member)
+            slice_by_entity_key_by_test_index.append(slice_by_entity_key)
+    else:
+        # Each test has a single member in each entity.
+        for test in tests:
+            test['scenario'].suggest()
+        batch_scenario.input_variables = dict(
+            (variable_name, dict(
+                (variable_period, np.concatenate([
+                    test['scenario'].input_variables[variable_name][variable_period]
+                    for test in tests
+                    ]))
+                for variable_period in array_by_period
+                ))
+            for variable_name, array_by_period in first_scenario.input_variables.iteritems()
+            )
+        slice_by_entity_key_by_test_index = [
+            dict(
+                (entity.key, slice(test_index, test_index + 1))
+                for entity in tax_benefit_system.entities
+                )
+            for test_index in range(len(tests))
+            ]
+    simulation = batch_scenario.new_simulation(debug = verbose)
+    build_time = time.time() - start_time
+
+    passed_tests_id = []
+    for test, slice_by_entity_key in itertools.izip(tests, slice_by_entity_key_by_test_index):
+        try:
+            _check_expected_values(test, simulation, slice_by_entity_key)
+        except AssertionError:
+            continue
+        except Exception:
+            # A formula failed on the stacked population, leaving the simulation in an unknown state. This test and
+            # the next ones will be run individually, to report the error.
+            if verbose:
+                log.warning(u'Error while calculating a batch of {} tests. Its tests which have not passed yet will be '
+                    u'run individually.'.format(len(tests)), exc_info = True)
+            break
+        passed_tests_id.append(id(test))
+    if passed_tests_id:
+        # Formulas using the whole population (ranks, totals, etc) give other results on the stacked population, which
+        # could make failing tests pass. The first passed test is checked on its own population: when it doesn't
+        # pass, none of the tests of the batch is considered as passed.
+        sample_test = next(test for test in tests if id(test) == passed_tests_id[0])
+        try:
+            _check_expected_values(sample_test, sample_test['scenario'].new_simulation())
+        except Exception:
+            if verbose:
+                log.warning(u'A test of a batch of {} tests passes only in its batch. The tests of this batch will be '
+                    u'run individually.'.format(len(tests)), exc_info = True)
+            passed_tests_id = []
+    if timings is not None:
+        # The time of the batch is shared evenly by its tests.
+        calculation_time = time.time() - start_time - build_time
+        for test in tests:
+            timings.add(test, u'build', build_time / len(tests))
+            timings.add(test, u'calculation', calculation_time / len(tests))
+    return passed_tests_id
+
+
+def _check_expected_values(test, simulation, slice_by_entity_key = None):
+    """Check the outputs of a test, calculated by `simulation` for the members of each entity in `slice_by_entity_key`.
+    """
+    for variable_name, requested_period, expected_value in _iter_expected_values(test):
+        value = simulation.calculate(variable_name, requested_period)
+        if slice_by_entity_key is not None:
+            value = value[slice_by_entity_key[simulation.get_variable_entity(variable_name).key]]
+        assert_near(
+            value,
+            expected_value,
+            absolute_error_margin = test.get('absolute_error_margin'),
+            relative_error_margin = test.get('relative_error_margin'),
+            )
+
+
+def _iter_expected_values(test):
+    """Yield the variable name, the requested period and the expected value of the outputs of a test."""
+    for variable_name, expected_value in (test.get(u'output_variables') or {}).iteritems():
+        if isinstance(expected_value, dict):
+            for requested_period, expected_value_at_period in expected_value.iteritems():
+                yield variable_name, requested_period, expected_value_at_period
+        else:
+            yield variable_name, test['scenario'].period, expected_value
+
 
 def _run_test(period_str, test, verbose = False, options = {}):
+    timings = options.get('timings')
+    record_dependencies = options.get('record_dependencies') and options.get('dependencies') is not None
+    start_time = time.time()
+    scenario = test['scenario']
+    scenario.suggest()
+    simulation = scenario.new_simulation(debug = verbose, trace = record_dependencies)
+    if timings is not None:
+        timings.add(test, u'build', time.time() - start_time)
+    try:
+        _check_output_variables(test, period_str, simulation, timings)
+    finally:
+        # Failing tests are recorded too, so that they are run again when their dependencies change.
+        if record_dependencies:
+            options['dependencies'].add(test, simulation)
+
+
+def _check_output_variables(test, period_str, simulation, timings = None):
     absolute_error_margin = None
     relative_error_margin = None
     if test.get('absolute_error_margin') is not None:
@@ -203,16 +873,20 @@ def _run_test(period_str, test, verbose = False, options = {}):
     if test.get('relative_error_margin') is not None:
         relative_error_margin = test.get('relative_error_margin')
 
-    scenario = test['scenario']
-    scenario.suggest()
-    simulation = scenario.new_simulation(debug = verbose)
+    def calculate(variable_name, period = None):
+        start_time = time.time()
+        value = simulation.calculate(variable_name, period)
+        if timings is not None:
+            timings.add(test, u'calculation', time.time() - start_time)
+        return value
+
     output_variables = test.get(u'output_variables')
     if output_variables is not None:
         for variable_name, expected_value in output_variables.iteritems():
             if isinstance(expected_value, dict):
                 for requested_period, expected_value_at_period in expected_value.iteritems():
                     assert_near(
-                        simulation.calculate(variable_name, requested_period),
+                        calculate(variable_name, requested_period),
                         expected_value_at_period,
                         absolute_error_margin = absolute_error_margin,
                         message = u'{}@{}: '.format(variable_name, requested_period),
@@ -220,7 +894,7 @@ def _run_test(period_str, test, verbose = False, options = {}):
                         )
             else:
                 assert_near(
-                    simulation.calculate(variable_name),
+                    calculate(variable_name),
                     expected_value,
                     absolute_error_margin = absolute_error_margin,
                     message = u'{}@{}: '.format(variable_name, period_str),
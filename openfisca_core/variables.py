@@ -4,6 +4,7 @@
 import inspect
 import textwrap
 
+from openfisca_core import startup_statistics
 from openfisca_core.formulas import SimpleFormula, DatedFormula, new_filled_column
 
 
@@ -43,22 +44,24 @@ class AbstractVariable(object):
             if not entity:
                 entity = reference.entity
 
-        comments, source_file_path, source_code, start_line_number = self.get_introspection_data(tax_benefit_system)
+        with startup_statistics.measure(u'introspection'):
+            comments, source_file_path, source_code, start_line_number = self.get_introspection_data(tax_benefit_system)
 
         if entity is None:
             raise Exception('Variable {} must have an entity'.format(self.name))
 
-        return new_filled_column(
-            name = self.name,
-            entity = entity,
-            formula_class = formula_class,
-            reference_column = reference,
-            comments = comments,
-            start_line_number = start_line_number,
-            source_code = source_code,
-            source_file_path = source_file_path,
-            **self.attributes
-            )
+        with startup_statistics.measure(u'column'):
+            return new_filled_column(
+                name = self.name,
+                entity = entity,
+                formula_class = formula_class,
+                reference_column = reference,
+                comments = comments,
+                start_line_number = start_line_number,
+                source_code = source_code,
+                source_file_path = source_file_path,
+                **self.attributes
+                )
 
 
 class Variable(AbstractVariable):
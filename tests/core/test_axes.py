@@ -1,3 +1,7 @@
+import numpy as np
+
+from openfisca_core import periods
+from openfisca_core.axes_compression import AxesCompression
 from openfisca_core.tools import assert_near
 from openfisca_dummy_country import DummyTaxBenefitSystem
 
@@ -38,3 +42,90 @@ def test_set_input_parallel_axes():
         [0, 0, 2000, 50000, 50000, 2000, 100000, 100000, 2000],
         absolute_error_margin = 0.01
         )
+
+
+def test_members_are_replicated_along_axes():
+    simulation = tax_benefit_system.new_scenario().init_from_attributes(
+        axes = [[dict(count = 3, index = 0, name = 'salaire_brut', max = 100000, min = 0)]],
+        period = 2013,
+        test_case = {
+            'individus': [
+                {'id': 'ind0'},
+                {'id': 'ind1', 'birth': '1980-01-01'},
+                {'id': 'ind2'},
+                ],
+            'familles': [
+                {'parents': ['ind0', 'ind1']},
+                {'parents': ['ind2']},
+                ],
+            },
+        ).new_simulation()
+
+    famille = simulation.famille
+    assert famille.count == 6
+    assert_near(famille.members_entity_id, [0, 0, 1, 2, 2, 3, 4, 4, 5])
+    assert_near(famille.members_legacy_role, [0, 1, 0] * 3)
+    assert [role.key for role in famille.members_role] == ['demandeur', 'conjoint', 'demandeur'] * 3
+    assert (simulation.calculate('birth', 2013)[1::3] == np.datetime64('1980-01-01')).all()
+
+
+def test_compressed_axes():
+    scenario = tax_benefit_system.new_scenario().init_single_entity(
+        axes = [[dict(count = 5, index = 0, name = 'salaire_brut', max = 100000, min = 0)]],
+        period = 2015,
+        parent1 = {'birth': '1970-01-01'},
+        parent2 = {'salaire_brut': 30000},
+        enfants = [{}],
+        famille = {'city_code': '97123'},
+        )
+    simulation = scenario.new_simulation()
+    compressed_simulation = scenario.new_simulation(compress_axes = True, cache_statistics = True)
+    for variable_name, period in [
+            ('revenu_disponible_famille', '2015'),
+            ('revenu_disponible', '2015'),
+            ('age', '2015-01'),
+            ]:
+        assert_near(
+            compressed_simulation.calculate(variable_name, period),
+            simulation.calculate(variable_name, period),
+            absolute_error_margin = 0.01,
+            )
+
+    # Variables which don't depend on the axes are calculated only on the test case without axes.
+    statistics_by_variable_name = compressed_simulation.cache_statistics.to_dict()
+    assert statistics_by_variable_name['age']['computations'] == 0
+    assert statistics_by_variable_name['dom_tom']['computations'] == 0
+    assert statistics_by_variable_name['salaire_net']['computations'] == 12
+    assert compressed_simulation.axes_compression.varying_variables_name.issuperset(
+        ['salaire_brut', 'salaire_net', 'revenu_disponible', 'revenu_disponible_famille'])
+
+
+def test_traced_varying_variables_are_not_calculated_again_on_the_base_test_case():
+    base_simulation = tax_benefit_system.new_scenario().init_single_entity(
+        period = 2015,
+        parent1 = {'birth': '1970-01-01', 'salaire_brut': 30000},
+        ).new_simulation(trace = True)
+    axes_compression = AxesCompression(base_simulation, varying_variables_name = ['salaire_brut'], steps_count = 3)
+    base_simulation.calculate('revenu_disponible', 2015)
+
+    # The dependencies traced for 2015 are enough to know that salaire_net varies in 2016.
+    assert axes_compression.get_invariant_array('salaire_net', '2016-01') is None
+    assert ('salaire_net', periods.period('2016-01')) not in base_simulation.traceback
+    assert_near(axes_compression.get_invariant_array('age', periods.period('2016-01')), [45, 45, 45])
+    assert not axes_compression.depends_on_varying_variables('age')
+
+
+def test_dependencies_discovered_when_a_variable_is_calculated_again():
+    base_simulation = tax_benefit_system.new_scenario().init_single_entity(
+        period = 2015,
+        parent1 = {'salaire_brut': 30000},
+        ).new_simulation(trace = True)
+    axes_compression = AxesCompression(base_simulation, varying_variables_name = ['salaire_brut'], steps_count = 3)
+    holder = base_simulation.get_or_new_holder('salaire_net')
+    holder.put_in_cache(np.array([2000.]), periods.period('2015-01'))
+    assert not axes_compression.depends_on_varying_variables('salaire_net')
+
+    # The step of salaire_net@2015-01 is now calculated by its formula, which depends on salaire_brut.
+    holder.delete_arrays()
+    base_simulation.calculate('salaire_net', '2015-01')
+    assert axes_compression.depends_on_varying_variables('salaire_net')
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from openfisca_dummy_country import DummyTaxBenefitSystem
+
+
+tax_benefit_system = DummyTaxBenefitSystem()
+
+
+def new_simulation(tax_benefit_system = tax_benefit_system, cache_statistics = True):
+    return tax_benefit_system.new_scenario().init_single_entity(
+        period = 2015,
+        parent1 = dict(salaire_brut = 12000),
+        ).new_simulation(cache_statistics = cache_statistics)
+
+
+def test_cache_statistics_are_disabled_by_default():
+    simulation = new_simulation(cache_statistics = False)
+    simulation.calculate('salaire_net', '2015-01')
+    assert simulation.cache_statistics is None
+
+
+def test_hits_misses_and_computations():
+    simulation = new_simulation()
+    simulation.calculate('salaire_net', '2015-01')
+    simulation.calculate('salaire_net', '2015-01')
+
+    statistics_by_variable_name = simulation.cache_statistics.to_dict()
+    salaire_net = statistics_by_variable_name['salaire_net']
+    assert salaire_net['hits'] == 1
+    assert salaire_net['misses'] == 1
+    assert salaire_net['computations'] == 1
+    assert salaire_net['nbytes_by_period'] == {'2015-01': 4}
+    assert salaire_net['last_access'] is not None
+    assert statistics_by_variable_name['salaire_brut']['hits'] == 1  # Set as input
+    assert statistics_by_variable_name['salaire_brut']['nbytes'] == 12 * 4
+
+
+def test_computation_time():
+    simulation = new_simulation()
+    start_time = time.time()
+    simulation.calculate('revenu_disponible', 2015)
+    elapsed_time = time.time() - start_time
+
+    statistics_by_variable_name = simulation.cache_statistics.to_dict()
+    assert statistics_by_variable_name['revenu_disponible']['computation_time'] > 0
+    assert statistics_by_variable_name['salaire_brut']['computation_time'] == 0  # Input variable
+    # The time spent in a formula excludes the time spent calculating its dependencies.
+    assert sum(statistics['computation_time'] for statistics in statistics_by_variable_name.itervalues()) <= elapsed_time
+
+
+def test_default_fallbacks():
+    reformed_tax_benefit_system = DummyTaxBenefitSystem()
+    reformed_tax_benefit_system.neutralize_variable('salaire_net')
+    simulation = new_simulation(reformed_tax_benefit_system)
+    simulation.calculate('salaire_net', '2015-01')
+    simulation.calculate('rsa', '2005-01')
+
+    statistics_by_variable_name = simulation.cache_statistics.to_dict()
+    assert statistics_by_variable_name['salaire_net']['default_fallbacks'] == 1
+    assert statistics_by_variable_name['rsa']['default_fallbacks'] == 1
+    assert statistics_by_variable_name['rsa']['computations'] == 0
+
+
+def test_table():
+    simulation = new_simulation()
+    simulation.calculate('salaire_net', '2015-01')
+    lines = simulation.cache_statistics.to_table().splitlines()
+    assert lines[0].split() == [u'Variable', u'Hits', u'Misses', u'Computations', u'Defaults', u'Bytes', u'Last',
+        u'access']
+    assert lines[1].startswith(u'salaire_brut')  # Variable holding the most memory
@@ -183,3 +183,26 @@ def test_cycle_1_level():
     variable7 = simulation.calculate('variable7', period = reference_period)
     # variable8 = simulation.calculate('variable8')
     assert_near(variable7, [22])
+
+
+def test_cycles_in_concurrent_calculations():
+    simulation = tax_benefit_system.new_scenario().init_single_entity(
+        period = reference_period,
+        parent1 = dict(),
+        ).new_simulation()
+    arrays_by_request = simulation.calculate_many(
+        ['variable5', 'variable7', 'cotisation'],
+        period = reference_period,
+        max_workers = 3,
+        )
+    assert_near(arrays_by_request.values(), [[5], [22], [1]])
+    assert simulation.requested_periods_by_variable_name == {}
+
+
+@raises(CycleError)
+def test_cycle_error_in_concurrent_calculations():
+    simulation = tax_benefit_system.new_scenario().init_single_entity(
+        period = reference_period,
+        parent1 = dict(),
+        ).new_simulation()
+    simulation.calculate_many(['variable3', 'variable7'], period = reference_period, max_workers = 2)
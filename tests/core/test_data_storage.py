@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from nose.tools import raises, with_setup
+
+from openfisca_core import periods
+from openfisca_core.columns import FloatCol, StrCol
+from openfisca_core.data_storage import MemoryConfig, publish_simulation, SharedSimulationData
+from openfisca_core.taxbenefitsystems import _get_function_digest
+from openfisca_core.tools import assert_near
+from openfisca_core.variables import Variable
+from openfisca_dummy_country import DummyTaxBenefitSystem
+from openfisca_dummy_country.entities import Famille, Individu
+
+
+tax_benefit_system = DummyTaxBenefitSystem()
+directory = None
+
+
+def setup_directory():
+    global directory
+    directory = tempfile.mkdtemp()
+
+
+def remove_directory():
+    shutil.rmtree(directory)
+
+
+def new_simulation(tax_benefit_system = tax_benefit_system):
+    return tax_benefit_system.new_scenario().init_from_test_case(
+        period = 2015,
+        test_case = {
+            'individus': [
+                {'id': 'ind0', 'salaire_brut': 12000, 'birth': '1980-01-01'},
+                {'id': 'ind1', 'salaire_brut': 6000},
+                {'id': 'ind2'},
+                {'id': 'ind3', 'salaire_brut': 24000},
+                ],
+            'familles': [
+                {'parents': ['ind0', 'ind1'], 'enfants': ['ind2'], 'city_code': '97123'},
+                {'parents': ['ind3']},
+                ],
+            },
+        ).new_simulation()
+
+
+@with_setup(setup_directory, remove_directory)
+def test_attached_simulation():
+    simulation = new_simulation()
+    publish_simulation(simulation, directory)
+    attached_simulation = SharedSimulationData(directory).new_simulation(tax_benefit_system)
+
+    assert attached_simulation.period == simulation.period
+    assert attached_simulation.persons.count == 4
+    famille = attached_simulation.famille
+    assert famille.count == 2
+    assert isinstance(famille.members_entity_id, np.memmap)
+    assert_near(famille.members_entity_id, [0, 0, 0, 1])
+    assert_near(famille.members_legacy_role, [0, 1, 2, 0])
+    assert (famille.members_role == [Famille.DEMANDEUR, Famille.CONJOINT, Famille.ENFANT, Famille.DEMANDEUR]).all()
+
+    assert_near(
+        attached_simulation.calculate('revenu_disponible', 2015),
+        simulation.calculate('revenu_disponible', 2015),
+        )
+    assert_near(
+        attached_simulation.calculate('revenu_disponible_famille', 2015),
+        simulation.calculate('revenu_disponible_famille', 2015),
+        )
+
+
+@with_setup(setup_directory, remove_directory)
+def test_shared_arrays_are_not_copied():
+    publish_simulation(new_simulation(), directory)
+    shared_data = SharedSimulationData(directory)
+    simulation_1 = shared_data.new_simulation(tax_benefit_system)
+    simulation_2 = shared_data.new_simulation(tax_benefit_system)
+
+    salaire_brut = simulation_1.get_array('salaire_brut', '2015-01')
+    assert isinstance(salaire_brut, np.memmap)
+    assert_near(salaire_brut, [1000, 500, 0, 2000])
+    assert_near(simulation_2.get_array('salaire_brut', '2015-01'), salaire_brut)
+    assert simulation_1.get_array('city_code', None).tolist() == ['97123', '']
+
+
+class nom(Variable):
+    column = StrCol
+    entity = Individu
+    definition_period = periods.ETERNITY
+
+
+nom_tax_benefit_system = DummyTaxBenefitSystem()
+nom_tax_benefit_system.add_variable(nom)
+
+
+@with_setup(setup_directory, remove_directory)
+def test_shared_object_arrays():
+    simulation = new_simulation(nom_tax_benefit_system)
+    simulation.get_or_new_holder('nom').array = np.array([u'Alice', u'Bob', u'Charlie', u'Dan'], dtype = object)
+    publish_simulation(simulation, directory)
+    attached_simulation = SharedSimulationData(directory).new_simulation(nom_tax_benefit_system)
+    nom_array = attached_simulation.get_array('nom', None)
+    assert nom_array.dtype == object
+    assert nom_array.tolist() == [u'Alice', u'Bob', u'Charlie', u'Dan']
+
+
+@raises(ValueError)
+@with_setup(setup_directory, remove_directory)
+def test_shared_arrays_are_read_only():
+    publish_simulation(new_simulation(), directory)
+    simulation = SharedSimulationData(directory).new_simulation(tax_benefit_system)
+    simulation.get_array('salaire_brut', '2015-01')[0] = 0
+
+
+def new_projection_simulation(memory_config):
+    simulation = tax_benefit_system.new_scenario().init_single_entity(
+        period = 2015,
+        parent1 = dict(),
+        ).new_simulation(memory_config = memory_config)
+    for month in range(1, 13):
+        simulation.get_or_new_holder('salaire_brut').put_in_cache(
+            np.array([1000. * month]), periods.period('2015-{:02d}'.format(month)))
+    return simulation
+
+
+@with_setup(setup_directory, remove_directory)
+def test_spill_by_age():
+    simulation = new_projection_simulation(MemoryConfig(max_periods_in_memory = 3, scratch_directory = directory))
+    array_by_period = simulation.get_holder('salaire_brut')._array_by_period
+    spilled_periods = sorted(
+        str(period)
+        for period, array in array_by_period.iteritems()
+        if isinstance(array, np.memmap)
+        )
+    assert spilled_periods == ['2015-{:02d}'.format(month) for month in range(1, 10)], spilled_periods
+    assert_near(simulation.calculate('salaire_brut', '2015-01'), [1000])
+    assert_near(simulation.calculate_add('salaire_brut', 2015), [78000])
+    assert_near(simulation.calculate('salaire_net', '2015-01'), [800])
+
+
+@with_setup(setup_directory, remove_directory)
+def test_spill_by_size():
+    memory_config = MemoryConfig(max_memory_occupation = 4 * 8, scratch_directory = directory)
+    simulation = new_projection_simulation(memory_config)
+    array_by_period = simulation.get_holder('salaire_brut')._array_by_period
+    assert memory_config.memory_occupation <= 4 * 8
+    assert sum(not isinstance(array, np.memmap) for array in array_by_period.itervalues()) == 4
+    assert not isinstance(array_by_period[periods.period('2015-12')], np.memmap)
+    assert_near(simulation.calculate_add('salaire_brut', 2015), [78000])
+
+
+@with_setup(setup_directory, remove_directory)
+def test_clones_have_their_own_memory_accounting():
+    memory_config = MemoryConfig(max_periods_in_memory = 3, scratch_directory = directory)
+    simulation = new_projection_simulation(memory_config)
+    memory_occupation = memory_config.memory_occupation
+    clone = simulation.clone()
+    assert clone.memory_config is not memory_config
+    for month in range(1, 13):
+        clone.calculate('salaire_net', '2015-{:02d}'.format(month))
+    assert memory_config.memory_occupation == memory_occupation
+    assert clone.memory_config.memory_occupation == 3 * clone.calculate('salaire_net', '2015-12').nbytes
+    assert simulation.get_holder('salaire_net', None) is None
+    assert_near(clone.calculate_add('salaire_net', 2015), [62400])
+
+
+@with_setup(setup_directory, remove_directory)
+def test_pinned_variables_are_not_spilled():
+    simulation = new_projection_simulation(MemoryConfig(
+        max_periods_in_memory = 1,
+        pinned_variables = ['salaire_brut'],
+        scratch_directory = directory,
+        ))
+    array_by_period = simulation.get_holder('salaire_brut')._array_by_period
+    assert not any(isinstance(array, np.memmap) for array in array_by_period.itervalues())
+
+
+@with_setup(setup_directory, remove_directory)
+def test_warm_start_from_saved_cache():
+    path = os.path.join(directory, 'cache.npz')
+    simulation = new_simulation()
+    revenu_disponible = simulation.calculate('revenu_disponible', 2015)
+    simulation.save_cache(path)
+
+    warm_simulation = new_simulation()
+    warm_simulation.load_cache(path)
+    assert_near(warm_simulation.get_holder('revenu_disponible').get_array(periods.period(2015)), revenu_disponible)
+    assert (warm_simulation.calculate('city_code', 2015) == simulation.calculate('city_code', 2015)).all()
+    assert (warm_simulation.calculate('birth', 2015) == simulation.calculate('birth', 2015)).all()
+
+
+@raises(ValueError)
+@with_setup(setup_directory, remove_directory)
+def test_stale_cache_is_rejected():
+    path = os.path.join(directory, 'cache.npz')
+    new_simulation().save_cache(path)
+
+    reformed_tax_benefit_system = DummyTaxBenefitSystem()
+    reformed_tax_benefit_system.neutralize_variable('rsa')
+    new_simulation(reformed_tax_benefit_system).load_cache(path)
+
+
+def compute_prime(salaire_brut):
+    return salaire_brut * 0.1
+
+
+class prime(Variable):
+    column = FloatCol
+    entity = Individu
+    definition_period = periods.MONTH
+
+    def function(individu, period):
+        return compute_prime(individu('salaire_brut', period))
+
+
+@raises(ValueError)
+@with_setup(setup_directory, remove_directory)
+def test_cache_is_invalidated_by_a_change_of_helper_function():
+    global compute_prime
+    path = os.path.join(directory, 'cache.npz')
+    prime_tax_benefit_system = DummyTaxBenefitSystem()
+    prime_tax_benefit_system.add_variable(prime)
+    simulation = new_simulation(prime_tax_benefit_system)
+    simulation.calculate('prime', '2015-01')
+    simulation.save_cache(path)
+
+    original_compute_prime = compute_prime
+    compute_prime = lambda salaire_brut: salaire_brut * 0.2  # noqa
+    try:
+        new_simulation(prime_tax_benefit_system).load_cache(path)
+    finally:
+        compute_prime = original_compute_prime
+
+
+@with_setup(setup_directory, remove_directory)
+def test_cache_of_object_arrays():
+    path = os.path.join(directory, 'cache.npz')
+    simulation = new_simulation(nom_tax_benefit_system)
+    simulation.get_or_new_holder('nom').array = np.array([u'Alice', u'Bob', u'Charlie', u'Dan'], dtype = object)
+    simulation.save_cache(path)
+
+    warm_simulation = new_simulation(nom_tax_benefit_system)
+    warm_simulation.load_cache(path)
+    assert warm_simulation.get_array('nom', None).tolist() == [u'Alice', u'Bob', u'Charlie', u'Dan']
+
+
+def test_fingerprint_does_not_depend_on_file_name_nor_line_numbers():
+    source = 'def compute_prime(salaire_brut):\n    return salaire_brut * 0.1\n'
+    functions = []
+    for file_name, prefix in (('helpers.py', ''), ('/elsewhere/helpers.py', '\n\n')):
+        namespace = {}
+        exec compile(prefix + source, file_name, 'exec') in namespace
+        functions.append(namespace['compute_prime'])
+    assert functions[0].func_code.co_firstlineno != functions[1].func_code.co_firstlineno
+    assert _get_function_digest(functions[0], {}) == _get_function_digest(functions[1], {})
+    assert _get_function_digest(functions[0], {}) != _get_function_digest(compute_prime_double, {})
+
+
+def compute_prime_double(salaire_brut):
+    return salaire_brut * 0.2
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from openfisca_core import periods
+from openfisca_core.model_api import age_in_months, age_in_years, months_between, period_start, period_stop, MONTH, YEAR
+
+
+dates = np.array(['2012-02-29', '2015-01-31', '2015-12-01'], dtype = 'datetime64[D]')
+
+
+def test_period_start():
+    assert period_start(dates, MONTH).tolist() == np.array(
+        ['2012-02-01', '2015-01-01', '2015-12-01'], dtype = 'datetime64[D]').tolist()
+    assert period_start(dates, YEAR).tolist() == np.array(
+        ['2012-01-01', '2015-01-01', '2015-01-01'], dtype = 'datetime64[D]').tolist()
+
+
+def test_period_stop():
+    assert period_stop(dates, MONTH).tolist() == np.array(
+        ['2012-02-29', '2015-01-31', '2015-12-31'], dtype = 'datetime64[D]').tolist()
+    assert period_stop(dates, YEAR).tolist() == np.array(
+        ['2012-12-31', '2015-12-31', '2015-12-31'], dtype = 'datetime64[D]').tolist()
+
+
+def test_months_between():
+    assert months_between(dates, np.datetime64('2016-02-29')).tolist() == [48, 12, 2]
+    assert months_between(dates, np.array(dates)).tolist() == [0, 0, 0]
+
+
+def test_age():
+    birth = np.array(['2000-01-01', '2000-01-02', '2012-02-29'], dtype = 'datetime64[D]')
+    assert age_in_years(birth, periods.period(u'2016-01')).tolist() == [16, 15, 3]
+    assert age_in_months(birth, periods.period(u'2016-01')).tolist() == [192, 191, 46]
@@ -3,7 +3,7 @@
 import numpy
 from nose.tools import raises
 
-from openfisca_core.formula_helpers import apply_thresholds as apply_thresholds
+from openfisca_core.formula_helpers import apply_thresholds as apply_thresholds, switch
 from openfisca_core.tools import assert_near
 
 
@@ -45,3 +45,41 @@ def test_apply_thresholds_with_variable_threshold():
     choice_list = [True, False]  # True if input <= threshold, false otherwise
     result = apply_thresholds(input, thresholds, choice_list)
     assert_near(result, [False, True, True])
+
+
+def test_apply_thresholds_with_unsorted_thresholds():
+    input = numpy.array([4, 6, 8])
+    thresholds = [7, 5]
+    choice_list = [10, 20, 30]
+    result = apply_thresholds(input, thresholds, choice_list)
+    assert_near(result, [10, 10, 30])
+
+
+def test_apply_thresholds_gives_the_same_result_than_select():
+    input = numpy.random.uniform(0, 10, 1000)
+    thresholds = [2, 5, 5, 7.5]
+    choice_list = [1, 2, 3, 4, 5.5]
+    condlist = [input <= threshold for threshold in thresholds] + [True]
+    expected = numpy.select(condlist, choice_list)
+    result = apply_thresholds(input, thresholds, choice_list)
+    assert result.dtype == expected.dtype
+    assert (result == expected).all()
+
+
+def test_switch():
+    conditions = numpy.array([1, 2, 3, -1, 2])
+    value_by_condition = {1: 80, 2: 90, 3: 95}
+    result = switch(conditions, value_by_condition)
+    assert_near(result, [80, 90, 95, 0, 90])
+
+
+def test_switch_with_sparse_keys():
+    conditions = numpy.array([1, 10 ** 9, 3])
+    value_by_condition = {1: 1.5, 10 ** 9: 2}
+    assert_near(switch(conditions, value_by_condition), [1.5, 2, 0])
+
+
+def test_switch_with_non_integer_conditions():
+    conditions = numpy.array(['a', 'b', 'c'])
+    value_by_condition = {'a': 1, 'b': 2}
+    assert_near(switch(conditions, value_by_condition), [1, 2, 0])
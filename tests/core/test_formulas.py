@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 
 
+import datetime
+
 import numpy as np
 
+from openfisca_core import periods
 from openfisca_core.columns import IntCol
+from openfisca_core.formulas import dated_function
 from openfisca_core.periods import MONTH
-from openfisca_core.variables import Variable
+from openfisca_core.tools import assert_near
+from openfisca_core.variables import DatedVariable, Variable
 from openfisca_core.formula_helpers import switch
 import openfisca_dummy_country as dummy_country
-from openfisca_dummy_country.entities import Individu
+from openfisca_dummy_country.entities import Famille, Individu
 
 
 class choice(Variable):
@@ -47,9 +52,39 @@ class uses_switch(Variable):
         return result
 
 
+class dated_with_gap(DatedVariable):
+    column = IntCol
+    entity = Individu
+    definition_period = MONTH
+
+    @dated_function(start = datetime.date(2010, 1, 1), stop = datetime.date(2010, 12, 31))
+    def function_2010(self, simulation, period):
+        return self.zeros() + 2010
+
+    @dated_function(start = datetime.date(2012, 1, 1))
+    def function_2012(self, simulation, period):
+        return self.zeros() + 2012
+
+
+class uses_legacy_helpers(Variable):
+    column = IntCol
+    entity = Famille
+    label = u'Variable with formula that uses legacy aggregation helpers'
+    definition_period = MONTH
+
+    def function(self, simulation, period):
+        choice_holder = simulation.compute('choice', period)
+        sum_all = self.sum_by_entity(choice_holder)
+        sum_parents = self.sum_by_entity(choice_holder, roles = [0, 1])
+        any_first_child = self.any_by_roles(choice_holder.array == 2, roles = [2])
+        second_parent = self.filter_role(choice_holder, role = 1)
+        first_parent = self.split_by_roles(choice_holder)[0]
+        return sum_all * 10000 + sum_parents * 1000 + any_first_child * 100 + second_parent * 10 + first_parent
+
+
 # TaxBenefitSystem instance declared after formulas
 tax_benefit_system = dummy_country.DummyTaxBenefitSystem()
-tax_benefit_system.add_variables(choice, uses_multiplication, uses_switch)
+tax_benefit_system.add_variables(choice, uses_multiplication, uses_switch, dated_with_gap, uses_legacy_helpers)
 month = '2013-01'
 scenario = tax_benefit_system.new_scenario().init_from_attributes(
     period = month,
@@ -77,3 +112,62 @@ def test_compare_multiplication_and_switch():
     uses_multiplication = simulation.calculate('uses_multiplication', period = month)
     uses_switch = simulation.calculate('uses_switch', period = month)
     assert np.all(uses_switch == uses_multiplication)
+
+
+def test_dated_formulas_dispatch():
+    simulation = scenario.new_simulation()
+    expected_by_month = [
+        ('2009-12', 0),
+        ('2010-01', 2010),
+        ('2010-12', 2010),
+        ('2011-06', 0),
+        ('2012-01', 2012),
+        ('2030-01', 2012),
+        ]
+    for month, expected in expected_by_month:
+        assert_near(simulation.calculate('dated_with_gap', month), np.zeros(1000) + expected)
+
+    # Once the values are removed from the holder cache, the formulas are dispatched from the memo.
+    holder = simulation.get_holder('dated_with_gap')
+    holder.delete_arrays()
+    find_calls = []
+    holder.formula.find_dated_formula_index = lambda instant: find_calls.append(instant)
+    for month, expected in expected_by_month:
+        assert_near(simulation.calculate('dated_with_gap', month), np.zeros(1000) + expected)
+    assert find_calls == []
+
+
+def test_dated_formulas_at_instant():
+    formula_class = tax_benefit_system.get_column('dated_with_gap').formula_class
+    assert formula_class.at_instant(periods.instant('2010-06-01')).function.__name__ == 'function_2010'
+    assert formula_class.at_instant(periods.instant('2013-01-01')).function.__name__ == 'function_2012'
+    assert formula_class.at_instant(periods.instant('2011-06-01'), default = None) is None
+
+
+def test_legacy_aggregation_helpers():
+    simulation = tax_benefit_system.new_scenario().init_from_test_case(
+        period = month,
+        test_case = {
+            'individus': [
+                {'id': 'ind0', 'choice': 1},
+                {'id': 'ind1', 'choice': 2},
+                {'id': 'ind2', 'choice': 2},
+                {'id': 'ind3', 'choice': 1},
+                {'id': 'ind4', 'choice': 3},
+                ],
+            'familles': [
+                {'parents': ['ind0', 'ind1'], 'enfants': ['ind2']},
+                {'parents': ['ind3'], 'enfants': ['ind4']},
+                ],
+            },
+        ).new_simulation()
+    assert_near(simulation.calculate('uses_legacy_helpers', month), [50000 + 3000 + 100 + 20 + 1, 40000 + 1000 + 1])
+    formula = simulation.get_holder('uses_legacy_helpers').formula
+    cast = formula.cast_from_entity_to_roles(simulation.compute('uses_legacy_helpers', month), roles = [0, 2])
+    assert_near(cast, [53121, 0, 53121, 41001, 41001])
+    assert formula.split_by_roles(simulation.compute('choice', month), roles = []) == {}
+    large_integers = np.array([2 ** 53 + 1, 1, 0, 0, 2], dtype = np.int64)
+    sum_by_famille = formula.sum_by_entity(large_integers)
+    assert sum_by_famille.dtype == np.int64
+    assert sum_by_famille.tolist() == [2 ** 53 + 2, 2]
+    assert formula.sum_by_entity(np.array([1, 2, 3, 4, 5], dtype = np.int16)).dtype == np.int16
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from openfisca_core import periods
+from openfisca_core.base_functions import requested_period_last_or_next_value, requested_period_last_value
+from openfisca_core.columns import IntCol
+from openfisca_core.periods import MONTH
+from openfisca_core.tools import assert_near
+from openfisca_core.variables import Variable
+import openfisca_dummy_country as dummy_country
+from openfisca_dummy_country.entities import Individu
+
+
+class last_value(Variable):
+    column = IntCol
+    entity = Individu
+    base_function = requested_period_last_value
+    definition_period = MONTH
+
+
+class last_or_next_value(Variable):
+    column = IntCol
+    entity = Individu
+    base_function = requested_period_last_or_next_value
+    definition_period = MONTH
+
+
+tax_benefit_system = dummy_country.DummyTaxBenefitSystem()
+tax_benefit_system.add_variables(last_value, last_or_next_value)
+
+
+def new_simulation():
+    return tax_benefit_system.new_scenario().init_single_entity(
+        period = 2015,
+        parent1 = dict(),
+        ).new_simulation()
+
+
+def test_known_periods_are_sorted_by_start():
+    simulation = new_simulation()
+    holder = simulation.get_or_new_holder('last_value')
+    for period in ['2015-06', '2014-01', '2016-03']:
+        holder.put_in_cache(np.array([1]), periods.period(period))
+    assert holder.get_known_periods() == [periods.period(period) for period in ['2014-01', '2015-06', '2016-03']]
+
+    # Periods added after the index has been built are inserted at their place.
+    holder.put_in_cache(np.array([1]), periods.period('2015-01'))
+    assert holder.get_known_periods() == [
+        periods.period(period)
+        for period in ['2014-01', '2015-01', '2015-06', '2016-03']
+        ]
+    assert simulation.clone().get_holder('last_value').get_known_periods() == holder.get_known_periods()
+
+
+def test_last_value():
+    simulation = new_simulation()
+    holder = simulation.get_or_new_holder('last_value')
+    holder.put_in_cache(np.array([1]), periods.period('2014-01'))
+    holder.put_in_cache(np.array([2]), periods.period('2015-06'))
+    assert_near(simulation.calculate('last_value', '2013-01'), [0])
+    assert_near(simulation.calculate('last_value', '2014-12'), [1])
+    assert_near(simulation.calculate('last_value', '2015-05'), [1])
+    assert_near(simulation.calculate('last_value', '2016-12'), [2])
+
+
+def test_last_or_next_value():
+    simulation = new_simulation()
+    holder = simulation.get_or_new_holder('last_or_next_value')
+    holder.put_in_cache(np.array([1]), periods.period('2014-01'))
+    holder.put_in_cache(np.array([2]), periods.period('2015-06'))
+    assert_near(simulation.calculate('last_or_next_value', '2013-01'), [1])
+    assert_near(simulation.calculate('last_or_next_value', '2015-07'), [2])
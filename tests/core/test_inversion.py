@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+from nose.tools import raises
+
+from openfisca_core.inversion import invert
+from openfisca_core.simulations import Simulation
+from openfisca_core.tools import assert_near
+from openfisca_dummy_country import DummyTaxBenefitSystem
+
+
+tax_benefit_system = DummyTaxBenefitSystem()
+
+
+def new_simulation():
+    return tax_benefit_system.new_scenario().init_from_test_case(
+        period = 2015,
+        test_case = {
+            'individus': [
+                {'id': 'ind0', 'salaire_brut': 12000},
+                {'id': 'ind1', 'salaire_brut': 30000},
+                {'id': 'ind2'},
+                ],
+            'familles': [
+                {'parents': ['ind0', 'ind1'], 'enfants': ['ind2']},
+                ],
+            },
+        ).new_simulation()
+
+
+def test_net_to_gross():
+    simulation = new_simulation()
+    salaire_brut, converged = invert(simulation, 'salaire_net', 'salaire_brut', [8000, 24000, 0], period = 2015)
+    assert_near(salaire_brut, [10000, 30000, 0], absolute_error_margin = 0.1)
+    assert converged.all()
+    # The original simulation is not modified.
+    assert_near(simulation.calculate_add('salaire_brut', 2015), [12000, 30000, 0], absolute_error_margin = 0.01)
+    assert simulation.persons.simulation is simulation
+
+
+def test_chain_inversion_reports_unreachable_values():
+    simulation = new_simulation()
+    target_value = [20000, 1000, 3000]
+    salaire_brut, converged = invert(simulation, 'revenu_disponible', 'salaire_brut', target_value, period = 2015)
+    assert converged.tolist() == [True, False, False]  # The RSA guarantees a minimal income.
+
+    simulation.get_or_new_holder('salaire_brut').delete_arrays()
+    simulation.get_or_new_holder('salaire_brut').set_input(simulation.period, salaire_brut)
+    assert_near(simulation.calculate('revenu_disponible', 2015)[0], 20000, absolute_error_margin = 0.01)
+
+
+def test_unreachable_values_stop_the_bracketing():
+    simulation = new_simulation()
+    clones = []
+    clone = Simulation.clone
+
+    def counting_clone(self, *args, **kwargs):
+        clones.append(self)
+        return clone(self, *args, **kwargs)
+
+    Simulation.clone = counting_clone
+    try:
+        salaire_brut, converged = invert(simulation, 'revenu_disponible', 'salaire_brut', [1000, 1000, 3000],
+            period = 2015)
+    finally:
+        Simulation.clone = clone
+    assert not converged.any()
+    # The upper bound isn't doubled again once the residual stops improving.
+    assert len(clones) < 10, len(clones)
+
+
+@raises(ValueError)
+def test_different_entities():
+    invert(new_simulation(), 'revenu_disponible_famille', 'salaire_brut', [20000], period = 2015)
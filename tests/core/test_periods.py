@@ -2,6 +2,7 @@
 
 from nose.tools import assert_equal, raises
 
+from openfisca_core import periods
 from openfisca_core.periods import Period, Instant, YEAR, MONTH, period
 
 first_jan = Instant((2014, 1, 1))
@@ -107,3 +108,53 @@ def test_none():
 @raises(ValueError)
 def test_empty_string():
     period('')
+
+
+# Test offsets
+
+def test_offsets_are_memoized():
+    month = period(u'2014-12')
+    assert month.offset(1) is month.offset(1)
+    assert month.offset(1) == period(u'2015-01')
+    assert month.offset(1).stop is period(u'2015-01').stop
+
+
+def test_large_month_offsets():
+    assert_equal(Instant((2014, 3, 31)).offset(-27, MONTH), Instant((2011, 12, 31)))
+    assert_equal(Instant((2014, 3, 31)).offset(35, MONTH), Instant((2017, 2, 28)))
+    assert_equal(Period((MONTH, first_march, 34)).stop, Instant((2016, 12, 31)))
+
+
+# Test caches
+
+def test_parsed_periods_are_interned():
+    assert period(u'2014-07') is period(u'2014-07')
+    assert periods.instant(u'2014-07-14') is periods.instant(u'2014-07-14')
+
+
+def test_bounded_cache():
+    cache = periods.BoundedCache(max_size = 2)
+    for key in range(3):
+        cache[key] = key * 10
+    assert len(cache) == 2
+    assert cache.get(0) is None  # Evicted
+    assert cache.get(2) == 20
+    assert cache.get_statistics()['hits'] == 0  # Statistics are opt-in.
+
+    cache.enable_statistics()
+    assert cache.get(0) is None
+    assert cache.get(2) == 20
+    statistics = cache.get_statistics()
+    assert (statistics['hits'], statistics['misses'], statistics['hit_rate']) == (1, 1, 0.5)
+
+
+def test_caches_statistics():
+    periods.enable_caches_statistics()
+    try:
+        periods.period_by_str_cache.clear()
+        period(u'2014-07')
+        period(u'2014-07')
+        statistics = periods.get_caches_statistics()[u'period_by_str_cache']
+        assert (statistics['hits'], statistics['misses']) == (1, 1), statistics
+    finally:
+        periods.enable_caches_statistics(False)
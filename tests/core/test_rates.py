@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from nose.tools import raises
+
+from openfisca_core.rates import average_rate, marginal_effective_rate, marginal_rate
+from openfisca_core.tools import assert_near
+from openfisca_dummy_country import DummyTaxBenefitSystem
+
+
+tax_benefit_system = DummyTaxBenefitSystem()
+
+
+def new_simulation(salaire_brut_delta = 0, trace = False):
+    return tax_benefit_system.new_scenario().init_from_test_case(
+        period = 2015,
+        test_case = {
+            'individus': [
+                {'id': 'ind0', 'salaire_brut': 12000 + salaire_brut_delta},
+                {'id': 'ind1', 'salaire_brut': 30000 + salaire_brut_delta},
+                {'id': 'ind2', 'salaire_brut': salaire_brut_delta},
+                {'id': 'ind3', 'salaire_brut': 100000 + salaire_brut_delta},
+                ],
+            'familles': [
+                {'parents': ['ind0', 'ind1'], 'enfants': ['ind2']},
+                {'parents': ['ind3']},
+                ],
+            },
+        ).new_simulation(trace = trace)
+
+
+def test_average_rate():
+    assert_near(average_rate(target = np.array([80., 0.]), varying = np.array([100., 0.])), [0.2, 1],
+        absolute_error_margin = 1e-9)
+
+
+def test_marginal_rate():
+    assert_near(marginal_rate(target = np.array([0., 80., 140.]), varying = np.array([0., 100., 200.])), [0.2, 0.4],
+        absolute_error_margin = 1e-9)
+
+
+def test_marginal_effective_rate():
+    simulation = new_simulation()
+    assert_near(
+        marginal_effective_rate(simulation, target = 'salaire_net', varying = 'salaire_brut', period = '2015-01'),
+        [0.2] * 4,
+        absolute_error_margin = 1e-4,
+        )
+
+    perturbed_value = new_simulation(salaire_brut_delta = 100).calculate('revenu_disponible', 2015)
+    expected = 1 - (perturbed_value - simulation.calculate('revenu_disponible', 2015)) / 100
+    assert_near(
+        marginal_effective_rate(simulation, target = 'revenu_disponible', varying = 'salaire_brut', period = 2015),
+        expected,
+        absolute_error_margin = 1e-4,
+        )
+
+
+def test_marginal_effective_rate_of_group_entity():
+    simulation = new_simulation()
+    perturbed_value = new_simulation(salaire_brut_delta = 100).calculate('revenu_disponible_famille', 2015)
+    expected = 1 - (perturbed_value - simulation.calculate('revenu_disponible_famille', 2015)) / np.array([300, 100])
+    assert_near(
+        marginal_effective_rate(simulation, target = 'revenu_disponible_famille', varying = 'salaire_brut',
+            period = 2015),
+        expected,
+        absolute_error_margin = 1e-4,
+        )
+
+
+def test_marginal_effective_rate_does_not_modify_simulation():
+    simulation = new_simulation()
+    known_periods_by_variable_name = dict(
+        (variable_name, sorted(holder._array_by_period or {}))
+        for variable_name, holder in simulation.holder_by_name.iteritems()
+        )
+    marginal_effective_rate(simulation, target = 'revenu_disponible', varying = 'salaire_imposable', period = 2015)
+    assert dict(
+        (variable_name, sorted(holder._array_by_period or {}))
+        for variable_name, holder in simulation.holder_by_name.iteritems()
+        ) == known_periods_by_variable_name
+
+
+def test_marginal_effective_rate_with_input_of_formula_variable():
+    simulation = new_simulation()
+    # salaire_imposable has a formula depending on salaire_brut, but its value is set: it doesn't vary.
+    simulation.get_or_new_holder('salaire_imposable').put_in_cache(
+        np.array([10000., 20000., 0., 80000.], dtype = np.float32), simulation.period)
+    rates = marginal_effective_rate(simulation, target = 'revenu_disponible', varying = 'salaire_brut',
+        period = 2015)
+    assert_near(rates, [1] * 4, absolute_error_margin = 1e-4)
+
+
+def test_marginal_effective_rate_reuses_traced_values():
+    simulation = new_simulation(trace = True)
+    expected = marginal_effective_rate(new_simulation(), target = 'revenu_disponible', varying = 'salaire_brut',
+        period = 2015)
+    simulation.calculate('revenu_disponible', 2015)
+    assert_near(
+        marginal_effective_rate(simulation, target = 'revenu_disponible', varying = 'salaire_brut', period = 2015),
+        expected,
+        absolute_error_margin = 1e-4,
+        )
+
+
+@raises(ValueError)
+def test_marginal_effective_rate_of_another_group_entity():
+    marginal_effective_rate(new_simulation(), target = 'revenu_disponible_famille', varying = 'api', period = 2015)
@@ -1,6 +1,16 @@
 # -*- coding: utf-8 -*-
 
+from multiprocessing.pool import ThreadPool
+import time
+
+import numpy as np
+from nose.tools import raises
+
+from openfisca_core import periods
+from openfisca_core.simulations import Simulation
+from openfisca_core.tools import assert_near
 from openfisca_dummy_country import DummyTaxBenefitSystem
+from openfisca_dummy_country.entities import Famille
 
 
 tax_benefit_system = DummyTaxBenefitSystem()
@@ -13,3 +23,117 @@ scenario = tax_benefit_system.new_scenario().init_single_entity(
 def test_calculate_with_trace():
     simulation = scenario.new_simulation(trace=True)
     simulation.calculate('revenu_disponible', 2014)
+
+
+def test_calculate_many():
+    simulation = scenario.new_simulation()
+    requested_variables = ['revenu_disponible', 'salaire_imposable', 'contribution_sociale']
+    arrays_by_request = simulation.calculate_many(requested_variables, period = 2014, max_workers = 3)
+    reference_simulation = scenario.new_simulation()
+    for (variable_name, period), array in arrays_by_request.iteritems():
+        assert str(period) == '2014'
+        assert (array == reference_simulation.calculate(variable_name, 2014)).all()
+
+
+def test_calculate_many_with_several_periods():
+    simulation = scenario.new_simulation()
+    requests = [('rsa', '2014-{:02d}'.format(month)) for month in range(1, 13)]
+    arrays_by_request = simulation.calculate_many(requests, max_workers = 4)
+    assert len(arrays_by_request) == 12
+    assert (sum(arrays_by_request.itervalues()) == simulation.calculate_add('rsa', 2014)).all()
+
+
+def test_holders_are_created_once_by_concurrent_threads():
+    simulation = scenario.new_simulation()
+    pool = ThreadPool(8)
+    try:
+        holders = pool.map(lambda _: simulation.get_or_new_holder('salaire_net'), range(64))
+    finally:
+        pool.close()
+        pool.join()
+    assert all(holder is simulation.get_holder('salaire_net') for holder in holders)
+
+
+def test_calculate_many_calculates_shared_dependencies_once():
+    simulation = scenario.new_simulation()
+    formula = simulation.get_or_new_holder('salaire_imposable').formula
+    requested_periods = []
+    compute = formula.compute
+
+    def slow_compute(period, **parameters):
+        requested_periods.append(period)
+        time.sleep(0.05)  # Let the other threads request the value before it is cached.
+        return compute(period = period, **parameters)
+
+    formula.compute = slow_compute
+    requested_variables = ['revenu_disponible', 'salaire_imposable', 'salaire_imposable', 'revenu_disponible']
+    arrays_by_request = simulation.calculate_many(requested_variables, period = 2014, max_workers = 4)
+    assert requested_periods == [periods.period(2014)], requested_periods
+    salaire_imposable = scenario.new_simulation().calculate('salaire_imposable', 2014)
+    assert (arrays_by_request[('salaire_imposable', periods.period(2014))] == salaire_imposable).all()
+
+
+@raises(ValueError)
+def test_calculate_many_with_trace():
+    simulation = scenario.new_simulation(trace = True)
+    simulation.calculate_many(['revenu_disponible', 'salaire_imposable'], period = 2014, max_workers = 2)
+
+
+def test_from_arrays():
+    salaire_brut = np.array([12000, 0, 0, 24000, 0, 0], dtype = np.float32)
+    simulation = Simulation.from_arrays(
+        tax_benefit_system,
+        period = 2015,
+        groups = {
+            'famille': {
+                'members_entity_id': np.array([0, 0, 0, 1, 1, 0]),
+                'members_role': np.array([0, 1, 2, 0, 2, 2]),
+                },
+            },
+        inputs = {
+            'salaire_brut': {'2015': salaire_brut},
+            'city_code': np.array(['75012', '97123'], dtype = '|S5'),
+            },
+        )
+    reference_simulation = tax_benefit_system.new_scenario().init_from_test_case(
+        period = 2015,
+        test_case = {
+            'individus': [
+                {'id': 'ind0', 'salaire_brut': 12000},
+                {'id': 'ind1'},
+                {'id': 'ind2'},
+                {'id': 'ind3', 'salaire_brut': 24000},
+                {'id': 'ind4'},
+                {'id': 'ind5'},
+                ],
+            'familles': [
+                {'parents': ['ind0', 'ind1'], 'enfants': ['ind2', 'ind5'], 'city_code': '75012'},
+                {'parents': ['ind3'], 'enfants': ['ind4'], 'city_code': '97123'},
+                ],
+            },
+        ).new_simulation()
+
+    famille = simulation.famille
+    reference_famille = reference_simulation.famille
+    assert simulation.persons.count == 6
+    assert famille.count == 2
+    assert_near(famille.members_entity_id, reference_famille.members_entity_id)
+    assert_near(famille.members_legacy_role, reference_famille.members_legacy_role)
+    assert (famille.members_role == reference_famille.members_role).all()
+    assert famille.members_role[0] is Famille.DEMANDEUR
+    assert famille.roles_count == reference_famille.roles_count
+    assert_near(simulation.calculate('salaire_net', '2015-06'), [800, 0, 0, 1600, 0, 0])
+    assert_near(simulation.calculate('revenu_disponible_famille', 2015),
+        reference_simulation.calculate('revenu_disponible_famille', 2015))
+
+
+def test_from_arrays_does_not_copy_inputs():
+    age = np.array([40, 30], dtype = np.int32)
+    simulation = Simulation.from_arrays(tax_benefit_system, period = '2015-01', inputs = {'age': age})
+    assert simulation.famille.count == 2
+    assert simulation.get_holder('age').get_array(periods.period('2015-01')) is age
+
+
+@raises(ValueError)
+def test_from_arrays_with_wrong_dtype():
+    Simulation.from_arrays(tax_benefit_system, period = '2015-01', inputs = {'age': np.array([1.5, 2.5])})
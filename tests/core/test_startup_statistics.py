@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from openfisca_core import startup_statistics
+from openfisca_dummy_country import DummyTaxBenefitSystem
+
+
+def test_startup_statistics_are_disabled_by_default():
+    DummyTaxBenefitSystem()
+    assert startup_statistics.current is None
+
+
+def test_phases_and_files():
+    statistics = startup_statistics.enable()
+    try:
+        DummyTaxBenefitSystem().get_legislation()
+    finally:
+        startup_statistics.disable()
+
+    phases_statistics = statistics.get_phases_statistics()
+    assert phases_statistics[u'introspection'] > 0
+    assert phases_statistics[u'legislation_parsing'] > 0
+    files_statistics = dict(
+        (os.path.basename(file_statistics['file'] or ''), file_statistics)
+        for file_statistics in statistics.get_files_statistics()
+        )
+    assert files_statistics['model.py'][u'import'] > 0
+    assert files_statistics['model.py'][u'legislation_parsing'] == 0
+    assert files_statistics['param_root.xml'][u'legislation_parsing'] > 0
+    assert statistics.files_stack == []
+
+
+def test_table():
+    statistics = startup_statistics.enable()
+    try:
+        DummyTaxBenefitSystem()
+    finally:
+        startup_statistics.disable()
+    lines = statistics.to_table(count = 1).splitlines()
+    assert len(lines) == len(startup_statistics.PHASES) + 3
+    assert lines[-1].endswith(u'model.py')  # Slowest file
@@ -1,13 +1,24 @@
 # -*- coding: utf-8 -*-
 
+import gc
+import hashlib
+import logging
 import pkg_resources
 import os
+import shutil
 import subprocess
-from nose.tools import nottest, raises
+import tempfile
+import weakref
+from nose.tools import nottest, raises, with_setup
 
-from openfisca_core.tools.test_runner import run_tests, generate_tests
+from openfisca_core import periods, scenarios
+from openfisca_core.columns import FloatCol
+from openfisca_core.tools import test_runner
+from openfisca_core.tools.test_runner import run_tests, run_tests_in_parallel, generate_tests
+from openfisca_core.variables import Variable
 
 from openfisca_dummy_country import DummyTaxBenefitSystem
+from openfisca_dummy_country.entities import Individu
 
 tax_benefit_system = DummyTaxBenefitSystem()
 
@@ -17,6 +28,7 @@ yamls_tests_dir = os.path.join(openfisca_dummy_country_dir, 'openfisca_dummy_cou
 # Declare that these two functions are not tests to run with nose
 nottest(run_tests)
 nottest(generate_tests)
+nottest(run_tests_in_parallel)
 
 
 @nottest
@@ -57,10 +69,277 @@ def test_run_tests_from_directory():
     assert run_tests(tax_benefit_system, dir_path) == 5
 
 
+def test_run_tests_in_batches():
+    dir_path = os.path.join(yamls_tests_dir, 'directory')
+    assert run_tests(tax_benefit_system, dir_path, options = {'batch': True}) == 5
+    tests = [
+        test
+        for yaml_path in test_runner._list_yaml_files(dir_path)
+        for _, _, test in test_runner._iter_selected_tests(tax_benefit_system, yaml_path, {})
+        ]
+    assert len(test_runner._run_batches(tests)) == 5
+
+
+def test_run_test_cases_in_batches():
+    def make_test(salaires_bruts, salaires_nets):
+        test, error = scenarios.make_json_or_python_to_test(tax_benefit_system)(dict(
+            period = '2015-01',
+            individus = [
+                dict(id = index, salaire_brut = salaire_brut)
+                for index, salaire_brut in enumerate(salaires_bruts)
+                ],
+            familles = [dict(parents = range(len(salaires_bruts)))],
+            output_variables = dict(salaire_net = salaires_nets),
+            ))
+        assert error is None, error
+        return test
+
+    tests = [make_test([1000, 2000], [800, 1600]), make_test([500], [400]), make_test([100, 100], [80, 0])]
+    passed_tests_id = test_runner._run_batches(tests)
+    assert passed_tests_id == set(id(test) for test in tests[:2])
+
+
+class checked_salaire(Variable):
+    column = FloatCol
+    entity = Individu
+    definition_period = periods.MONTH
+
+    def function(individu, period):
+        salaire_brut = individu('salaire_brut', period)
+        if (salaire_brut < 0).any():
+            raise ValueError('Negative salaire_brut')
+        return salaire_brut
+
+
+class BatchLogHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_failing_batch_is_run_individually():
+    checked_tax_benefit_system = DummyTaxBenefitSystem()
+    checked_tax_benefit_system.add_variable(checked_salaire)
+
+    def make_test(salaire_brut):
+        test, error = scenarios.make_json_or_python_to_test(checked_tax_benefit_system)(dict(
+            period = '2015-01',
+            individus = [dict(id = 0, salaire_brut = salaire_brut)],
+            familles = [dict(parents = [0])],
+            output_variables = dict(checked_salaire = salaire_brut),
+            ))
+        assert error is None, error
+        return test
+
+    tests = [make_test(1000), make_test(-1)]
+    handler = BatchLogHandler()
+    test_runner.log.addHandler(handler)
+    try:
+        # The error raised for the second test makes the whole batch fail.
+        assert test_runner._run_batches(tests, verbose = True) == set()
+    finally:
+        test_runner.log.removeHandler(handler)
+    assert len(handler.records) == 1
+    assert handler.records[0].exc_info[0] is ValueError
+
+    test_runner._run_test('2015-01', tests[0])
+    try:
+        test_runner._run_test('2015-01', tests[1])
+    except ValueError:
+        pass
+    else:
+        assert False, 'The error of the test is not reported when it is run individually'
+
+
+class persons_count(Variable):
+    column = FloatCol
+    entity = Individu
+    definition_period = periods.MONTH
+
+    def function(individu, period):
+        # Depends on the whole population, which is not the same in a batch.
+        return individu.empty_array() + individu.count
+
+
+def test_batch_passing_only_on_the_stacked_population():
+    counting_tax_benefit_system = DummyTaxBenefitSystem()
+    counting_tax_benefit_system.add_variable(persons_count)
+
+    def make_test():
+        test, error = scenarios.make_json_or_python_to_test(counting_tax_benefit_system)(dict(
+            period = '2015-01',
+            individus = [dict(id = 0, salaire_brut = 1000)],
+            familles = [dict(parents = [0])],
+            output_variables = dict(persons_count = 2),
+            ))
+        assert error is None, error
+        return test
+
+    tests = [make_test(), make_test()]
+    # Both tests would pass in their batch of 2 persons.
+    assert test_runner._run_batches(tests) == set()
+
+
+@raises(AssertionError)
+def test_run_tests_in_batches_fail():
+    run_tests(tax_benefit_system, yamls_tests_dir, options = {'batch': True})
+
+
+def test_timings():
+    dir_path = os.path.join(yamls_tests_dir, 'directory')
+    timings = test_runner.TestTimings()
+    run_tests(tax_benefit_system, dir_path, options = {'timings': timings})
+    tests_timings = timings.get_tests_timings()
+    assert len(tests_timings) == 5
+    assert tests_timings[0]['total'] >= tests_timings[-1]['total']
+    assert tests_timings[0]['total'] > 0
+    assert sum(file_timings['tests_count'] for file_timings in timings.get_files_timings()) == 5
+    assert len(timings.to_table(count = 2).splitlines()) == 6
+
+    parallel_timings = test_runner.TestTimings()
+    run_tests_in_parallel(tax_benefit_system, [dir_path], options = {'timings': parallel_timings}, processes = 2)
+    assert len(parallel_timings.get_tests_timings()) == 5
+    assert len(parallel_timings.get_files_timings()) == 3
+
+
+def test_dependencies():
+    dir_path = os.path.join(yamls_tests_dir, 'directory')
+    dependencies = test_runner.TestDependencies()
+    options = {'dependencies': dependencies, 'record_dependencies': True}
+    run_tests(tax_benefit_system, dir_path, options = options)
+    tests_dependencies = dependencies.to_json()['tests']
+    assert len(tests_dependencies) == 5
+    assert all('salaire_net' in test_dependencies['variables'] for test_dependencies in tests_dependencies)
+
+    assert run_tests(tax_benefit_system, dir_path, options = {'dependencies': dependencies, 'changed': [u'salaire_net']}) == 5
+    assert run_tests(tax_benefit_system, dir_path, options = {'dependencies': dependencies, 'changed': [u'rsa']}) == 0
+    # Tests which have not been recorded are always run.
+    yaml_path = os.path.join(yamls_tests_dir, 'test_success.yaml')
+    assert run_tests(tax_benefit_system, yaml_path, options = {'dependencies': dependencies, 'changed': [u'rsa']}) == 1
+
+    parallel_dependencies = test_runner.TestDependencies()
+    options = {'dependencies': parallel_dependencies, 'record_dependencies': True}
+    run_tests_in_parallel(tax_benefit_system, [dir_path], options = options, processes = 2)
+    assert sorted(parallel_dependencies.to_json()['tests']) == sorted(tests_dependencies)
+
+
+def test_dependencies_of_parameters():
+    dependencies = test_runner.TestDependencies()
+    dependencies.update_from_json({'tests': [
+        {'file': 'test.yaml', 'index': 1, 'title': u'test', 'variables': [u'impot'],
+            'parameters': [u'impot.taux', u'bareme']},
+        {'file': 'test.yaml', 'index': 2, 'title': u'test', 'variables': [u'rsa'], 'parameters': []},
+        ]})
+    assert dependencies.is_affected('test.yaml', 1, 'test', [u'impot'])
+    assert dependencies.is_affected('test.yaml', 1, 'test', [u'impot.taux'])
+    assert dependencies.is_affected('test.yaml', 1, 'test', [u'bareme.0.rate'])
+    assert not dependencies.is_affected('test.yaml', 1, 'test', [u'impot.taux_reduit', u'rsa'])
+    assert dependencies.is_affected('test.yaml', 1, 'other test', [u'rsa'])
+    # Tests with the same title are told apart by their index in the file.
+    assert dependencies.is_affected('test.yaml', 2, 'test', [u'impot.taux_reduit', u'rsa'])
+
+
+def test_dependencies_relative_to_root_dir():
+    dir_path = os.path.join(yamls_tests_dir, 'directory')
+    dependencies = test_runner.TestDependencies(root_dir = yamls_tests_dir)
+    run_tests(tax_benefit_system, dir_path, options = {'dependencies': dependencies, 'record_dependencies': True})
+    tests_dependencies = dependencies.to_json()['tests']
+    assert all(not os.path.isabs(test_dependencies['file']) for test_dependencies in tests_dependencies)
+    assert all(test_dependencies['file'].startswith('directory') for test_dependencies in tests_dependencies)
+
+    # The index is used in another checkout.
+    checkout_dir = tempfile.mkdtemp()
+    try:
+        shutil.copytree(dir_path, os.path.join(checkout_dir, 'directory'))
+        checkout_dependencies = test_runner.TestDependencies(root_dir = checkout_dir)
+        checkout_dependencies.update_from_json(dependencies.to_json())
+        assert run_tests(tax_benefit_system, os.path.join(checkout_dir, 'directory'),
+            options = {'dependencies': checkout_dependencies, 'changed': [u'rsa']}) == 0
+    finally:
+        shutil.rmtree(checkout_dir)
+
+
+cache_dir = None
+
+
+def setup_cache_dir():
+    global cache_dir
+    cache_dir = tempfile.mkdtemp()
+
+
+def remove_cache_dir():
+    shutil.rmtree(cache_dir)
+
+
+@with_setup(setup_cache_dir, remove_cache_dir)
+def test_parsed_tests_cache():
+    paths = [os.path.join(yamls_tests_dir, 'directory'), os.path.join(yamls_tests_dir, 'test_with_reform.yaml')]
+    for path in paths:
+        assert run_tests(tax_benefit_system, path, options = {'cache_dir': cache_dir}) > 0
+    cache_files_name = sorted(os.listdir(cache_dir))
+    assert len(cache_files_name) == 4
+
+    # Cached tests are run again, with the tax and benefit system of their reforms.
+    for path in paths:
+        assert run_tests(tax_benefit_system, path, options = {'cache_dir': cache_dir}) > 0
+    assert sorted(os.listdir(cache_dir)) == cache_files_name
+    reform_yaml_path = os.path.join(yamls_tests_dir, 'test_with_reform.yaml')
+    with open(reform_yaml_path) as yaml_file:
+        cache_path = os.path.join(cache_dir, '{}.pickle'.format(hashlib.sha1(yaml_file.read()).hexdigest()))
+    tests = test_runner._load_cached_tests(tax_benefit_system, cache_path)
+    assert len(tests) == 2
+    assert all(test['scenario'].tax_benefit_system.reference is not None for test in tests)
+
+    # Tests are converted again when the tax and benefit system changes.
+    assert test_runner._load_cached_tests(DummyTaxBenefitSystem(), cache_path) is not None
+    other_tax_benefit_system = DummyTaxBenefitSystem()
+    other_tax_benefit_system.column_by_name = dict(tax_benefit_system.column_by_name)
+    del other_tax_benefit_system.column_by_name['birth']
+    assert test_runner._load_cached_tests(other_tax_benefit_system, cache_path) is None
+
+
+def test_run_tests_in_parallel():
+    dir_path = os.path.join(yamls_tests_dir, 'directory')
+    assert run_tests_in_parallel(tax_benefit_system, [dir_path], processes = 2) == 5
+
+
+@raises(AssertionError)
+def test_run_tests_in_parallel_fail():
+    paths = [os.path.join(yamls_tests_dir, '{}.yaml'.format(file_name)) for file_name in ['test_success', 'test_failure']]
+    run_tests_in_parallel(tax_benefit_system, paths, processes = 2)
+
+
 def test_with_reform():
     run_yaml_test('test_with_reform')
 
 
+def test_reformed_tax_benefit_systems_are_cached():
+    reforms = [
+        'openfisca_dummy_country.dummy_reforms.neutralization_rsa',
+        'openfisca_dummy_country.dummy_reforms.remove_social_cotisations',
+        ]
+    reformed_tax_benefit_systems = {}
+    reformed_tax_benefit_system = test_runner._get_reformed_tax_benefit_system(tax_benefit_system, reforms,
+        reformed_tax_benefit_systems)
+    assert test_runner._get_reformed_tax_benefit_system(tax_benefit_system, reforms, reformed_tax_benefit_systems) \
+        is reformed_tax_benefit_system
+    assert test_runner._get_reformed_tax_benefit_system(tax_benefit_system, reforms[:1],
+        reformed_tax_benefit_systems) is reformed_tax_benefit_system.reference
+
+
+def test_reformed_tax_benefit_systems_are_dropped_after_the_run():
+    run_tax_benefit_system = DummyTaxBenefitSystem()
+    yaml_path = os.path.join(yamls_tests_dir, 'test_with_reform.yaml')
+    assert run_tests(run_tax_benefit_system, yaml_path) > 0
+    tax_benefit_system_reference = weakref.ref(run_tax_benefit_system)
+    del run_tax_benefit_system
+    gc.collect()
+    assert tax_benefit_system_reference() is None
+
+
 @raises(AssertionError)
 def test_run_tests_from_directory_fail():
     run_tests(tax_benefit_system, yamls_tests_dir)
@@ -101,3 +380,10 @@ def test_shell_script_with_extension():
     command = ['openfisca-run-test', extension_dir, '-c', 'openfisca_dummy_country', '-e', extension_dir]
     with open(os.devnull, 'wb') as devnull:
         subprocess.check_call(command, stdout = devnull)
+
+
+def test_shell_script_with_jobs():
+    dir_path = os.path.join(yamls_tests_dir, 'directory')
+    command = ['openfisca-run-test', dir_path, '-c', 'openfisca_dummy_country', '-j', '2']
+    with open(os.devnull, 'wb') as devnull:
+        subprocess.check_call(command, stdout = devnull)